@@ -1,7 +1,26 @@
 from django.contrib import admin
+from django.db.models import F
+
 from .models import *
 # Register your models here.
 
+
+class UserBankAccountAdmin(admin.ModelAdmin):
+    # Kept by the posting engine together with the journal (transactions.services, transactions.journal)
+    readonly_fields = [
+        'balance', 'active_loans', 'pending_loans', 'loan_principal', 'version', 'archived_until',
+        'interest_accrued_through',
+    ]
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # The account's pages use its version in their ETags.
+            obj.version = F('version') + 1
+        super().save_model(request, obj, form, change)
+        if change:
+            obj.refresh_from_db(fields=['version'])
+
+
 admin.site.register(Bank)
-admin.site.register(UserBankAccount)
-admin.site.register(UserAddress)
\ No newline at end of file
+admin.site.register(UserBankAccount, UserBankAccountAdmin)
+admin.site.register(UserAddress)
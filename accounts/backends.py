@@ -0,0 +1,31 @@
+"""
+Authentication backend that loads a customer's identity in one query.
+
+``AuthenticationMiddleware`` asks the session's backend for ``request.user``
+once per request. This backend fetches the user together with the bank
+account, its bank and the address, so views, forms and templates reading
+``request.user.account``, ``request.user.account.bank`` or
+``request.user.address`` share that one row instead of querying each.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+IDENTITY_RELATED = ('account__bank', 'address')
+
+
+class IdentityBackend(ModelBackend):
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related(*IDENTITY_RELATED).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = await UserModel._default_manager.select_related(*IDENTITY_RELATED).aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
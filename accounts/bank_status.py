@@ -0,0 +1,32 @@
+"""
+Process-local cache of each bank's bankruptcy flag.
+
+Money-moving views check the flag on every request, so it is cached per
+``Bank`` row for ``BANK_STATUS_TTL`` seconds. Saving or deleting a ``Bank``
+clears the entry in this process straight away (see ``accounts.signals``);
+other processes pick the change up once their entry expires.
+"""
+import time
+
+from django.conf import settings
+
+from .models import Bank
+
+_statuses = {}
+
+
+def is_bankrupt(bank_id):
+    now = time.monotonic()
+    cached = _statuses.get(bank_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    bankrupt = Bank.objects.filter(pk=bank_id, is_bankrupt=True).exists()
+    _statuses[bank_id] = (bankrupt, now + getattr(settings, 'BANK_STATUS_TTL', 5))
+    return bankrupt
+
+
+def invalidate(bank_id=None):
+    if bank_id is None:
+        _statuses.clear()
+    else:
+        _statuses.pop(bank_id, None)
@@ -3,7 +3,10 @@ from django.contrib.auth.forms import UserCreationForm,PasswordChangeForm
 from django import forms
 from .constants import ACCOUNT_TYPE, GENDER_TYPE
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
 from .models import UserBankAccount, UserAddress
+from .numbers import reserve
 
 class UserRegistrationForm(UserCreationForm):
     birth_date = forms.DateField(widget=forms.DateInput(attrs={'type':'date'}))
@@ -20,29 +23,30 @@ class UserRegistrationForm(UserCreationForm):
     def save(self, commit=True):
         our_user = super().save(commit=False) 
         if commit == True:
-            our_user.save() 
-            account_type = self.cleaned_data.get('account_type')
-            gender = self.cleaned_data.get('gender')
-            postal_code = self.cleaned_data.get('postal_code')
-            country = self.cleaned_data.get('country')
-            birth_date = self.cleaned_data.get('birth_date')
-            city = self.cleaned_data.get('city')
-            street_address = self.cleaned_data.get('street_address')
+            with transaction.atomic():
+                our_user.save() 
+                account_type = self.cleaned_data.get('account_type')
+                gender = self.cleaned_data.get('gender')
+                postal_code = self.cleaned_data.get('postal_code')
+                country = self.cleaned_data.get('country')
+                birth_date = self.cleaned_data.get('birth_date')
+                city = self.cleaned_data.get('city')
+                street_address = self.cleaned_data.get('street_address')
             
-            UserAddress.objects.create(
-                user = our_user,
-                postal_code = postal_code,
-                country = country,
-                city = city,
-                street_address = street_address
-            )
-            UserBankAccount.objects.create(
-                user = our_user,
-                account_type  = account_type,
-                gender = gender,
-                birth_date =birth_date,
-                account_no = 100000+ our_user.id
-            )
+                UserAddress.objects.create(
+                    user = our_user,
+                    postal_code = postal_code,
+                    country = country,
+                    city = city,
+                    street_address = street_address
+                )
+                UserBankAccount.objects.create(
+                    user = our_user,
+                    account_type  = account_type,
+                    gender = gender,
+                    birth_date =birth_date,
+                    account_no = reserve()[0]
+                )
         return our_user
     
     def __init__(self, *args, **kwargs):
@@ -108,13 +112,20 @@ class UserUpdateForm(forms.ModelForm):
         if commit:
             user.save()
 
-            user_account, created = UserBankAccount.objects.get_or_create(user=user)
-            user_address, created = UserAddress.objects.get_or_create(user=user) 
+            # The request's user already carries both (accounts.backends); only profile fields are written,
+            # so a balance loaded at the start of the request is never saved back.
+            user_account = getattr(user, 'account', None) or UserBankAccount.objects.get_or_create(user=user)[0]
+            user_address = getattr(user, 'address', None) or UserAddress.objects.get_or_create(user=user)[0]
 
             user_account.account_type = self.cleaned_data['account_type']
             user_account.gender = self.cleaned_data['gender']
             user_account.birth_date = self.cleaned_data['birth_date']
-            user_account.save()
+            UserBankAccount.objects.filter(pk=user_account.pk).update(
+                account_type=user_account.account_type,
+                gender=user_account.gender,
+                birth_date=user_account.birth_date,
+                version=F('version') + 1,
+            )
 
             user_address.street_address = self.cleaned_data['street_address']
             user_address.city = self.cleaned_data['city']
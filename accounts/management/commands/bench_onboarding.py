@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from accounts.forms import UserRegistrationForm
+from accounts.onboarding import Onboarding
+
+
+def customer(prefix, i):
+    return {
+        'username': f'{prefix}-{i}',
+        'password': f'Payroll-{i}-secret',
+        'first_name': 'Bench',
+        'last_name': f'Customer {i}',
+        'email': f'{prefix}-{i}@example.com',
+        'account_type': 'Current',
+        'birth_date': '1990-01-01',
+        'gender': 'Female',
+        'street_address': f'{i} Bench Street',
+        'city': 'Dhaka',
+        'postal_code': '1200',
+        'country': 'Bangladesh',
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare customer onboarding through UserRegistrationForm against bulk onboarding.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=2000, help='Customers onboarded in bulk.')
+        parser.add_argument('--form-customers', type=int, default=100, help='Customers registered one form at a time.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, help='Password hashing processes, defaults to the CPU count.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark customers afterwards.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        for i in range(options['form_customers']):
+            data = customer('bench-form', i)
+            form = UserRegistrationForm({**data, 'password1': data['password'], 'password2': data['password']})
+            form.is_valid()
+            form.save()
+        form_rate = options['form_customers'] / (time.perf_counter() - started)
+        self.stdout.write(f'{"per form":<10} {form_rate:10,.1f} customers/s')
+
+        onboarding = Onboarding(batch_size=options['batch_size'], workers=options['workers'])
+        started = time.perf_counter()
+        onboarding.run((i, customer('bench-bulk', i)) for i in range(options['customers']))
+        bulk_rate = options['customers'] / (time.perf_counter() - started)
+        self.stdout.write(f'{"bulk":<10} {bulk_rate:10,.1f} customers/s ({onboarding.workers} hashing processes)')
+        self.stdout.write(f'speed-up   {bulk_rate / form_rate:10.1f}x')
+
+        if not options['keep']:
+            User.objects.filter(username__regex=r'^bench-(form|bulk)-').delete()
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.onboarding import FIELDS, InvalidCustomer, Onboarding, read_customers
+
+
+class Command(BaseCommand):
+    help = f'Create customers with their address and bank account from a CSV file with the columns {", ".join(FIELDS)}.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, help='Password hashing processes, defaults to the CPU count.')
+        parser.add_argument('--skip-invalid', action='store_true', help='Report and skip invalid rows instead of stopping.')
+
+    def handle(self, *args, **options):
+        onboarding = Onboarding(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            skip_invalid=options['skip_invalid'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        started = time.perf_counter()
+        try:
+            created = onboarding.run(read_customers(options['path']))
+        except InvalidCustomer as exc:
+            raise CommandError(f'{exc} ({onboarding.created} customers before it were created)')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'created {created} customers, skipped {onboarding.skipped}')
+        self.stdout.write(f'{created / elapsed if elapsed else 0:,.1f} customers/s')
@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-16 22:58
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_counter(apps, schema_editor):
+    UserBankAccount = apps.get_model('accounts', 'UserBankAccount')
+    AccountNumberCounter = apps.get_model('accounts', 'AccountNumberCounter')
+    highest = UserBankAccount.objects.aggregate(highest=Max('account_no'))['highest'] or 100000
+    AccountNumberCounter.objects.create(next_account_no=highest + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_bank_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_account_no', models.IntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0 on 2026-10-16 23:11
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+LOAN = 3
+
+
+def fill_loan_counters(apps, schema_editor):
+    UserBankAccount = apps.get_model('accounts', 'UserBankAccount')
+    Transaction = apps.get_model('transactions', 'Transaction')
+    counters = (
+        Transaction.objects.filter(transaction_type=LOAN).order_by().values('account')
+        .annotate(
+            active=Count('pk', filter=Q(loan_approve=True)),
+            pending=Count('pk', filter=Q(loan_approve=False)),
+            principal=Sum('amount', filter=Q(loan_approve=True)),
+        )
+    )
+    for row in counters:
+        UserBankAccount.objects.filter(pk=row['account']).update(
+            active_loans=row['active'], pending_loans=row['pending'], loan_principal=row['principal'] or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_account_number_counter'),
+        ('transactions', '0006_ledgerimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='active_loans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='loan_principal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='pending_loans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_loan_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_loan_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
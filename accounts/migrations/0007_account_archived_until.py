@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-16 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_account_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
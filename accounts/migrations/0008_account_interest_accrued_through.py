@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-16 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_account_archived_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='interest_accrued_through',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -18,6 +18,16 @@ class UserBankAccount(models.Model):
     gender = models.CharField(max_length=10, choices=GENDER_TYPE)
     initial_deposit_date = models.DateField(auto_now_add=True)
     balance = models.DecimalField(default=0, max_digits=12, decimal_places=2)
+    # Kept by transactions.services on every loan posting; rebuilt by reconcile_loan_counters
+    active_loans = models.PositiveIntegerField(default=0)
+    pending_loans = models.PositiveIntegerField(default=0)
+    loan_principal = models.DecimalField(default=0, max_digits=12, decimal_places=2)
+    # Bumped by every change shown on the account's pages; part of their ETags
+    version = models.PositiveBigIntegerField(default=0)
+    # Transactions before this moved to the account's archive file (transactions.archive)
+    archived_until = models.DateTimeField(null=True, blank=True)
+    # Last business date transactions.interest credited interest for
+    interest_accrued_through = models.DateField(null=True, blank=True)
 
     def __str__(self):
         return str(self.account_no)
@@ -30,4 +40,7 @@ class UserAddress(models.Model):
     country = models.CharField(max_length=100)
 
     def __str__(self):
-        return str(self.user.email)
\ No newline at end of file
+        return str(self.user.email)
+class AccountNumberCounter(models.Model):
+    """Next free account number, handed out in blocks by ``accounts.numbers``."""
+    next_account_no = models.IntegerField()
@@ -0,0 +1,25 @@
+"""
+Account number allocation.
+
+Account numbers used to be ``100000 + user.id``, which needs the user row
+before the account row can be built. ``reserve`` instead hands out a block of
+consecutive numbers from the single ``AccountNumberCounter`` row with one
+locked UPDATE. The block belongs to the caller's transaction: if it rolls back
+the counter rolls back with it, so numbers are never handed out twice.
+"""
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import AccountNumberCounter, UserBankAccount
+
+
+def reserve(count=1):
+    """Reserve ``count`` account numbers and return them as a ``range``."""
+    with transaction.atomic():
+        counter = AccountNumberCounter.objects.select_for_update().filter(pk=1).first()
+        if counter is None:
+            # Created by migration; only missing after the table was flushed.
+            highest = UserBankAccount.objects.aggregate(highest=Max('account_no'))['highest'] or 100000
+            counter = AccountNumberCounter.objects.create(pk=1, next_account_no=highest + 1)
+        AccountNumberCounter.objects.filter(pk=counter.pk).update(next_account_no=F('next_account_no') + count)
+    return range(counter.next_account_no, counter.next_account_no + count)
@@ -0,0 +1,179 @@
+"""
+Bulk customer onboarding.
+
+``Onboarding`` creates the ``User``, ``UserAddress`` and ``UserBankAccount``
+rows of many customers with one ``bulk_create`` per table and batch, instead
+of the three INSERTs per customer of ``UserRegistrationForm.save``. PBKDF2
+dominates the cost, so passwords are hashed in a process pool, and account
+numbers come from ``accounts.numbers.reserve`` one block per batch.
+"""
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django import forms
+from django.contrib.auth import password_validation
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .constants import ACCOUNT_TYPE, GENDER_TYPE
+from .models import UserAddress, UserBankAccount
+from .numbers import reserve
+
+FIELDS = [
+    'username', 'password', 'first_name', 'last_name', 'email', 'account_type', 'birth_date', 'gender',
+    'street_address', 'city', 'postal_code', 'country',
+]
+
+
+class InvalidCustomer(Exception):
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+
+
+class CustomerForm(forms.Form):
+    """The fields of ``UserRegistrationForm`` with a single password."""
+    username = forms.RegexField(regex=r'^[\w.@+-]+\Z', max_length=150)
+    password = forms.CharField()
+    first_name = forms.CharField(max_length=150, required=False)
+    last_name = forms.CharField(max_length=150, required=False)
+    email = forms.EmailField(required=False)
+    account_type = forms.ChoiceField(choices=ACCOUNT_TYPE)
+    birth_date = forms.DateField(required=False)
+    gender = forms.ChoiceField(choices=GENDER_TYPE)
+    street_address = forms.CharField(max_length=100)
+    city = forms.CharField(max_length=100)
+    postal_code = forms.IntegerField()
+    country = forms.CharField(max_length=100)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if 'username' in cleaned_data and 'password' in cleaned_data:
+            user = User(username=cleaned_data['username'], email=cleaned_data.get('email', ''),
+                        first_name=cleaned_data.get('first_name', ''), last_name=cleaned_data.get('last_name', ''))
+            try:
+                password_validation.validate_password(cleaned_data['password'], user)
+            except ValidationError as error:
+                self.add_error('password', error)
+        return cleaned_data
+
+
+def read_customers(path):
+    """Yield ``(line, row)`` for each customer of a CSV file with a header of ``FIELDS``."""
+    with open(path, newline='') as source:
+        for line, row in enumerate(csv.DictReader(source), start=2):
+            yield line, row
+
+
+def _setup_worker():
+    # Needed when the pool spawns fresh interpreters instead of forking.
+    django.setup()
+
+
+class Onboarding:
+    def __init__(self, batch_size=1000, workers=None, skip_invalid=False, log=None):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count()
+        self.skip_invalid = skip_invalid
+        self.log = log or (lambda message: None)
+        self.skipped = 0
+        self.created = 0
+
+    def run(self, rows):
+        rows = iter(rows)
+        pool = ProcessPoolExecutor(self.workers, initializer=_setup_worker) if self.workers > 1 else None
+        try:
+            while True:
+                batch = self.clean(list(islice(rows, self.batch_size)))
+                if batch is None:
+                    break
+                if not batch:
+                    continue
+                passwords = [customer.pop('password') for _, customer in batch]
+                if pool:
+                    chunksize = max(1, len(passwords) // (self.workers * 4))
+                    hashes = list(pool.map(make_password, passwords, chunksize=chunksize))
+                else:
+                    hashes = [make_password(password) for password in passwords]
+                self.create(batch, hashes)
+        finally:
+            if pool:
+                pool.shutdown()
+        return self.created
+
+    def reject(self, exc):
+        if not self.skip_invalid:
+            raise exc
+        self.skipped += 1
+        self.log(f'skipped {exc}')
+
+    def clean(self, batch):
+        """Validate a batch and return its ``(line, cleaned_data)`` pairs, or None at the end of input."""
+        if not batch:
+            return None
+        taken = set(User.objects.filter(username__in=[row.get('username') for _, row in batch])
+                    .values_list('username', flat=True))
+        customers = []
+        for line, row in batch:
+            form = CustomerForm(row)
+            try:
+                if not form.is_valid():
+                    field, errors = next(iter(form.errors.items()))
+                    raise InvalidCustomer(line, f'{field}: {" ".join(errors)}')
+                if form.cleaned_data['username'] in taken:
+                    raise InvalidCustomer(line, f'username {form.cleaned_data["username"]} already exists')
+            except InvalidCustomer as exc:
+                self.reject(exc)
+                continue
+            taken.add(form.cleaned_data['username'])
+            customers.append((line, form.cleaned_data))
+        return customers
+
+    def create(self, batch, hashes):
+        now = timezone.now()
+        with transaction.atomic():
+            numbers = reserve(len(batch))
+            users = User.objects.bulk_create([
+                User(
+                    username=customer['username'],
+                    password=password,
+                    first_name=customer['first_name'],
+                    last_name=customer['last_name'],
+                    email=customer['email'],
+                    date_joined=now,
+                )
+                for (_, customer), password in zip(batch, hashes)
+            ])
+            if not connection.features.can_return_rows_from_bulk_insert:
+                ids = dict(User.objects.filter(username__in=[user.username for user in users])
+                           .values_list('username', 'pk'))
+                for user in users:
+                    user.pk = ids[user.username]
+            UserAddress.objects.bulk_create([
+                UserAddress(
+                    user=user,
+                    street_address=customer['street_address'],
+                    city=customer['city'],
+                    postal_code=customer['postal_code'],
+                    country=customer['country'],
+                )
+                for (_, customer), user in zip(batch, users)
+            ])
+            UserBankAccount.objects.bulk_create([
+                UserBankAccount(
+                    user=user,
+                    account_type=customer['account_type'],
+                    account_no=account_no,
+                    birth_date=customer['birth_date'],
+                    gender=customer['gender'],
+                )
+                for (_, customer), user, account_no in zip(batch, users, numbers)
+            ])
+        self.created += len(batch)
+        self.log(f'onboarded {self.created} customers (line {batch[-1][0]})')
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bank_status import invalidate
+from .models import Bank
+
+
+@receiver(post_save, sender=Bank)
+@receiver(post_delete, sender=Bank)
+def invalidate_bank_status(sender, instance, **kwargs):
+    invalidate(instance.pk)
@@ -1,3 +1,135 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from transactions.constants import DEPOSIT
+from .bank_status import invalidate, is_bankrupt
+from .forms import UserRegistrationForm
+from .models import Bank, UserAddress, UserBankAccount
+from .onboarding import InvalidCustomer, Onboarding
+
+
+class BankStatusTests(TestCase):
+    def setUp(self):
+        invalidate()
+        self.bank = Bank.objects.create()
+        self.other_bank = Bank.objects.create(is_bankrupt=True)
+
+    def test_warm_check_costs_no_queries(self):
+        is_bankrupt(self.bank.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(is_bankrupt(self.bank.pk))
+
+    def test_status_is_scoped_per_bank(self):
+        self.assertFalse(is_bankrupt(self.bank.pk))
+        self.assertTrue(is_bankrupt(self.other_bank.pk))
+
+    def test_saving_bank_invalidates_cache(self):
+        self.assertFalse(is_bankrupt(self.bank.pk))
+        self.bank.is_bankrupt = True
+        self.bank.save()
+        self.assertTrue(is_bankrupt(self.bank.pk))
+
+    def test_warm_deposit_request_skips_bank_table(self):
+        user = User.objects.create_user('saver', password='secret')
+        UserBankAccount.objects.create(user=user, bank=self.bank, account_type='Savings', account_no=100001)
+        self.client.force_login(user)
+        data = {'amount': '500', 'transaction_type': DEPOSIT}
+        self.client.post(reverse('deposit_money'), data)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('deposit_money'), data)
+        self.assertFalse([q for q in queries if 'FROM "accounts_bank"' in q['sql']])
+        self.assertEqual(UserBankAccount.objects.get(user=user).balance, 1000)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class OnboardingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+
+    def customer(self, i, **fields):
+        return i, {
+            'username': f'payroll-{i}', 'password': f'Vault-{i}-Lantern', 'first_name': 'Pay', 'last_name': 'Roll',
+            'email': f'payroll-{i}@example.com', 'account_type': 'Current', 'birth_date': '1990-01-01',
+            'gender': 'Male', 'street_address': 'Road 1', 'city': 'Dhaka', 'postal_code': '1200',
+            'country': 'Bangladesh', **fields,
+        }
+
+    def test_bulk_onboarding_creates_three_rows_per_customer(self):
+        Onboarding(batch_size=4, workers=2).run(self.customer(i) for i in range(10))
+
+        accounts = UserBankAccount.objects.select_related('user')
+        self.assertEqual(accounts.count(), 10)
+        self.assertEqual(UserAddress.objects.count(), 10)
+        self.assertEqual(len({account.account_no for account in accounts}), 10)
+        user = User.objects.get(username='payroll-7')
+        self.assertTrue(user.check_password('Vault-7-Lantern'))
+
+    def test_form_and_bulk_numbers_do_not_collide(self):
+        Onboarding(workers=1).run([self.customer(1)])
+        data = self.customer(2)[1]
+        form = UserRegistrationForm({**data, 'password1': data['password'], 'password2': data['password']})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        Onboarding(workers=1).run([self.customer(3)])
+        self.assertEqual(len(set(UserBankAccount.objects.values_list('account_no', flat=True))), 3)
+
+    def test_invalid_row_stops_unless_skipped(self):
+        rows = [self.customer(1), self.customer(2, gender='Other'), self.customer(3, username='payroll-1')]
+        with self.assertRaises(InvalidCustomer):
+            Onboarding(workers=1).run(rows)
+        self.assertFalse(User.objects.exists())
+
+        onboarding = Onboarding(workers=1, skip_invalid=True)
+        self.assertEqual(onboarding.run(rows), 1)
+        self.assertEqual(onboarding.skipped, 2)
+
+
+IDENTITY_TABLES = ('"auth_user"', '"accounts_userbankaccount"', '"accounts_useraddress"', '"accounts_bank"')
+
+
+class IdentityQueryTests(TestCase):
+    """Every page reads the customer's user, account, bank and address in one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        cls.user = User.objects.create_user('identity', 'identity@example.com', 'Vault-Lantern-9')
+        UserBankAccount.objects.create(user=cls.user, bank_id=1, account_no=420001, account_type='Current',
+                                       gender='Male', balance=5000)
+        UserAddress.objects.create(user=cls.user, street_address='1 Road', city='Dhaka', postal_code=1200,
+                                   country='Bangladesh')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def identity_queries(self, method, name, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(reverse(name), data)
+        self.assertLess(response.status_code, 400)
+        return [
+            q['sql'] for q in queries
+            if q['sql'].startswith('SELECT') and q['sql'].split(' FROM ', 1)[1].startswith(IDENTITY_TABLES)
+        ]
+
+    def test_pages_load_the_identity_once(self):
+        for name in ('home', 'profile', 'deposit_money', 'withdraw_money', 'loan_request', 'transfer_money',
+                     'transaction_report', 'loan_list', 'api_balance', 'api_transactions'):
+            with self.subTest(name):
+                [identity] = self.identity_queries('get', name)
+                self.assertIn('"accounts_bank"', identity)
+                self.assertIn('"accounts_useraddress"', identity)
+
+    def test_profile_update_writes_only_profile_fields(self):
+        data = {
+            'first_name': 'Ida', 'last_name': 'Entity', 'email': 'identity@example.com', 'account_type': 'Savings',
+            'gender': 'Female', 'birth_date': '1990-01-01', 'street_address': '2 Road', 'city': 'Dhaka',
+            'postal_code': '1200', 'country': 'Bangladesh',
+        }
+        self.assertEqual(len(self.identity_queries('post', 'profile', data)), 1)
+        account = UserBankAccount.objects.select_related('user__address').get(user=self.user)
+        self.assertEqual((account.account_type, account.user.address.street_address), ('Savings', '2 Road'))
@@ -9,17 +9,13 @@ from django.urls import reverse_lazy
 from django.contrib.auth.views import LoginView, LogoutView
 from django.views import View
 from django.shortcuts import redirect
-from django.core.mail import EmailMessage, EmailMultiAlternatives
-from django.template.loader import render_to_string
+from core.outbox import queue_email
 # from transactions.views import 
 
 def send_transaction_email(user, subject, template):
-    message = render_to_string(template, {
+    queue_email(user.email, subject, template, {
         'user' : user,
     })
-    send_email = EmailMultiAlternatives(subject, '', to=[user.email])
-    send_email.attach_alternative(message, "text/html")
-    send_email.send()
 
 
 class UserRegistrationView(FormView):
@@ -62,6 +58,7 @@ def user_logout(request):
 
 class UserBankAccountUpdateView(View):
     template_name = 'accounts/profile.html'
+    query_budget = 9
 
     def get(self, request):
         form = UserUpdateForm(instance=request.user)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import metrics, profiling, query_budget
+        connection_created.connect(metrics.instrument_connection, dispatch_uid='core.metrics')
+        connection_created.connect(query_budget.instrument_connection, dispatch_uid='core.query_budget')
+        connection_created.connect(profiling.instrument_connection, dispatch_uid='core.profiling')
@@ -0,0 +1,124 @@
+"""
+Read replicas with read-your-writes.
+
+``ReplicaRouter`` sends every write to ``default``. Reads go to one of the
+``DATABASE_REPLICAS`` only while ``ReplicaMiddleware`` is handling a GET or
+HEAD request for a read-only view: a view with a ``use_replica`` class
+attribute, a function view wrapped in the ``use_replica`` decorator, or an
+admin changelist. Sessions are always read from the primary.
+
+A client that writes is pinned to the primary for ``REPLICA_PIN_SECONDS``
+with a cookie, so it sees its own changes on the next pages even if the
+replicas lag. Once a request writes, its remaining reads also go to the
+primary. Code outside requests (commands, workers) always uses the primary.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PIN_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD')
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_current = ContextVar('replica_routing', default=None)
+
+
+def use_replica(view):
+    view.use_replica = True
+    return view
+
+
+def reads_from_replica(resolver_match):
+    if resolver_match is None:
+        return False
+    if resolver_match.namespace == 'admin' and resolver_match.url_name.endswith('_changelist'):
+        return True
+    view = resolver_match.func
+    return getattr(getattr(view, 'view_class', view), 'use_replica', False)
+
+
+class Routing:
+    """Where the reads of one request go; decided at its first read after URL resolution."""
+
+    def __init__(self, request, pinned):
+        self.request = request
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+    def db_for_read(self):
+        if self.pinned or self.wrote:
+            return None
+        if self.replica is None:
+            if self.request.resolver_match is None:
+                return None
+            replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+            use = replicas and self.request.method in SAFE_METHODS and reads_from_replica(self.request.resolver_match)
+            self.replica = random.choice(replicas) if use else ''
+        return self.replica or None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _current.get()
+        if routing is None or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return 'default'
+        return routing.db_for_read() or 'default'
+
+    def db_for_write(self, model, **hints):
+        routing = _current.get()
+        if routing is not None:
+            routing.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = self.start(request)
+        token = _current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, routing)
+
+    async def __acall__(self, request):
+        routing = self.start(request)
+        token = _current.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, routing)
+
+    def start(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        return Routing(request, pinned)
+
+    def finish(self, request, response, routing):
+        if routing.wrote or request.method not in SAFE_METHODS:
+            window = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE, str(time.time() + window), max_age=window, httponly=True, samesite='Lax')
+        return response
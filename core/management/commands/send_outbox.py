@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails. Several workers can run side by side.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=8)
+        parser.add_argument('--backoff', type=float, default=30, help='Seconds before the first retry, doubled on every retry.')
+        parser.add_argument('--lease', type=float, default=300, help='Seconds a claimed batch stays hidden from other workers.')
+        parser.add_argument('--poll-interval', type=float, default=5)
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit.')
+
+    def handle(self, *args, **options):
+        backoff = timedelta(seconds=options['backoff'])
+        lease = timedelta(seconds=options['lease'])
+        while True:
+            claimed, sent = drain_outbox(options['batch_size'], options['max_attempts'], backoff, lease)
+            if claimed:
+                self.stdout.write(f'sent {sent} of {claimed} emails')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,278 @@
+"""
+Prometheus metrics in the text exposition format.
+
+Every sample is a float added to a per-process store, keyed by metric,
+labels and bucket. Without ``METRICS_DIR`` the store is a dict. With
+``METRICS_DIR`` each process (for example each gunicorn worker) keeps its
+samples in its own memory-mapped file in that directory, and a scrape sums
+the files of all processes, including workers that have exited, so counters
+never go backwards. Updating a sample takes a process-local lock and writes
+8 bytes. Gauges that reflect database state are computed at scrape time.
+"""
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+_lock = threading.Lock()
+_families = {}
+
+
+class DictStore:
+    def __init__(self):
+        self.values = {}
+
+    def inc(self, key, amount):
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def items(self):
+        return list(self.values.items())
+
+
+class FileStore:
+    """Samples of one process in a memory-mapped file.
+
+    The file starts with the number of bytes in use, followed by entries of a
+    key length, the UTF-8 key padded to 8 bytes and a double. An entry is
+    written before the header grows over it, so readers never see half an
+    entry.
+    """
+
+    def __init__(self, path, size=1 << 16):
+        self.path = path
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size < size:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.positions = {key: position for key, _, position in read_entries(self.map)}
+        self.used = struct.unpack_from('q', self.map, 0)[0] or 8
+
+    def inc(self, key, amount):
+        position = self.positions.get(key)
+        if position is None:
+            position = self.allocate(key)
+        value, = struct.unpack_from('d', self.map, position)
+        struct.pack_into('d', self.map, position, value + amount)
+
+    def allocate(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (-(4 + len(encoded)) % 8)
+        needed = 4 + padded + 8
+        if self.used + needed > len(self.map):
+            self.map.close()
+            self.file.truncate(max(len(self.map) * 2, self.used + needed))
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        struct.pack_into(f'i{padded}sd', self.map, self.used, len(encoded), encoded, 0.0)
+        position = self.used + 4 + padded
+        self.used += needed
+        struct.pack_into('q', self.map, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def items(self):
+        return [(key, value) for key, value, _ in read_entries(self.map)]
+
+
+def read_entries(data):
+    used = struct.unpack_from('q', data, 0)[0] if len(data) >= 8 else 0
+    position = 8
+    while position < used:
+        length, = struct.unpack_from('i', data, position)
+        padded = length + (-(4 + length) % 8)
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        value, = struct.unpack_from('d', data, position + 4 + padded)
+        yield key, value, position + 4 + padded
+        position += 4 + padded + 8
+
+
+_store = None
+_store_owner = None
+
+
+def store():
+    """The store of this process, reopened after a fork or when ``METRICS_DIR`` changes."""
+    global _store, _store_owner
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if _store_owner != (os.getpid(), directory):
+        _store = FileStore(os.path.join(directory, f'{os.getpid()}.metrics')) if directory else DictStore()
+        _store_owner = (os.getpid(), directory)
+    return _store
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels_text(names, values):
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def bound_text(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _families[name] = self
+
+    def key(self, suffix, labels, bound=''):
+        return f'{self.name}\0{suffix}\0{labels_text(self.labelnames, labels)}\0{bound}'
+
+    def render(self, values):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for (suffix, labels, _), value in sorted(values.items()):
+            lines.append(f'{self.name}{suffix}{{{labels}}} {value!r}' if labels else f'{self.name}{suffix} {value!r}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self.key('_total', labels)
+        with _lock:
+            store().inc(key, float(amount))
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, *labels):
+        bound = bound_text(self.buckets[bisect_left(self.buckets, value)])
+        with _lock:
+            target = store()
+            target.inc(self.key('_bucket', labels, bound), 1.0)
+            target.inc(self.key('_sum', labels), value)
+            target.inc(self.key('_count', labels), 1.0)
+
+    def render(self, values):
+        """Buckets are stored per bucket; exposition wants every bucket, cumulative."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labels in sorted({labels for _, labels, _ in values}):
+            prefix = f'{labels},' if labels else ''
+            running = 0.0
+            for bound in self.buckets:
+                running += values.get(('_bucket', labels, bound_text(bound)), 0.0)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound_text(bound)}"}} {running!r}')
+            suffix_labels = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix_labels} {values.get(("_sum", labels, ""), 0.0)!r}')
+            lines.append(f'{self.name}_count{suffix_labels} {values.get(("_count", labels, ""), 0.0)!r}')
+        return lines
+
+
+def collect():
+    """Sum the samples of every process into ``{family: {(suffix, labels, bound): value}}``."""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    totals = {}
+    if directory:
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.metrics'):
+                with open(os.path.join(directory, filename), 'rb') as source:
+                    data = source.read()
+                for key, value, _ in read_entries(data):
+                    totals[key] = totals.get(key, 0.0) + value
+    else:
+        with _lock:
+            totals = dict(store().items())
+    families = {}
+    for key, value in totals.items():
+        family, suffix, labels, bound = key.split('\0')
+        families.setdefault(family, {})[suffix, labels, bound] = value
+    return families
+
+
+def exposition(gauges=()):
+    """Render every family with samples, plus ``(name, documentation, [(labels, value)])`` gauges."""
+    lines = []
+    for name, values in sorted(collect().items()):
+        if name in _families:
+            lines.extend(_families[name].render(values))
+    for name, documentation, samples in gauges:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            text = labels_text(labels.keys(), labels.values())
+            lines.append(f'{name}{{{text}}} {float(value)!r}' if text else f'{name} {float(value)!r}')
+    return '\n'.join(lines) + '\n'
+
+
+request_duration = Histogram('bank_request_duration_seconds', 'Request latency by view.', ['view', 'method'])
+db_duration = Histogram('bank_db_query_duration_seconds', 'Database time by statement kind and table.',
+                        ['operation', 'table'], buckets=DB_BUCKETS)
+email_duration = Histogram('bank_email_send_duration_seconds', 'Time to hand one email to the mail server.')
+email_failures = Counter('bank_email_send_failures', 'Emails the mail server did not accept.')
+transactions = Counter('bank_transactions', 'Committed transactions by type.', ['type'])
+transaction_amount = Counter('bank_transaction_amount', 'Committed transaction amount by type.', ['type'])
+query_budget_exceeded = Counter('bank_query_budget_exceeded', 'Requests that went over their query budget.', ['view'])
+
+
+_operation = re.compile(r'\s*(\w+)')
+_table = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?([\w.]+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def classify(sql):
+    """``(operation, table)`` of a statement, e.g. ``('SELECT', 'transactions_transaction')``."""
+    operation, table = _operation.match(sql), _table.search(sql)
+    return operation.group(1).upper() if operation else 'OTHER', table.group(1) if table else ''
+
+
+def record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db_duration.observe(time.perf_counter() - started, *classify(sql))
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() blocks pop the last wrapper when they exit.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, started)
+        return response
+
+    def observe(self, request, started):
+        view = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        request_duration.observe(time.perf_counter() - started, view, request.method)
@@ -1,3 +1,33 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
-# Create your models here.
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+OUTBOX_STATUS = (
+    (PENDING, 'Pending'),
+    (SENT, 'Sent'),
+    (FAILED, 'Failed'),
+)
+
+
+class OutboxEmail(models.Model):
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    html_body = models.TextField()
+    status = models.CharField(max_length=10, choices=OUTBOX_STATUS, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=Q(status=PENDING), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.to}'
@@ -0,0 +1,107 @@
+"""
+Transactional email outbox.
+
+Views queue mail with ``queue_email`` inside the same DB transaction as the
+change they report on, and the ``send_outbox`` worker delivers it later over
+one reused SMTP connection per batch.
+"""
+import time
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import metrics
+from .models import FAILED, PENDING, SENT, OutboxEmail
+from .profiling import timed
+
+
+def queue_email(to, subject, template, context):
+    if not to:
+        return None
+    with timed('email'):
+        return OutboxEmail.objects.create(
+            to=to,
+            subject=subject,
+            html_body=render_to_string(template, context),
+        )
+
+
+def queue_emails(messages, batch_size=500):
+    """Queue ``(to, subject, template, context)`` messages with one INSERT per batch."""
+    with timed('email'):
+        return OutboxEmail.objects.bulk_create([
+            OutboxEmail(to=to, subject=subject, html_body=render_to_string(template, context))
+            for to, subject, template, context in messages
+            if to
+        ], batch_size=batch_size)
+
+
+def claim_batch(batch_size, lease):
+    """Claim up to ``batch_size`` due emails, hiding them from other workers for ``lease``."""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(next_attempt_at=now + lease)
+    return batch
+
+
+def _fail(email, exc, max_attempts, backoff):
+    """Count a failed attempt at ``email``: retry it after a doubling backoff, or give up."""
+    metrics.email_failures.inc()
+    email.last_error = f'{type(exc).__name__}: {exc}'
+    if email.attempts >= max_attempts:
+        email.status = FAILED
+    else:
+        email.next_attempt_at = timezone.now() + backoff * 2 ** (email.attempts - 1)
+
+
+def _save(email):
+    email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+
+
+def send_batch(batch, max_attempts, backoff):
+    sent = 0
+    connection = get_connection()
+    try:
+        try:
+            connection.open()
+        except Exception as exc:
+            # The mail server is unreachable: every email of the batch spends an attempt and waits.
+            for email in batch:
+                email.attempts += 1
+                _fail(email, exc, max_attempts, backoff)
+                _save(email)
+            return 0
+        for email in batch:
+            message = EmailMultiAlternatives(email.subject, '', to=[email.to], connection=connection)
+            message.attach_alternative(email.html_body, 'text/html')
+            email.attempts += 1
+            started = time.perf_counter()
+            try:
+                message.send()
+            except Exception as exc:
+                _fail(email, exc, max_attempts, backoff)
+            else:
+                metrics.email_duration.observe(time.perf_counter() - started)
+                email.status = SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                sent += 1
+            _save(email)
+    finally:
+        connection.close()
+    return sent
+
+
+def drain_outbox(batch_size=50, max_attempts=8, backoff=timedelta(seconds=30), lease=timedelta(minutes=5)):
+    batch = claim_batch(batch_size, lease)
+    if not batch:
+        return 0, 0
+    return len(batch), send_batch(batch, max_attempts, backoff)
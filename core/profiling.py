@@ -0,0 +1,197 @@
+"""
+On-demand and sampled request profiling.
+
+Staff can add ``?_profile`` or an ``X-Profile`` header to a request to run it
+under cProfile. Independently, ``PROFILER_SAMPLE_RATE`` of all requests get a
+timing breakdown without cProfile. Time is split into exclusive sections:
+``db`` (every query), ``template`` (rendering a TemplateResponse), ``email``
+(``timed('email')`` in ``core.outbox``) and ``view`` for the rest. Results
+go into a bounded per-process ring buffer shown on the admin's request
+profiles page. Requests that are neither flagged nor sampled go straight
+through after a flag check and at most one random number.
+"""
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+
+QUERY_FLAG = '_profile'
+HEADER = 'X-Profile'
+PROFILE_LINES = 60
+
+_current = ContextVar('request_timings', default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_buffer = deque(maxlen=getattr(settings, 'PROFILER_BUFFER_SIZE', 200))
+
+
+class Timings:
+    """Exclusive wall time per section; a nested section pauses the one around it."""
+
+    def __init__(self):
+        self.totals = {}
+        self.stack = ['view']
+        self.queries = 0
+        self.mark = time.perf_counter()
+
+    def enter(self, section):
+        self._charge()
+        self.stack.append(section)
+
+    def exit(self):
+        self._charge()
+        self.stack.pop()
+
+    def finish(self):
+        self._charge()
+
+    def _charge(self):
+        now = time.perf_counter()
+        section = self.stack[-1]
+        self.totals[section] = self.totals.get(section, 0.0) + now - self.mark
+        self.mark = now
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        self.enter('db')
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.exit()
+
+
+def time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # On every connection, including those of sync_to_async threads; the context says which request to charge.
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+@contextmanager
+def timed(section):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    timings.enter(section)
+    try:
+        yield
+    finally:
+        timings.exit()
+
+
+def recent():
+    with _lock:
+        return list(_buffer)
+
+
+def get(profile_id):
+    return next((entry for entry in recent() if entry['id'] == profile_id), None)
+
+
+def clear():
+    with _lock:
+        _buffer.clear()
+
+
+def flagged(request):
+    return QUERY_FLAG in request.GET or HEADER in request.headers
+
+
+def sampled():
+    sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0)
+    return bool(sample_rate) and random.random() < sample_rate
+
+
+class ProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        on_demand = flagged(request) and request.user.is_staff
+        if not on_demand and not sampled():
+            return self.get_response(request)
+        with self.profiling(request, on_demand) as run:
+            run.response = self.get_response(request)
+        return run.response
+
+    async def __acall__(self, request):
+        # cProfile follows the thread, so under ASGI it also sees other requests on the event loop.
+        on_demand = flagged(request) and (await request.auser()).is_staff
+        if not on_demand and not sampled():
+            return await self.get_response(request)
+        with self.profiling(request, on_demand) as run:
+            run.response = await self.get_response(request)
+        return run.response
+
+    @contextmanager
+    def profiling(self, request, on_demand):
+        run = SimpleNamespace(response=None)
+        timings = Timings()
+        profiler = cProfile.Profile() if on_demand else None
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            try:
+                yield run
+            finally:
+                if profiler:
+                    profiler.disable()
+        finally:
+            _current.reset(token)
+        timings.finish()
+        self.record(request, run.response, time.perf_counter() - started, timings, profiler)
+
+    def process_template_response(self, request, response):
+        timings = _current.get()
+        if timings is not None:
+            timings.enter('template')
+            response.add_post_render_callback(lambda rendered: timings.exit())
+        return response
+
+    def record(self, request, response, elapsed, timings, profiler):
+        profile = None
+        if profiler:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            profile = stream.getvalue().strip()
+        entry = {
+            'id': next(_ids),
+            'at': timezone.now(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'url_name': request.resolver_match.view_name if request.resolver_match else None,
+            'status': response.status_code,
+            'total_ms': elapsed * 1000,
+            'sections_ms': {section: seconds * 1000 for section, seconds in sorted(timings.totals.items())},
+            'queries': timings.queries,
+            'profile': profile,
+        }
+        with _lock:
+            _buffer.append(entry)
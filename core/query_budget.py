@@ -0,0 +1,125 @@
+"""
+Per-view SQL query budgets.
+
+``QueryBudgetMiddleware`` counts the queries and database time of every
+request and tags them with the resolved URL name. The counting wrapper sits
+on every database connection from the moment it opens and charges the
+request of the current context, so queries that async views run in
+``sync_to_async`` threads, on those threads' own connections, count too. A
+view declares its budget
+with a ``query_budget`` class attribute, or with the ``query_budget``
+decorator on function views. Going over budget raises ``QueryBudgetExceeded``
+when ``QUERY_BUDGET_STRICT`` is on (tests, and development if set) and
+otherwise logs a warning on the ``core.query_budget`` logger, counts the
+request in ``bank_query_budget_exceeded`` and sends ``budget_exceeded``.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.dispatch import Signal
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# The QueryStats of the request being served in this context, if any
+_stats = ContextVar('query_stats', default=None)
+
+# Sent with url_name, queries, budget and db_time when a request goes over budget outside strict mode.
+budget_exceeded = Signal()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def budget_for(resolver_match):
+    if resolver_match is None:
+        return None
+    view = resolver_match.func
+    return getattr(getattr(view, 'view_class', view), 'query_budget', None)
+
+
+class QueryStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def count_query(execute, sql, params, many, context):
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() blocks pop the last wrapper when they exit.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.query_stats = QueryStats()
+        token = _stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _stats.reset(token)
+        self.check(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = request.query_stats = QueryStats()
+        token = _stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _stats.reset(token)
+        self.check(request, stats)
+        return response
+
+    def check(self, request, stats):
+        url_name = request.resolver_match.view_name if request.resolver_match else None
+        logger.debug('%s: %d queries in %.1f ms', url_name, stats.queries, stats.db_time * 1000)
+        budget = budget_for(request.resolver_match)
+        if budget is not None and stats.queries > budget:
+            message = f'{url_name} ran {stats.queries} queries, over its budget of {budget}'
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={
+                'url_name': url_name, 'queries': stats.queries, 'budget': budget, 'db_time': stats.db_time,
+            })
+            metrics.query_budget_exceeded.inc(url_name)
+            budget_exceeded.send(
+                sender=self.__class__, url_name=url_name, queries=stats.queries, budget=budget, db_time=stats.db_time,
+            )
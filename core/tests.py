@@ -1,3 +1,331 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from django.contrib.auth.models import User
+
+from accounts.models import Bank, UserAddress, UserBankAccount
+from transactions import api
+from transactions.constants import DEPOSIT, LOAN, TRANSFER_TO_OTHER, WITHDRAWAL
+from transactions.models import Transaction
+from transactions.seed import create_accounts
+from transactions.services import approve_loan
+from transactions.views import LoanListView
+from .models import FAILED, PENDING, SENT, OutboxEmail
+from . import metrics, profiling
+from .db_router import PIN_COOKIE, reads_from_replica
+from .outbox import claim_batch, drain_outbox
+from .query_budget import QueryBudgetExceeded, budget_exceeded
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('mail server unavailable')
+
+
+class UnreachableBackend(BaseEmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('connection refused')
+
+    def send_messages(self, email_messages):
+        raise AssertionError('sent without a connection')
+
+
+class OutboxTests(TestCase):
+    def queue(self, count=1):
+        for i in range(count):
+            OutboxEmail.objects.create(to=f'user{i}@example.com', subject='Deposite Message', html_body='<p>hi</p>')
+
+    def test_worker_drains_outbox(self):
+        self.queue(3)
+        call_command('send_outbox', '--once', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][0], '<p>hi</p>')
+        self.assertFalse(OutboxEmail.objects.exclude(status=SENT).exists())
+
+    def test_claimed_rows_are_hidden_from_other_workers(self):
+        self.queue(2)
+        self.assertEqual(len(claim_batch(10, timedelta(minutes=5))), 2)
+        self.assertEqual(claim_batch(10, timedelta(minutes=5)), [])
+
+    @override_settings(EMAIL_BACKEND='core.tests.FailingBackend')
+    def test_failures_back_off_then_give_up(self):
+        self.queue()
+        before = timezone.now()
+        self.assertEqual(drain_outbox(backoff=timedelta(seconds=30)), (1, 0))
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (PENDING, 1))
+        self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=30))
+        self.assertIn('mail server unavailable', email.last_error)
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        drain_outbox(max_attempts=2)
+        self.assertEqual(OutboxEmail.objects.get().status, FAILED)
+
+    @override_settings(EMAIL_BACKEND='core.tests.UnreachableBackend')
+    def test_unreachable_server_backs_off_the_whole_batch(self):
+        self.queue(2)
+        before = timezone.now()
+        out = StringIO()
+        call_command('send_outbox', '--once', '--backoff', '30', stdout=out)
+        self.assertEqual(out.getvalue(), 'sent 0 of 2 emails\n')
+        for email in OutboxEmail.objects.all():
+            self.assertEqual((email.status, email.attempts), (PENDING, 1))
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=30))
+            self.assertIn('connection refused', email.last_error)
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account, cls.recipient = create_accounts(2, prefix='budget', balance=Decimal('10000.00'))
+        UserAddress.objects.create(user=cls.account.user, street_address='1 Road', city='Dhaka', postal_code=1200,
+                                   country='Bangladesh')
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def test_views_stay_within_budget(self):
+        today = str(timezone.localdate())
+        self.client.post(reverse('deposit_money'), {'amount': '500', 'transaction_type': DEPOSIT})
+        self.client.post(reverse('withdraw_money'), {'amount': '500', 'transaction_type': WITHDRAWAL})
+        self.client.post(reverse('transfer_money'), {
+            'amount': '150', 'transaction_type': TRANSFER_TO_OTHER, 'recipient_account': self.recipient.account_no,
+        })
+        self.client.post(reverse('loan_request'), {'amount': '1000', 'transaction_type': LOAN})
+        loan = Transaction.objects.get(account=self.account, transaction_type=LOAN)
+        approve_loan(loan)
+        self.client.get(reverse('pay', args=[loan.pk]))
+        self.client.get(reverse('loan_list'))
+        self.client.get(reverse('transaction_report'))
+        self.client.get(reverse('transaction_report'), {'start_date': today, 'end_date': today})
+        self.client.get(reverse('profile'))
+        self.client.post(reverse('profile'), {
+            'first_name': 'Budget', 'last_name': 'Holder', 'email': 'budget@example.com', 'account_type': 'Savings',
+            'birth_date': '1990-01-01', 'gender': 'Female', 'street_address': '2 Road', 'city': 'Dhaka',
+            'postal_code': 1200, 'country': 'Bangladesh',
+        })
+
+    def test_over_budget_fails_in_strict_mode(self):
+        with mock.patch.object(LoanListView, 'query_budget', 1):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'loan_list ran'):
+                self.client.get(reverse('loan_list'))
+
+    async def test_async_views_count_the_queries_of_their_threads(self):
+        await self.async_client.aforce_login(self.account.user)
+        self.assertEqual((await self.async_client.get(reverse('api_balance'))).status_code, 200)
+        with mock.patch.object(api.balance, 'query_budget', 1):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'api_balance ran'):
+                await self.async_client.get(reverse('api_balance'))
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_over_budget_warns_outside_strict_mode(self):
+        received = []
+        budget_exceeded.connect(lambda **kwargs: received.append(kwargs), weak=False, dispatch_uid='budget-test')
+        self.addCleanup(budget_exceeded.disconnect, dispatch_uid='budget-test')
+        sample = ('_total', 'view="loan_list"', '')
+        before = metrics.collect().get('bank_query_budget_exceeded', {}).get(sample, 0)
+        with mock.patch.object(LoanListView, 'query_budget', 1):
+            with self.assertLogs('core.query_budget', 'WARNING'):
+                response = self.client.get(reverse('loan_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(received[0]['url_name'], 'loan_list')
+        self.assertEqual(received[0]['budget'], 1)
+        self.assertEqual(metrics.collect()['bank_query_budget_exceeded'][sample], before + 1)
+
+
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account, = create_accounts(1, prefix='profiled', balance=Decimal('1000.00'))
+        cls.staff = User.objects.create_user('auditor', password='secret', is_staff=True)
+
+    def setUp(self):
+        profiling.clear()
+        self.addCleanup(profiling.clear)
+
+    def test_requests_are_not_recorded_by_default(self):
+        self.client.force_login(self.account.user)
+        self.client.get(reverse('transaction_report'), {'_profile': 1})
+        self.assertEqual(profiling.recent(), [])
+
+    def test_staff_flag_records_cprofile(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('home'), HTTP_X_PROFILE='1')
+        [entry] = profiling.recent()
+        self.assertEqual(entry['url_name'], 'home')
+        self.assertIn('template', entry['sections_ms'])
+        self.assertIn('cumulative', entry['profile'])
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    def test_sampled_request_splits_time_without_cprofile(self):
+        self.client.force_login(self.account.user)
+        self.client.post(reverse('deposit_money'), {'amount': '500', 'transaction_type': DEPOSIT})
+        [entry] = profiling.recent()
+        self.assertIsNone(entry['profile'])
+        self.assertGreater(entry['queries'], 0)
+        self.assertEqual(set(entry['sections_ms']), {'view', 'db', 'email'})
+        self.assertAlmostEqual(sum(entry['sections_ms'].values()), entry['total_ms'], delta=1)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    async def test_sampled_async_request_times_its_queries(self):
+        await self.async_client.aforce_login(self.account.user)
+        await self.async_client.get(reverse('api_transactions'))
+        [entry] = profiling.recent()
+        self.assertGreater(entry['queries'], 0)
+        self.assertIn('db', entry['sections_ms'])
+
+    def test_admin_page_lists_slowest_first(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('home'), {'_profile': 1})
+        self.client.get(reverse('login'), {'_profile': 1})
+        response = self.client.get(reverse('request_profiles'))
+        slowest = max(profiling.recent(), key=lambda entry: entry['total_ms'])
+        self.assertEqual(response.context['entries'][0], slowest)
+        self.assertContains(self.client.get(reverse('request_profile', args=[slowest['id']])), 'cProfile')
+
+        self.client.force_login(self.account.user)
+        self.assertEqual(self.client.get(reverse('request_profiles')).status_code, 302)
+
+
+def scrape(client):
+    samples = {}
+    response = client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-token'})
+    for line in response.content.decode().splitlines():
+        if line and not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            samples[sample] = float(value)
+    return samples
+
+
+def increment_in_child():
+    metrics.transactions.inc('deposit', amount=5)
+
+
+@override_settings(METRICS_TOKEN='scrape-token', METRICS_ALLOWED_IPS=[])
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        cls.account, cls.recipient = create_accounts(2, prefix='metrics', balance=Decimal('10000.00'))
+
+    def delta(self, before, after, sample):
+        return after.get(sample, 0) - before.get(sample, 0)
+
+    def test_scrape_after_synthetic_traffic(self):
+        before = scrape(self.client)
+        self.client.force_login(self.account.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('deposit_money'), {'amount': '500', 'transaction_type': DEPOSIT})
+            self.client.post(reverse('deposit_money'), {'amount': '250', 'transaction_type': DEPOSIT})
+            self.client.post(reverse('withdraw_money'), {'amount': '600', 'transaction_type': WITHDRAWAL})
+            self.client.post(reverse('transfer_money'), {
+                'amount': '150', 'transaction_type': TRANSFER_TO_OTHER, 'recipient_account': self.recipient.account_no,
+            })
+        with override_settings(EMAIL_BACKEND='core.tests.FailingBackend'):
+            drain_outbox(max_attempts=1)
+        after = scrape(self.client)
+
+        self.assertEqual(self.delta(before, after, 'bank_transactions_total{type="deposit"}'), 2)
+        self.assertEqual(self.delta(before, after, 'bank_transaction_amount_total{type="deposit"}'), 750)
+        self.assertEqual(self.delta(before, after, 'bank_transactions_total{type="withdrawal"}'), 1)
+        self.assertEqual(self.delta(before, after, 'bank_transactions_total{type="transfer_to_other"}'), 1)
+        self.assertEqual(self.delta(before, after, 'bank_transactions_total{type="transfer_from_other"}'), 1)
+        self.assertEqual(self.delta(before, after, 'bank_email_send_failures_total'), 5)
+        self.assertEqual(self.delta(
+            before, after, 'bank_request_duration_seconds_count{view="deposit_money",method="POST"}'), 2)
+        self.assertEqual(self.delta(
+            before, after, 'bank_request_duration_seconds_bucket{view="deposit_money",method="POST",le="+Inf"}'), 2)
+        self.assertGreater(self.delta(
+            before, after, 'bank_db_query_duration_seconds_count{operation="UPDATE",table="accounts_userbankaccount"}'), 0)
+        self.assertEqual(after['bank_bankrupt{bank="1",name="Islamiyahtech Bank"}'], 0)
+
+    def test_scrapes_need_the_token_or_an_allowed_address(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.client.force_login(self.account.user)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='192.0.2.1').status_code, 401)
+
+    def test_rolled_back_transactions_are_not_counted(self):
+        before = scrape(self.client)
+        self.client.force_login(self.account.user)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.client.post(reverse('deposit_money'), {'amount': '500', 'transaction_type': DEPOSIT})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.delta(before, scrape(self.client), 'bank_transactions_total{type="deposit"}'), 0)
+
+    def test_worker_processes_share_metrics_dir(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.transactions.inc('deposit', amount=1)
+            child = multiprocessing.get_context('fork').Process(target=increment_in_child)
+            child.start()
+            child.join()
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.metrics')]), 2)
+            samples = scrape(self.client)
+        self.assertEqual(samples['bank_transactions_total{type="deposit"}'], 6)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_test'])
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'replica_test'}
+
+    @classmethod
+    def setUpTestData(cls):
+        bank = Bank.objects.create(pk=1)
+        [cls.account] = create_accounts(1, prefix='replica', balance=Decimal('5000.00'))
+        # The replica lags behind: it has the customer, but an older balance.
+        bank.save(using='replica_test')
+        cls.account.user.save(using='replica_test')
+        UserBankAccount.objects.using('replica_test').create(
+            pk=cls.account.pk, user_id=cls.account.user_id, bank_id=1, account_no=cls.account.account_no,
+            balance=Decimal('1.00'),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def report(self):
+        with CaptureQueriesContext(connections['replica_test']) as replica_queries:
+            response = self.client.get(reverse('transaction_report'))
+        return response.context['account'].balance, len(replica_queries)
+
+    def test_read_only_views_read_from_the_replica(self):
+        balance, replica_queries = self.report()
+        self.assertEqual(balance, Decimal('1.00'))
+        self.assertTrue(replica_queries)
+        self.assertEqual(self.client.get(reverse('api_balance')).json()['balance'], '1.00')
+
+    def test_other_views_read_from_the_primary(self):
+        with CaptureQueriesContext(connections['replica_test']) as replica_queries:
+            self.client.get(reverse('deposit_money'))
+            self.client.get(reverse('transfer_money'))
+        self.assertEqual(len(replica_queries), 0)
+
+    def test_writer_reads_its_writes_until_the_pin_expires(self):
+        self.client.post(reverse('deposit_money'), {'amount': '100', 'transaction_type': DEPOSIT})
+        self.assertEqual(self.report(), (Decimal('5100.00'), 0))
+        self.client.cookies[PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.report()[0], Decimal('1.00'))
+
+    def test_admin_changelists_are_read_only(self):
+        self.assertTrue(reads_from_replica(resolve('/admin/transactions/transaction/')))
+        self.assertFalse(reads_from_replica(resolve('/admin/transactions/transaction/1/change/')))
@@ -1,6 +1,64 @@
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
 from django.views.generic import TemplateView
+
+from accounts.models import Bank
+from . import metrics as bank_metrics, profiling
 # Create your views here.
 
 class HomeView(TemplateView):
     template_name = 'index.html'
+
+
+@staff_member_required
+def request_profiles(request):
+    entries = sorted(profiling.recent(), key=lambda entry: entry['total_ms'], reverse=True)
+    return render(request, 'core/request_profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Slowest recent requests',
+        'entries': entries,
+    })
+
+
+@staff_member_required
+def request_profile(request, profile_id):
+    entry = profiling.get(profile_id)
+    if entry is None:
+        raise Http404('This profile is no longer in the buffer.')
+    return render(request, 'core/request_profile.html', {
+        **admin.site.each_context(request),
+        'title': f'{entry["method"]} {entry["path"]}',
+        'entry': entry,
+    })
+
+
+def may_scrape(request):
+    """Whether ``request`` carries the metrics token or comes from an allowed address."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and constant_time_compare(credentials.strip(), token):
+        return True
+    try:
+        address = ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ip_network(allowed, strict=False) for allowed in getattr(settings, 'METRICS_ALLOWED_IPS', []))
+
+
+def metrics(request):
+    if not may_scrape(request):
+        response = HttpResponse('Metrics need a bearer token or an allowed address.', status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    bankrupt = [
+        ({'bank': pk, 'name': name}, is_bankrupt)
+        for pk, name, is_bankrupt in Bank.objects.order_by('pk').values_list('pk', 'name', 'is_bankrupt')
+    ]
+    body = bank_metrics.exposition([('bank_bankrupt', 'Whether the bank is flagged bankrupt.', bankrupt)])
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
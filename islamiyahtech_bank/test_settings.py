@@ -0,0 +1,11 @@
+"""
+Settings for the test suite; ``manage.py test`` uses them unless told otherwise.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+# A second, empty SQLite database that the router tests use as a replica stand-in
+DATABASES['replica_test'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica_test.sqlite3'}
+
+# Going over a query budget fails the test
+QUERY_BUDGET_STRICT = True
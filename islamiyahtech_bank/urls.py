@@ -2,11 +2,15 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
-from core.views import HomeView
+from core.views import HomeView, metrics, request_profile, request_profiles
 urlpatterns = [
     path('', HomeView.as_view(), name='home'),
+    path('metrics', metrics, name='metrics'),
+    path('admin/profiles/', request_profiles, name='request_profiles'),
+    path('admin/profiles/<int:profile_id>/', request_profile, name='request_profile'),
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('transactions/', include('transactions.urls')),
+    path('api/v1/', include('transactions.api_urls')),
 ]
 urlpatterns += static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
@@ -1,13 +1,31 @@
 from django.contrib import admin
+from django.db.models import F
 
+from accounts.models import UserBankAccount
+from .constants import LOAN
 from .models import Transaction
+from .services import approve_loan, post
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['account', 'amount', 'balance_after_transaction', 'transaction_type', 'loan_approve']
-    
+
+    def get_readonly_fields(self, request, obj=None):
+        readonly = list(super().get_readonly_fields(request, obj))
+        if obj is not None:
+            # A saved row is booked in the balance and the journal; only approving a pending loan posts through
+            # the engine. Corrections are new postings.
+            readonly += ['account', 'amount', 'balance_after_transaction', 'transaction_type']
+            if obj.transaction_type != LOAN or obj.loan_approve:
+                readonly.append('loan_approve')
+        return readonly
+
     def save_model(self, request, obj, form, change):
-        obj.account.balance += obj.amount
-        obj.balance_after_transaction = obj.account.balance
-        obj.account.save()
-        super().save_model(request, obj, form, change)
+        if not change:
+            post(obj)
+        elif obj.transaction_type == LOAN and obj.loan_approve:
+            approve_loan(obj)
+        else:
+            super().save_model(request, obj, form, change)
+            # The row shows on the account's pages, whose ETags follow the account's version.
+            UserBankAccount.objects.filter(pk=obj.account_id).update(version=F('version') + 1)
 
@@ -0,0 +1,208 @@
+"""
+Versioned JSON API (``/api/v1/``) built on async views.
+
+Reads go through the async ORM, so under ASGI a request waiting on a slow
+client or on the database does not hold a worker thread. Money-moving
+endpoints validate with the same forms as the HTML views and post through
+``transactions.services``; that code needs ``transaction.atomic``, which is
+not available in async code, so it runs in one ``sync_to_async`` call per
+request. Requests are authenticated by the session, like the rest of the site,
+and money-moving ones take an ``Idempotency-Key`` like the HTML forms.
+"""
+import json
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET, require_POST
+
+from accounts.bank_status import is_bankrupt
+from accounts.models import UserBankAccount
+from core.db_router import use_replica
+from core.query_budget import query_budget
+from .constants import DEPOSIT, LOAN, TRANSACTION_TYPE_NAMES, TRANSFER_TO_OTHER, WITHDRAWAL
+from .forms import DepositForm, TransferForm, WithdrawForm
+from .idempotency import HEADER, KeyReused, json_fingerprint, posted, request_key, run_once
+from .journal import abalance_at
+from .models import Transaction
+from .pagination import akeyset_page
+from .services import InsufficientFunds, post_transaction, transfer
+from .views import send__money_transfer_email, send_transaction_email
+
+BANKRUPT = 'The Bank is bankrupt. No transactions are allowed at the moment.'
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def serialize(txn):
+    return {
+        'id': txn.pk,
+        'type': TRANSACTION_TYPE_NAMES[txn.transaction_type],
+        'amount': txn.amount,
+        'balance_after_transaction': txn.balance_after_transaction,
+        'timestamp': txn.timestamp,
+    }
+
+
+def login_required(view):
+    """Pass the session's user, with its account loaded, to ``view`` as ``user``, or answer 401."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return error('Authentication required.', 401)
+        if not type(user).account.is_cached(user):
+            # Sessions started under ModelBackend load the user without IdentityBackend's related rows.
+            try:
+                user.account = await UserBankAccount.objects.select_related('bank').aget(user_id=user.pk)
+            except UserBankAccount.DoesNotExist:
+                return error('This user has no bank account.', 403)
+        return await view(request, user, *args, **kwargs)
+    return wrapper
+
+
+def page_size(request):
+    size = settings.TRANSACTION_REPORT_PAGE_SIZE
+    try:
+        size = int(request.GET.get('page_size', size))
+    except ValueError:
+        pass
+    return max(1, min(size, settings.TRANSACTION_REPORT_MAX_PAGE_SIZE))
+
+
+@query_budget(6)
+@use_replica
+@require_GET
+@login_required
+async def balance(request, user):
+    """The account's balance, or with ``?at=<ISO datetime>`` its balance at that moment from the journal."""
+    account = user.account
+    amount = account.balance
+    if 'at' in request.GET:
+        try:
+            at = parse_datetime(request.GET['at'])
+        except ValueError:
+            at = None
+        if at is None:
+            return error('at must be an ISO 8601 datetime.', 400)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        amount = await abalance_at(account, at=at)
+    return JsonResponse({
+        'account_no': account.account_no,
+        'account_type': account.account_type,
+        'balance': amount,
+    })
+
+
+@query_budget(5)
+@use_replica
+@require_GET
+@login_required
+async def transactions(request, user):
+    queryset = Transaction.objects.filter(account_id=user.account.pk)
+    try:
+        rows, previous_cursor, next_cursor = await akeyset_page(
+            queryset, page_size(request), after=request.GET.get('after'), before=request.GET.get('before'),
+        )
+    except BadRequest as exc:
+        return error(str(exc), 400)
+    return JsonResponse({
+        'results': [serialize(txn) for txn in rows],
+        'previous': previous_cursor,
+        'next': next_cursor,
+    })
+
+
+@query_budget(4)
+@use_replica
+@require_GET
+@login_required
+async def loans(request, user):
+    rows = Transaction.objects.filter(account_id=user.account.pk, transaction_type=LOAN).order_by('timestamp', 'pk')
+    return JsonResponse({
+        'results': [dict(serialize(loan), approved=loan.loan_approve) async for loan in rows],
+    })
+
+
+def move_money(user, form_class, transaction_type, data, post):
+    """Validate ``data`` with ``form_class`` and run ``post(account, form)``; returns ``(status, payload)``."""
+    account = user.account
+    form = form_class(data, initial={'transaction_type': transaction_type}, account=account)
+    if not form.is_valid():
+        return 422, {'errors': {field: list(messages) for field, messages in form.errors.items()}}
+    if is_bankrupt(account.bank_id):
+        return 403, {'error': BANKRUPT}
+    try:
+        with transaction.atomic():
+            txn = post(account, form)
+    except InsufficientFunds:
+        return 422, {'errors': {'amount': ['Insufficient funds.']}}
+    return 201, serialize(txn)
+
+
+def post_deposit(account, form):
+    amount = form.cleaned_data['amount']
+    txn = post_transaction(account, amount, DEPOSIT)
+    send_transaction_email(account.user, amount, "Deposite Message", "transactions/deposit_mail.html")
+    return txn
+
+
+def post_withdrawal(account, form):
+    amount = form.cleaned_data['amount']
+    txn = post_transaction(account, amount, WITHDRAWAL)
+    send_transaction_email(account.user, amount, "Withdrawal Message", "transactions/withdrawal_email.html")
+    return txn
+
+
+def post_transfer(account, form):
+    amount, recipient = form.cleaned_data['amount'], form.recipient
+    txn = transfer(account, recipient, amount)
+    send__money_transfer_email(account.user, recipient, amount, "Transfer Money Message",
+                               "transactions/sender_transfermoney_email.html")
+    send__money_transfer_email(recipient.user, account.user, amount, "Transfer Money Message",
+                               "transactions/receiver_transfermoney_email.html")
+    return txn
+
+
+def money_view(form_class, transaction_type, post):
+    """A POST endpoint for ``move_money``; retries carrying the same Idempotency-Key replay the first posting."""
+    @require_POST
+    @login_required
+    async def view(request, user):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return error('Expected a JSON object.', 400)
+
+        def respond():
+            status, payload = move_money(user, form_class, transaction_type, data, post)
+            response = JsonResponse(payload, status=status)
+            return posted(response) if status == 201 else response
+
+        key = request_key(request)
+        if key is not None:
+            # run_once reads request.user, which would otherwise load the user again.
+            request.user = user
+            handler = partial(run_once, request, key, respond, fingerprint_of=json_fingerprint)
+        else:
+            handler = respond
+        try:
+            return await sync_to_async(handler)()
+        except KeyReused:
+            return error(f'This {HEADER} was already used for a different request.', 422)
+    return view
+
+
+deposit = query_budget(19)(money_view(DepositForm, DEPOSIT, post_deposit))
+withdraw = query_budget(19)(money_view(WithdrawForm, WITHDRAWAL, post_withdrawal))
+transfer_money = query_budget(25)(money_view(TransferForm, TRANSFER_TO_OTHER, post_transfer))
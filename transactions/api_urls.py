@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import api
+
+urlpatterns = [
+    path('balance/', api.balance, name='api_balance'),
+    path('transactions/', api.transactions, name='api_transactions'),
+    path('loans/', api.loans, name='api_loans'),
+    path('deposit/', api.deposit, name='api_deposit'),
+    path('withdraw/', api.withdraw, name='api_withdraw'),
+    path('transfer/', api.transfer_money, name='api_transfer'),
+]
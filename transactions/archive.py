@@ -0,0 +1,176 @@
+"""
+Cold archive of old transactions.
+
+``archive_account`` moves an account's transactions from before a cutoff into
+the account's archive file under ``TRANSACTION_ARCHIVE_DIR``. Open loans are
+the exception: they stay in the table, so they can still be repaid. The
+cutoff is the start of a month.
+
+Archive files are append-only. Each run appends one zlib-compressed block per
+month, holding that month's rows column by column. ``ArchivedBlock`` rows are
+the offset index of those blocks. They are written in the same database
+transaction that deletes the archived rows, so a crash leaves at worst an
+unreferenced block at the end of a file. ``UserBankAccount.archived_until``
+tells readers, without a query, whether a date range reaches into the
+archive.
+
+Reads map the file into memory and decompress only the blocks that overlap
+the requested range. An archived month therefore costs one block, however
+long the history is. Rows come back as unsaved ``Transaction`` instances, in
+``(timestamp, id)`` order.
+"""
+import json
+import mmap
+import os
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from accounts.models import UserBankAccount
+from .constants import LOAN
+from .models import ArchivedBlock, Transaction
+from .partitions import month_start
+
+COLUMNS = ['id', 'timestamp', 'transaction_type', 'amount', 'balance_after_transaction', 'loan_approve']
+
+
+def path(account_id):
+    return os.path.join(settings.TRANSACTION_ARCHIVE_DIR, f'{account_id}.txa')
+
+
+def reaches(account, start):
+    """Whether rows from ``start`` on (None: all rows) may be in the archive of ``account``."""
+    return account.archived_until is not None and (start is None or start < account.archived_until)
+
+
+def encode(rows):
+    ids, timestamps, types, amounts, balances, approvals = zip(*rows)
+    columns = {
+        'id': ids,
+        'timestamp': [timestamp.isoformat() for timestamp in timestamps],
+        'transaction_type': types,
+        'amount': [str(amount) for amount in amounts],
+        'balance_after_transaction': [str(balance) for balance in balances],
+        'loan_approve': approvals,
+    }
+    return zlib.compress(json.dumps(columns, separators=(',', ':')).encode(), 9)
+
+
+def decode(data):
+    """The rows of one block as tuples in ``COLUMNS`` order; amounts stay strings until a row is used."""
+    columns = json.loads(zlib.decompress(data))
+    columns['timestamp'] = [datetime.fromisoformat(timestamp) for timestamp in columns['timestamp']]
+    return list(zip(*(columns[column] for column in COLUMNS)))
+
+
+def to_transaction(account_id, row):
+    pk, timestamp, transaction_type, amount, balance, loan_approve = row
+    return Transaction(
+        id=pk,
+        account_id=account_id,
+        timestamp=timestamp,
+        transaction_type=transaction_type,
+        amount=Decimal(amount),
+        balance_after_transaction=Decimal(balance),
+        loan_approve=loan_approve,
+    )
+
+
+def _append(file, account_id, rows):
+    data = encode(rows)
+    offset = file.tell()
+    file.write(data)
+    return ArchivedBlock(
+        account_id=account_id,
+        month=month_start(rows[0][1]).date(),
+        offset=offset,
+        length=len(data),
+        count=len(rows),
+        first_timestamp=rows[0][1],
+        last_timestamp=rows[-1][1],
+    )
+
+
+def archive_account(account, cutoff, chunk_size=5000):
+    """Move the transactions of ``account`` before ``cutoff`` to its archive file; returns how many moved."""
+    with transaction.atomic():
+        account = UserBankAccount.objects.select_for_update().get(pk=account.pk)
+        rows = (
+            Transaction.objects.filter(account=account, timestamp__lt=cutoff)
+            .exclude(transaction_type=LOAN)
+            .order_by('timestamp', 'pk')
+            .values_list(*COLUMNS)
+        )
+        blocks, ids, month = [], [], []
+        os.makedirs(settings.TRANSACTION_ARCHIVE_DIR, exist_ok=True)
+        with open(path(account.pk), 'ab') as file:
+            for row in rows.iterator(chunk_size=chunk_size):
+                if month and month_start(row[1]) != month_start(month[0][1]):
+                    blocks.append(_append(file, account.pk, month))
+                    month = []
+                month.append(row)
+                ids.append(row[0])
+            if month:
+                blocks.append(_append(file, account.pk, month))
+            file.flush()
+            os.fsync(file.fileno())
+        if not ids:
+            return 0
+        ArchivedBlock.objects.bulk_create(blocks)
+        for start in range(0, len(ids), chunk_size):
+            Transaction.objects.filter(pk__in=ids[start:start + chunk_size]).delete()
+        UserBankAccount.objects.filter(pk=account.pk).update(
+            archived_until=max(cutoff, account.archived_until or cutoff),
+            version=F('version') + 1,
+        )
+    return len(ids)
+
+
+def _clusters(blocks):
+    """Group blocks (in ``first_timestamp`` order) whose time spans overlap, so each group sorts on its own."""
+    cluster, last = [], None
+    for block in blocks:
+        if cluster and block.first_timestamp > last:
+            yield cluster
+            cluster = []
+        cluster.append(block)
+        last = block.last_timestamp if last is None else max(last, block.last_timestamp)
+    if cluster:
+        yield cluster
+
+
+def rows(account, start=None, end=None, after=None, before=None):
+    """Archived rows of ``account`` in ``[start, end)``.
+
+    ``after`` or ``before`` is a ``(timestamp, id)`` keyset cursor; rows come
+    in ascending order, or descending from ``before``.
+    """
+    blocks = ArchivedBlock.objects.filter(account=account)
+    if start is not None:
+        blocks = blocks.filter(last_timestamp__gte=start)
+    if after is not None:
+        blocks = blocks.filter(last_timestamp__gte=after[0])
+    if end is not None:
+        blocks = blocks.filter(first_timestamp__lt=end)
+    if before is not None:
+        blocks = blocks.filter(first_timestamp__lte=before[0])
+    clusters = list(_clusters(blocks))
+    if not clusters:
+        return
+    if before is not None:
+        clusters.reverse()
+
+    with open(path(account.pk), 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for cluster in clusters:
+            decoded = [row for block in cluster for row in decode(data[block.offset:block.offset + block.length])]
+            decoded.sort(key=itemgetter(1, 0), reverse=before is not None)
+            for row in decoded:
+                key = (row[1], row[0])
+                if ((start is None or row[1] >= start) and (end is None or row[1] < end)
+                        and (after is None or key > after) and (before is None or key < before)):
+                    yield to_transaction(account.pk, row)
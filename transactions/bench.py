@@ -0,0 +1,49 @@
+"""
+Base of the ``bench_*`` management commands.
+
+The benchmarks write throwaway customers, transactions and journal entries to the
+default database, so they refuse to run against anything but SQLite or a server on
+this machine unless ``--yes-i-mean-it`` is given.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+LOCAL_HOSTS = {'', 'localhost', '127.0.0.1', '::1'}
+
+
+def is_scratch_database(connection):
+    host = connection.settings_dict.get('HOST') or ''
+    return connection.vendor == 'sqlite' or host in LOCAL_HOSTS or host.startswith('/')
+
+
+class BenchCommand(BaseCommand):
+    """A benchmark that seeds its own data and leaves the database as it found it.
+
+    With ``rolled_back`` the whole run is one transaction that is rolled back unless
+    ``--keep`` is given. Benchmarks whose rows other connections must see (threads,
+    servers, worker processes) set it to False and delete what they seeded instead.
+    """
+    rolled_back = True
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--yes-i-mean-it', action='store_true',
+            help='Run even though the default database is not SQLite or on this machine.',
+        )
+        return parser
+
+    def execute(self, *args, **options):
+        if not (options['yes_i_mean_it'] or is_scratch_database(connection)):
+            raise CommandError(
+                f'Refusing to write benchmark data to {connection.vendor} on '
+                f'{connection.settings_dict["HOST"]}; point DATABASE_URL at a scratch database '
+                f'or pass --yes-i-mean-it.'
+            )
+        if not self.rolled_back or options.get('keep'):
+            return super().execute(*args, **options)
+        with transaction.atomic():
+            try:
+                return super().execute(*args, **options)
+            finally:
+                transaction.set_rollback(True)
@@ -3,6 +3,8 @@ WITHDRAWAL = 2
 LOAN = 3
 LOAN_PAID = 4
 TRANSFER_TO_OTHER = 5
+TRANSFER_FROM_OTHER = 6
+INTEREST = 7
 
 TRANSACTION_TYPE = (
     (DEPOSIT, 'Deposite'),
@@ -10,5 +12,37 @@ TRANSACTION_TYPE = (
     (LOAN, 'Loan'),
     (LOAN_PAID, 'Loan Paid'),
     (TRANSFER_TO_OTHER, 'Transfered'),
+    (TRANSFER_FROM_OTHER, 'Received'),
+    (INTEREST, 'Interest'),
     
-)
\ No newline at end of file
+)
+
+DEBIT_TYPES = (WITHDRAWAL, LOAN_PAID, TRANSFER_TO_OTHER)
+
+MIN_TRANSFER_AMOUNT = 150
+
+# Label values for metrics and logs
+TRANSACTION_TYPE_NAMES = {
+    DEPOSIT: 'deposit',
+    WITHDRAWAL: 'withdrawal',
+    LOAN: 'loan',
+    LOAN_PAID: 'loan_paid',
+    TRANSFER_TO_OTHER: 'transfer_to_other',
+    TRANSFER_FROM_OTHER: 'transfer_from_other',
+    INTEREST: 'interest',
+}
+
+# The bank's own books in the double-entry journal (transactions.journal); customer accounts are the others
+CASH = 'cash'
+LOANS = 'loans'
+INTEREST_EXPENSE = 'interest_expense'
+OPENING_BALANCES = 'opening_balances'
+SUSPENSE = 'suspense'
+
+BOOKS = (
+    (CASH, 'Cash'),
+    (LOANS, 'Loans receivable'),
+    (INTEREST_EXPENSE, 'Interest expense'),
+    (OPENING_BALANCES, 'Opening balances'),
+    (SUSPENSE, 'Suspense'),
+)
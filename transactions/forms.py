@@ -1,5 +1,6 @@
 from django import forms
 from .models import Transaction
+from .constants import MIN_TRANSFER_AMOUNT
 from django.core.exceptions import ObjectDoesNotExist
 from accounts.models import UserBankAccount
 
@@ -85,12 +86,11 @@ class TransferForm(TransactionForm):
 
 
     def clean_amount(self):
-        min_transfer_amount = 150
         amount = self.cleaned_data.get('amount')
 
-        if amount < min_transfer_amount:
+        if amount < MIN_TRANSFER_AMOUNT:
             raise forms.ValidationError(
-                f'The transfer amount must be at least {min_transfer_amount} $'
+                f'The transfer amount must be at least {MIN_TRANSFER_AMOUNT} $'
             )
         elif self.account.balance<amount:
             raise forms.ValidationError(
@@ -104,21 +104,11 @@ class TransferForm(TransactionForm):
 
         try:
             recipient_account_obj = UserBankAccount.objects.get(account_no=recipient_account)
-        except ObjectDoesNotExist:
+        except (ObjectDoesNotExist, ValueError, TypeError):
             raise forms.ValidationError('Recipient account does not exist.')
 
         if recipient_account_obj == self.account:
             raise forms.ValidationError('Cannot transfer to your own account.')
 
+        self.recipient = recipient_account_obj
         return recipient_account
-
-    def save(self, commit=True):
-        self.instance.account = self.account
-        self.instance.balance_after_transaction = self.account.balance
-
-        recipient_account = UserBankAccount.objects.get(account_no=self.cleaned_data.get('recipient_account'))
-        recipient_account.balance += self.cleaned_data.get('amount')
-        recipient_account.save()
-
-        self.instance.recipient_account = self.cleaned_data.get('recipient_account')
-        return super().save()
\ No newline at end of file
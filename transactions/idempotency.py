@@ -0,0 +1,127 @@
+"""
+Idempotency keys for money-moving POSTs.
+
+A client sends an ``Idempotency-Key`` header (or ``idempotency_key`` form
+field) and may retry the same request with it. A retry finds the stored outcome
+(status, redirect and body) and replays it without touching balances.
+Otherwise the view runs as usual and, if it marked its response with
+``posted``, the response is stored as an ``IdempotencyKey`` row inside the same
+database transaction as the posting, so of two concurrent duplicates only one
+commits: the other fails on the unique key, rolls back its own posting and
+replays the winner's outcome. Unmarked responses (form errors, the loan limit
+page, the bankrupt notice) moved no money and are not stored, so a retry runs
+again. A key reused for a different request, told apart by path and form
+fields or JSON body, is refused. Keys expire after
+``IDEMPOTENCY_KEY_TTL`` seconds; ``purge_idempotency_keys`` deletes them, and
+a request that finds its key expired replaces it.
+"""
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+IGNORED_FIELDS = {FIELD, 'csrfmiddlewaretoken'}
+
+
+class KeyReused(Exception):
+    pass
+
+
+def request_key(request):
+    key = request.headers.get(HEADER) or request.POST.get(FIELD)
+    return hashlib.sha256(key.encode()).digest() if key else None
+
+
+def fingerprint(request):
+    body = sorted((name, value) for name, values in request.POST.lists() if name not in IGNORED_FIELDS
+                  for value in values)
+    return hashlib.sha256(repr((request.path, body)).encode()).digest()[:16]
+
+
+def posted(response):
+    """Mark ``response`` as the outcome of a request that moved money, for ``run_once`` to store."""
+    response.posted = True
+    return response
+
+
+def json_fingerprint(request):
+    """Like ``fingerprint``, for requests whose body is JSON rather than form fields."""
+    try:
+        body = json.dumps(json.loads(request.body), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        body = request.body.decode('latin-1')
+    return hashlib.sha256(repr((request.path, body)).encode()).digest()[:16]
+
+
+def replay(record):
+    response = HttpResponse(record.body, status=record.status_code, content_type=record.content_type or None)
+    if record.location:
+        response['Location'] = record.location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def run_once(request, key, handler, fingerprint_of=fingerprint):
+    """Replay the stored outcome of ``key`` for this user, or run ``handler`` and store its ``posted`` response."""
+    digest = fingerprint_of(request)
+    record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+    if record is not None and record.expires_at <= timezone.now():
+        record.delete()
+        record = None
+    if record is None:
+        try:
+            with transaction.atomic():
+                response = handler()
+                if not getattr(response, 'posted', False):
+                    return response
+                IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    fingerprint=digest,
+                    status_code=response.status_code,
+                    location=response.get('Location', ''),
+                    content_type=response['Content-Type'] if response.content else '',
+                    body=response.content.decode(response.charset),
+                    expires_at=timezone.now() + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)),
+                )
+                return response
+        except IntegrityError:
+            # A concurrent duplicate committed first; this posting was rolled back with the key.
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is None:
+                raise
+    if bytes(record.fingerprint) != digest:
+        raise KeyReused
+    return replay(record)
+
+
+class IdempotentPostMixin:
+    """Adds idempotency keys to a form view; its template renders ``idempotency_key`` as a hidden field."""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['idempotency_key'] = self.request.POST.get(FIELD) or uuid.uuid4().hex
+        return context
+
+    def post(self, request, *args, **kwargs):
+        key = request_key(request)
+        if key is None:
+            return super().post(request, *args, **kwargs)
+        try:
+            return run_once(request, key, lambda: self.post_once(request, *args, **kwargs))
+        except KeyReused:
+            return HttpResponse(f'This {HEADER} was already used for a different request.', status=422)
+
+    def post_once(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        # Views set ``self.object`` to the transaction they posted, and leave it None when they posted nothing.
+        return posted(response) if self.object is not None else response
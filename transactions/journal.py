@@ -0,0 +1,202 @@
+"""
+Double-entry journal of every balance change.
+
+The posting engine writes one ``JournalEntry`` per movement of money.
+Interest runs and batch transfers write one per chunk or batch. The
+entry's ``JournalPosting`` rows sum to zero, debits positive and credits
+negative, in the same transaction that moves the balance. Customer accounts
+are the bank's liabilities, so a deposit debits the cash book and credits
+the account, and an account's balance is minus the sum of its postings. Each
+customer posting carries the id of the ``Transaction`` row the account's
+pages show for it. Nothing updates or deletes journal rows.
+
+The bank's own books (``BOOKS``) have no balance row. Every deposit,
+withdrawal and loan posts to one of them, so they are only ever inserted
+into, and concurrent postings never wait on each other there.
+``UserBankAccount.balance`` stays as the journal's running projection for
+customer accounts. Overdraft checks need its row lock, and every page reads
+it.
+
+``snapshot_balances`` periodically stores each account's and book's
+balance as a ``BalanceSnapshot``, together with the last posting it covers.
+``balance_at`` reads a balance at any moment from the latest snapshot before
+it plus the postings since, so a read never replays full history. Taking an
+account's snapshot also compares the journal with its balance column.
+"""
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Q, Subquery, Sum
+
+from accounts.models import UserBankAccount
+from .constants import (
+    BOOKS, CASH, DEPOSIT, INTEREST, INTEREST_EXPENSE, LOAN, LOAN_PAID, LOANS, OPENING_BALANCES, SUSPENSE,
+    TRANSFER_FROM_OTHER, TRANSFER_TO_OTHER, WITHDRAWAL,
+)
+from .models import BalanceSnapshot, JournalEntry, JournalPosting
+
+# The book on the other side of a change to one customer balance; transfers made through ``post``
+# (entered by hand in the admin) have no counter account, so they wait in suspense
+COUNTERPARTS = {
+    None: OPENING_BALANCES,
+    DEPOSIT: CASH,
+    WITHDRAWAL: CASH,
+    LOAN: LOANS,
+    LOAN_PAID: LOANS,
+    INTEREST: INTEREST_EXPENSE,
+    TRANSFER_TO_OTHER: SUSPENSE,
+    TRANSFER_FROM_OTHER: SUSPENSE,
+}
+
+
+class UnbalancedEntry(ValueError):
+    pass
+
+
+def customer(account_id, delta, transaction_id=None):
+    """The posting of a change of ``delta`` to a customer balance: a credit when the balance grows."""
+    return JournalPosting(account_id=account_id, amount=-delta, transaction_id=transaction_id)
+
+
+def book(name, amount):
+    return JournalPosting(book=name, amount=amount)
+
+
+def record(kind, when, postings, batch_size=1000):
+    """Write an entry of ``kind`` with ``postings`` (unsaved), which must sum to zero."""
+    total = sum((posting.amount for posting in postings), Decimal(0))
+    if total:
+        raise UnbalancedEntry(f'Postings of a {kind} entry sum to {total}')
+    entry = JournalEntry.objects.create(kind=kind, timestamp=when)
+    for posting in postings:
+        posting.entry, posting.timestamp = entry, when
+    JournalPosting.objects.bulk_create(postings, batch_size=batch_size)
+    return entry
+
+
+def movement(kind, when, account_id, delta, transaction_id=None):
+    """Record a change of ``delta`` to one customer balance, against the book ``kind`` moves money through."""
+    return record(kind, when, [customer(account_id, delta, transaction_id), book(COUNTERPARTS[kind], delta)])
+
+
+def open_balances(when, deltas, batch_size=1000):
+    """Record balances set outside the posting engine (``{account pk: change}``) against opening balances."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if deltas:
+        postings = [customer(pk, delta) for pk, delta in deltas.items()]
+        record(None, when, postings + [book(OPENING_BALANCES, sum(deltas.values(), Decimal(0)))], batch_size)
+
+
+def _owner(account, name):
+    return {'account': account} if name is None else {'book': name}
+
+
+def _snapshots(owner, at):
+    snapshots = BalanceSnapshot.objects.filter(**owner)
+    if at is not None:
+        snapshots = snapshots.filter(timestamp__lte=at)
+    return snapshots.order_by('-through')
+
+
+def _postings(owner, snapshot, at):
+    postings = JournalPosting.objects.filter(**owner)
+    if snapshot is not None:
+        postings = postings.filter(pk__gt=snapshot.through)
+    if at is not None:
+        postings = postings.filter(timestamp__lte=at)
+    return postings
+
+
+def _balance(owner, snapshot, total):
+    total = total or Decimal(0)
+    balance = snapshot.balance if snapshot is not None else Decimal('0.00')
+    return balance - total if 'account' in owner else balance + total
+
+
+def balance_at(account=None, book=None, at=None):
+    """Balance of a customer ``account`` or of a ``book`` at ``at`` (default: now)."""
+    owner = _owner(account, book)
+    snapshot = _snapshots(owner, at).first()
+    return _balance(owner, snapshot, _postings(owner, snapshot, at).aggregate(total=Sum('amount'))['total'])
+
+
+async def abalance_at(account=None, book=None, at=None):
+    owner = _owner(account, book)
+    snapshot = await _snapshots(owner, at).afirst()
+    totals = await _postings(owner, snapshot, at).aaggregate(total=Sum('amount'))
+    return _balance(owner, snapshot, totals['total'])
+
+
+def snapshot_accounts(accounts=None, chunk_size=500):
+    """Snapshot ``accounts`` (default: all) that have postings since their last snapshot.
+
+    Returns how many were snapshotted and the accounts whose balance column
+    differs from the journal.
+    """
+    accounts = UserBankAccount.objects.all() if accounts is None else accounts
+    latest = BalanceSnapshot.objects.filter(account=OuterRef('pk')).order_by('-through').values('pk')[:1]
+    pks = list(accounts.order_by('pk').values_list('pk', flat=True))
+    taken, mismatched = 0, []
+    for start in range(0, len(pks), chunk_size):
+        with transaction.atomic():
+            # Postings move the balance first, so with these rows locked every posting to them has committed.
+            rows = list(
+                UserBankAccount.objects.select_for_update().filter(pk__in=pks[start:start + chunk_size])
+                .order_by('pk').annotate(snapshot=Subquery(latest))
+                .values_list('pk', 'account_no', 'balance', 'snapshot')
+            )
+            locked = {pk: (account_no, balance) for pk, account_no, balance, _ in rows}
+            previous = BalanceSnapshot.objects.in_bulk([snapshot for *_, snapshot in rows if snapshot is not None])
+            previous = {snapshot.account_id: snapshot for snapshot in previous.values()}
+            since = reduce(or_, (
+                Q(account_id=pk, pk__gt=previous[pk].through if pk in previous else 0) for pk in locked
+            ), Q(pk__in=[]))
+            moved = (
+                JournalPosting.objects.filter(since).values('account_id')
+                .annotate(total=Sum('amount'), through=Max('pk'), last=Max('timestamp'))
+                .values_list('account_id', 'total', 'through', 'last')
+            )
+            snapshots = []
+            for pk, total, through, last in moved:
+                before = previous.get(pk)
+                snapshots.append(BalanceSnapshot(
+                    account_id=pk,
+                    through=through,
+                    timestamp=max(last, before.timestamp) if before else last,
+                    balance=(before.balance if before else Decimal(0)) - total,
+                ))
+            BalanceSnapshot.objects.bulk_create(snapshots)
+            current = {snapshot.account_id: snapshot.balance for snapshot in snapshots}
+            for pk, (account_no, balance) in locked.items():
+                journal = current[pk] if pk in current else previous[pk].balance if pk in previous else Decimal(0)
+                if journal != balance:
+                    mismatched.append({'account_no': account_no, 'balance': balance, 'journal': journal})
+            taken += len(snapshots)
+    return taken, mismatched
+
+
+def snapshot_books():
+    """Snapshot every book with postings since its last snapshot; returns how many were snapshotted."""
+    taken = 0
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Nothing serializes book postings, so wait for the ones in flight and hold off new ones meanwhile.
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {JournalPosting._meta.db_table} IN SHARE MODE')
+        for name, _ in BOOKS:
+            before = _snapshots({'book': name}, None).first()
+            moved = _postings({'book': name}, before, None).aggregate(
+                total=Sum('amount'), through=Max('pk'), last=Max('timestamp'),
+            )
+            if moved['through'] is None:
+                continue
+            BalanceSnapshot.objects.create(
+                book=name,
+                through=moved['through'],
+                timestamp=max(moved['last'], before.timestamp) if before else moved['last'],
+                balance=(before.balance if before else Decimal(0)) + moved['total'],
+            )
+            taken += 1
+    return taken
@@ -0,0 +1,240 @@
+"""
+Bulk import of historical transactions.
+
+Rows stream through parsing and validation and are written in batches with
+COPY on PostgreSQL, or one prepared INSERT run over the whole batch elsewhere.
+Each batch commits together with its ``LedgerImport`` checkpoint, so an
+interrupted import resumes after the last committed row. Imported rows are appended after each
+account's current balance, and ``UserBankAccount.balance`` is moved once per
+account when the file is finished, together with its loan counters. The
+journal gets one opening-balance entry for the whole file then.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from operator import itemgetter
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from . import journal
+from .constants import TRANSACTION_TYPE
+from .models import LedgerImport, Transaction
+from .rollups import history_effect, rebuild_account
+from .services import reconcile_loan_counters
+
+COLUMNS = ['account_id', 'amount', 'balance_after_transaction', 'transaction_type', 'timestamp', 'loan_approve']
+TYPES = {str(value): value for value, _ in TRANSACTION_TYPE}
+TYPES.update({label: value for value, label in TRANSACTION_TYPE})
+TYPES.update({label.lower(): value for value, label in TRANSACTION_TYPE})
+CENT = Decimal('0.01')
+
+
+class InvalidRow(Exception):
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+
+
+class InvalidHeader(ValueError):
+    pass
+
+
+FIELDS = ['account_no', 'timestamp', 'transaction_type', 'amount', 'loan_approve']
+REQUIRED = FIELDS[:-1]
+
+
+def read_rows(path, fmt):
+    """Yield ``(line, values)`` with values ordered like ``FIELDS``.
+
+    A line that cannot be read at all yields an ``InvalidRow`` in place of
+    its values, so it is rejected like any other invalid row.
+    """
+    with open(path, newline='') as source:
+        if fmt == 'csv':
+            reader = csv.reader(source)
+            header = next(reader, [])
+            missing = [field for field in REQUIRED if field not in header]
+            if missing:
+                raise InvalidHeader(f'{path} has no {", ".join(missing)} column')
+            positions = [header.index(field) for field in FIELDS if field in header]
+            pick = itemgetter(*positions)
+            for line, values in enumerate(reader, start=2):
+                try:
+                    yield line, pick(values)
+                except IndexError:
+                    yield line, ()
+        else:
+            for line, raw in enumerate(source, start=1):
+                if raw.strip():
+                    try:
+                        row = json.loads(raw)
+                    except json.JSONDecodeError as exc:
+                        yield line, InvalidRow(line, f'invalid JSON: {exc}')
+                        continue
+                    if isinstance(row, dict):
+                        yield line, tuple(row.get(field) for field in FIELDS)
+                    else:
+                        yield line, InvalidRow(line, f'expected a JSON object, not {type(row).__name__}')
+
+
+def parse_row(line, values):
+    try:
+        account_no, timestamp, transaction_type, amount, *loan_approve = values
+        account_no = int(account_no)
+        amount = Decimal(amount if isinstance(amount, str) else str(amount))
+        timestamp = datetime.fromisoformat(timestamp)
+        transaction_type = TYPES.get(transaction_type) or TYPES[str(transaction_type).strip().lower()]
+    except KeyError as exc:
+        raise InvalidRow(line, f'unknown transaction type {exc}')
+    except (TypeError, ValueError, InvalidOperation) as exc:
+        raise InvalidRow(line, str(exc) or f'expected the columns {", ".join(FIELDS)}')
+    if amount <= 0 or amount.quantize(CENT) != amount:
+        raise InvalidRow(line, f'amount {amount} must be positive with at most two decimals')
+    if timestamp.tzinfo is None:
+        timestamp = timezone.make_aware(timestamp)
+    if timestamp.utcoffset():
+        timestamp = timestamp.astimezone(dt_timezone.utc)
+    loan_approve = bool(loan_approve) and str(loan_approve[0]).lower() in ('1', 'true', 'yes')
+    return line, account_no, amount, timestamp, transaction_type, loan_approve
+
+
+class LedgerImporter:
+    def __init__(self, source, batch_size=20000, skip_invalid=False, use_copy=True, log=None):
+        self.source = source
+        self.batch_size = batch_size
+        self.skip_invalid = skip_invalid
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.log = log or (lambda message: None)
+        self.skipped = 0
+        self.checkpoint, _ = LedgerImport.objects.get_or_create(source=source)
+        state = self.checkpoint.state
+        self.opening = {int(pk): Decimal(value) for pk, value in state.get('opening', {}).items()}
+        self.balances = {int(pk): Decimal(value) for pk, value in state.get('balances', {}).items()}
+        self.last_seen = {int(pk): datetime.fromisoformat(value) for pk, value in state.get('last_seen', {}).items()}
+        self.account_ids = {}
+        if connection.vendor == 'sqlite':
+            # parse_row() already moved timestamps to UTC, so this is the text
+            # adapt_datetimefield_value() produces, without its per-row checks.
+            self.adapt_timestamp = lambda value: value.isoformat(' ')[:-6]
+        elif connection.vendor == 'postgresql':
+            self.adapt_timestamp = datetime.isoformat
+        else:
+            self.adapt_timestamp = connection.ops.adapt_datetimefield_value
+
+    def run(self, rows):
+        if self.checkpoint.finished:
+            return self.checkpoint.imported
+        rows = self.parse(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.write_batch(batch)
+        self.finish()
+        return self.checkpoint.imported
+
+    def parse(self, rows):
+        for line, row in rows:
+            if line <= self.checkpoint.line:
+                continue
+            try:
+                if isinstance(row, InvalidRow):
+                    raise row
+                yield parse_row(line, row)
+            except InvalidRow as exc:
+                self.reject(exc)
+
+    def reject(self, exc):
+        if not self.skip_invalid:
+            raise exc
+        self.skipped += 1
+        self.log(f'skipped {exc}')
+
+    def resolve_accounts(self, batch):
+        missing = {row[1] for row in batch} - self.account_ids.keys()
+        if missing:
+            for pk, account_no, balance in UserBankAccount.objects.filter(account_no__in=missing).values_list(
+                'pk', 'account_no', 'balance'
+            ):
+                self.account_ids[account_no] = pk
+                self.opening.setdefault(pk, balance)
+                self.balances.setdefault(pk, balance)
+
+    def chain(self, batch):
+        self.resolve_accounts(batch)
+        records = []
+        for line, account_no, amount, timestamp, transaction_type, loan_approve in batch:
+            pk = self.account_ids.get(account_no)
+            try:
+                if pk is None:
+                    raise InvalidRow(line, f'account {account_no} does not exist')
+                if pk in self.last_seen and timestamp < self.last_seen[pk]:
+                    raise InvalidRow(line, f'timestamp {timestamp} is earlier than the previous row of account {account_no}')
+                balance = self.balances[pk] + history_effect(transaction_type, amount, loan_approve)
+                if balance < 0:
+                    raise InvalidRow(line, f'balance of account {account_no} would drop to {balance}')
+            except InvalidRow as exc:
+                self.reject(exc)
+                continue
+            self.balances[pk] = balance
+            self.last_seen[pk] = timestamp
+            records.append((pk, str(amount), str(balance), transaction_type, self.adapt_timestamp(timestamp), loan_approve))
+        return records
+
+    def write_batch(self, batch):
+        records = self.chain(batch)
+        with transaction.atomic():
+            if self.use_copy:
+                self.copy(records)
+            else:
+                self.insert(records)
+            self.checkpoint.line = batch[-1][0]
+            self.checkpoint.imported += len(records)
+            self.checkpoint.state = {
+                'opening': {pk: str(value) for pk, value in self.opening.items()},
+                'balances': {pk: str(value) for pk, value in self.balances.items()},
+                'last_seen': {pk: value.isoformat() for pk, value in self.last_seen.items()},
+            }
+            self.checkpoint.save()
+        self.log(f'imported {self.checkpoint.imported} rows (line {self.checkpoint.line})')
+
+    def insert(self, records):
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        sql = f'INSERT INTO {table} ({", ".join(COLUMNS)}) VALUES ({", ".join(["%s"] * len(COLUMNS))})'
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, records)
+
+    def copy(self, records):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(records)
+        buffer.seek(0)
+        sql = f'COPY {Transaction._meta.db_table} ({", ".join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)'
+        with connection.cursor() as cursor:
+            if hasattr(cursor, 'copy_expert'):
+                cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    def finish(self):
+        with transaction.atomic():
+            for pk, balance in self.balances.items():
+                UserBankAccount.objects.filter(pk=pk).update(
+                    balance=F('balance') + balance - self.opening[pk], version=F('version') + 1,
+                )
+            journal.open_balances(
+                timezone.now(), {pk: balance - self.opening[pk] for pk, balance in self.balances.items()},
+            )
+            reconcile_loan_counters(UserBankAccount.objects.filter(pk__in=self.balances))
+            self.checkpoint.finished = True
+            self.checkpoint.save()
+
+    def rebuild_rollups(self):
+        for account in UserBankAccount.objects.filter(pk__in=self.balances):
+            rebuild_account(account)
@@ -0,0 +1,33 @@
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions.interest import accrue_interest
+
+
+class Command(BaseCommand):
+    help = (
+        'Credit end-of-day interest to every Savings account (or the given ones) for a business date. '
+        'Accounts already credited for that date are skipped, so the command is safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_no', nargs='*', type=int)
+        parser.add_argument('--date', type=date.fromisoformat, help='Business date (YYYY-MM-DD); defaults to today.')
+        parser.add_argument('--rate', type=Decimal, default=settings.SAVINGS_INTEREST_RATE,
+                            help='Annual interest rate, e.g. 0.035.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Accounts per transaction.')
+
+    def handle(self, *args, **options):
+        business_date = options['date'] or timezone.localdate()
+        accounts = None
+        if options['account_no']:
+            accounts = UserBankAccount.objects.filter(account_no__in=options['account_no'])
+        covered, credited, total = accrue_interest(business_date, options['rate'], options['chunk_size'], accounts)
+        self.stdout.write(
+            f'{business_date:%Y-%m-%d}: credited {total} interest to {credited} of {covered} Savings accounts'
+        )
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions.archive import archive_account
+from transactions.constants import LOAN
+from transactions.models import Transaction
+from transactions.partitions import month_start
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the transactions of every account (or the given ones) from the months before the archive age '
+        'into its compressed archive file. Open loans stay in the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_no', nargs='*', type=int)
+        parser.add_argument('--days', type=int, default=settings.TRANSACTION_ARCHIVE_AFTER_DAYS,
+                            help='Archive whole months that ended at least this many days ago.')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = month_start(timezone.now() - timedelta(days=options['days']))
+        pending = Transaction.objects.filter(timestamp__lt=cutoff).exclude(transaction_type=LOAN)
+        accounts = UserBankAccount.objects.filter(pk__in=pending.values('account_id')).order_by('pk')
+        if options['account_no']:
+            accounts = accounts.filter(account_no__in=options['account_no'])
+        total = 0
+        for account in accounts.iterator():
+            moved = archive_account(account, cutoff, options['chunk_size'])
+            total += moved
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{account}: {moved} transactions')
+        self.stdout.write(f'archived {total} transactions from before {cutoff:%Y-%m-%d}')
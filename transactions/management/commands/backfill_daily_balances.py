@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserBankAccount
+from transactions.rollups import rebuild_account
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-day balance rollup of every account (or the given ones) from its transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_no', nargs='*', type=int)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        accounts = UserBankAccount.objects.order_by('pk')
+        if options['account_no']:
+            accounts = accounts.filter(account_no__in=options['account_no'])
+        total = 0
+        for account in accounts.iterator():
+            days = rebuild_account(account, options['chunk_size'])
+            total += days
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{account}: {days} days')
+        self.stdout.write(f'rebuilt {total} daily balances')
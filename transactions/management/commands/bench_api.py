@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from transactions.bench import BenchCommand
+from transactions.management.commands.bench_endpoints import percentile
+from transactions.seed import create_accounts, delete_users, seed_transactions
+
+SERVERS = {
+    'wsgi': lambda port, threads: [
+        sys.executable, '-m', 'gunicorn', 'islamiyahtech_bank.wsgi:application', '--bind', f'127.0.0.1:{port}',
+        '--workers', '1', '--worker-class', 'gthread', '--threads', str(threads), '--log-level', 'warning',
+    ],
+    'asgi': lambda port, threads: [
+        sys.executable, '-m', 'uvicorn', 'islamiyahtech_bank.asgi:application', '--port', str(port),
+        '--workers', '1', '--log-level', 'warning',
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'The server exited with status {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f'Nothing listens on port {port} after {timeout}s.')
+
+
+async def fetch(port, path, cookie, delay):
+    """One GET over a fresh connection; a slow client waits ``delay`` before finishing its headers."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {settings.SESSION_COOKIE_NAME}={cookie}\r\n'
+            'Connection: close\r\n'.encode()
+        )
+        await writer.drain()
+        if delay:
+            await asyncio.sleep(delay)
+        writer.write(b'\r\n')
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        await reader.read()
+        return status
+    finally:
+        writer.close()
+
+
+class Command(BenchCommand):
+    help = (
+        'Compare concurrent-client throughput of the HTML views under gunicorn (WSGI, one gthread worker) '
+        'with the async JSON API under uvicorn (ASGI, one worker), with optionally slow clients. '
+        'Needs a database both servers can reach, such as PostgreSQL or an SQLite file.'
+    )
+    rolled_back = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--transactions', type=int, default=200, help='Seeded transactions per account.')
+        parser.add_argument('--clients', type=int, default=100, help='Concurrent clients.')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per server and endpoint.')
+        parser.add_argument('--slow', type=float, default=0.2,
+                            help='Seconds each client waits before finishing its request headers.')
+        parser.add_argument('--threads', type=int, default=8, help='Threads of the WSGI worker.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark customers afterwards.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError('The servers cannot share an in-memory SQLite database.')
+        accounts = create_accounts(options['users'], prefix='bench-api', balance=Decimal('1000000.00'))
+        try:
+            start = timezone.now() - timedelta(days=30)
+            for account in accounts:
+                seed_transactions(account, options['transactions'], start=start, step=timedelta(hours=1))
+            cookies = [self.session(account.user) for account in accounts]
+            pairs = {
+                'transactions': {'wsgi': reverse('transaction_report'), 'asgi': reverse('api_transactions')},
+                'loans': {'wsgi': reverse('loan_list'), 'asgi': reverse('api_loans')},
+            }
+            report = {
+                'started': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'clients': options['clients'],
+                'slow_seconds': options['slow'],
+                'wsgi_threads': options['threads'],
+                'endpoints': {name: {} for name in pairs},
+            }
+            connection.close()
+            for server, command in SERVERS.items():
+                port = free_port()
+                process = subprocess.Popen(command(port, options['threads']), env=os.environ.copy())
+                try:
+                    wait_for(port, process)
+                    for name, paths in pairs.items():
+                        report['endpoints'][name][server] = asyncio.run(
+                            self.drive(port, paths[server], cookies, options['clients'], options['requests'],
+                                       options['slow'])
+                        )
+                finally:
+                    process.terminate()
+                    process.wait()
+        finally:
+            if not options['keep']:
+                delete_users(User.objects.filter(username__startswith='bench-api-'))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as target:
+                target.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def session(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    async def drive(self, port, path, cookies, clients, requests, slow):
+        latencies, errors = [], Counter()
+        remaining = iter(range(requests))
+
+        async def client(i):
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    status = await fetch(port, path, cookies[i % len(cookies)], slow)
+                except OSError as exc:
+                    errors[type(exc).__name__] += 1
+                    continue
+                if status >= 400:
+                    errors[f'HTTP {status}'] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[client(i) for i in range(clients)])
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        result = {
+            'requests': requests,
+            'errors': dict(errors),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+        }
+        if latencies:
+            result['latency_ms'] = {
+                label: round(percentile(latencies, fraction) * 1000, 2)
+                for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1))
+            }
+        return result
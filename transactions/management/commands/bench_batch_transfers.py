@@ -0,0 +1,55 @@
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import UserBankAccount
+from transactions.bench import BenchCommand
+from transactions.seed import create_accounts
+from transactions.services import batch_transfer, transfer
+
+
+class Command(BenchCommand):
+    help = (
+        'Pay a payroll from one account to many, once as a batch transfer and once as one transfer per '
+        'recipient, and compare throughput and SQL queries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=5000)
+        parser.add_argument('--amount', type=Decimal, default=Decimal('1500.00'))
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark accounts afterwards.')
+
+    def handle(self, *args, **options):
+        count, amount = options['recipients'], options['amount']
+        funds = amount * count * 2
+        [sender] = create_accounts(1, prefix='bench-payroll-sender', balance=funds)
+        recipients = create_accounts(count, prefix='bench-payroll', balance=Decimal('0.00'))
+        lines = [(recipient.account_no, amount) for recipient in recipients]
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            batch_transfer(sender, lines, chunk_size=options['chunk_size'])
+            batched = time.perf_counter() - started
+        batch_queries = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for recipient in recipients:
+                transfer(sender, recipient, amount)
+            single = time.perf_counter() - started
+        single_queries = len(queries)
+
+        balances = dict(UserBankAccount.objects.filter(pk__in=[sender.pk, *(r.pk for r in recipients)])
+                        .values_list('pk', 'balance'))
+        exact = balances.pop(sender.pk) == 0 and set(balances.values()) == {amount * 2}
+
+        self.stdout.write(f'recipients: {count}')
+        self.stdout.write(f'batch:      {batched:.3f}s, {count / batched:,.0f} lines/s, {batch_queries} queries')
+        self.stdout.write(f'single:     {single:.3f}s, {count / single:,.0f} lines/s, {single_queries} queries')
+        self.stdout.write(f'speedup:    {single / batched:.1f}x')
+        if exact:
+            self.stdout.write(self.style.SUCCESS('balances:   exact'))
+        else:
+            self.stdout.write(self.style.ERROR('balances:   DRIFT'))
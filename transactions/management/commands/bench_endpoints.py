@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserAddress
+from transactions.bench import BenchCommand
+from transactions.constants import DEPOSIT, LOAN, TRANSFER_TO_OTHER, WITHDRAWAL
+from transactions.models import Transaction
+from transactions.rollups import rebuild_account
+from transactions.seed import create_accounts, delete_users, seed_transactions
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return values[max(0, min(len(values) - 1, round(fraction * len(values)) - 1))]
+
+
+def endpoints(recipients):
+    """Map each endpoint name to ``(method, url, data)`` where ``data`` builds the POST body for a client."""
+    return {
+        'deposit': ('post', reverse('deposit_money'), lambda i: {'amount': '100', 'transaction_type': DEPOSIT}),
+        'withdraw': ('post', reverse('withdraw_money'), lambda i: {'amount': '500', 'transaction_type': WITHDRAWAL}),
+        'transfer': ('post', reverse('transfer_money'), lambda i: {
+            'amount': '150', 'transaction_type': TRANSFER_TO_OTHER, 'recipient_account': recipients[i],
+        }),
+        'loan_request': ('post', reverse('loan_request'), lambda i: {'amount': '1000', 'transaction_type': LOAN}),
+        'loan_list': ('get', reverse('loan_list'), None),
+        'report': ('get', reverse('transaction_report'), None),
+        'profile': ('get', reverse('profile'), None),
+    }
+
+
+class Command(BenchCommand):
+    help = (
+        'Seed benchmark customers, drive the banking views with concurrent clients and report latency '
+        'percentiles, throughput and SQL query counts per endpoint as JSON.'
+    )
+    rolled_back = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--transactions', type=int, default=1000, help='Seeded transactions per account.')
+        parser.add_argument('--clients', type=int, default=4, help='Concurrent clients per endpoint.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help='Only run this endpoint, repeatable.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark customers afterwards.')
+
+    def handle(self, *args, **options):
+        if options['users'] < max(2, options['clients']):
+            raise CommandError('--users must be at least 2 and at least --clients.')
+        setup_test_environment()
+        try:
+            accounts = self.seed(options['users'], options['transactions'])
+            recipients = [accounts[(i + 1) % len(accounts)].account_no for i in range(len(accounts))]
+            selected = endpoints(recipients)
+            for name in options['endpoints'] or []:
+                if name not in selected:
+                    raise CommandError(f'Unknown endpoint {name}, choose from {", ".join(selected)}.')
+            report = {
+                'started': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'users': options['users'],
+                'transactions_per_account': options['transactions'],
+                'clients': options['clients'],
+                'endpoints': {
+                    name: self.drive(accounts, *endpoint, options['clients'], options['requests'])
+                    for name, endpoint in selected.items()
+                    if not options['endpoints'] or name in options['endpoints']
+                },
+            }
+        finally:
+            teardown_test_environment()
+            if not options['keep']:
+                delete_users(User.objects.filter(username__startswith='bench-load-'))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as target:
+                target.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def seed(self, users, transactions):
+        accounts = create_accounts(users, prefix='bench-load', balance=Decimal('1000000.00'))
+        UserAddress.objects.bulk_create([
+            UserAddress(user=account.user, street_address='1 Bench Road', city='Dhaka', postal_code=1200,
+                        country='Bangladesh')
+            for account in accounts
+        ])
+        start = timezone.now() - timedelta(days=30)
+        for account in accounts:
+            seed_transactions(account, transactions, start=start, step=timedelta(days=30) / max(transactions, 1))
+            Transaction.objects.bulk_create([
+                Transaction(account=account, amount=1000, balance_after_transaction=account.balance,
+                            transaction_type=LOAN, loan_approve=False)
+                for _ in range(3)
+            ])
+            rebuild_account(account)
+        return accounts
+
+    def drive(self, accounts, method, url, data, clients, requests):
+        latencies, queries, errors = [], [], Counter()
+        lock = threading.Lock()
+
+        def run(i, count):
+            client = Client()
+            client.force_login(accounts[i].user)
+            timings, counts, failed = [], [], Counter()
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    try:
+                        with CaptureQueriesContext(connection) as captured:
+                            if method == 'post':
+                                response = client.post(url, data(i))
+                            else:
+                                response = client.get(url)
+                        if response.status_code >= 400:
+                            failed[f'HTTP {response.status_code}'] += 1
+                    except Exception as exc:
+                        failed[type(exc).__name__] += 1
+                        continue
+                    timings.append(time.perf_counter() - started)
+                    counts.append(len(captured))
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(timings)
+                queries.extend(counts)
+                errors.update(failed)
+
+        threads = [
+            threading.Thread(target=run, args=(i, requests // clients + (i < requests % clients)))
+            for i in range(clients)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        result = {
+            'requests': requests,
+            'errors': dict(errors),
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+        }
+        if latencies:
+            result['latency_ms'] = {
+                label: round(percentile(latencies, fraction) * 1000, 2)
+                for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1))
+            }
+            result['queries'] = {'mean': round(sum(queries) / len(queries), 1), 'max': max(queries)}
+        return result
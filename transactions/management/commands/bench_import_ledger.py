@@ -0,0 +1,43 @@
+import csv
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from transactions.bench import BenchCommand
+from transactions.models import LedgerImport
+from transactions.seed import create_accounts
+
+
+class Command(BenchCommand):
+    help = 'Generate a synthetic ledger file and time import_ledger on it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500_000)
+        parser.add_argument('--accounts', type=int, default=100)
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument('--keep', action='store_true', help='Keep the imported accounts afterwards.')
+
+    def handle(self, *args, **options):
+        accounts = create_accounts(options['accounts'], prefix='bench-import')
+        start = timezone.now() - timedelta(seconds=options['rows'])
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(['account_no', 'timestamp', 'transaction_type', 'amount'])
+            for i in range(options['rows']):
+                account = accounts[i % len(accounts)]
+                row_type, amount = ('Withdrawal', '40.00') if i // len(accounts) % 3 == 2 else ('Deposite', '100.00')
+                writer.writerow([account.account_no, (start + timedelta(seconds=i)).isoformat(), row_type, amount])
+
+        try:
+            started = time.perf_counter()
+            call_command('import_ledger', path, '--skip-rollups', '--batch-size', options['batch_size'], stdout=self.stdout)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'end to end: {options["rows"] / elapsed:,.0f} rows/s ({elapsed:.2f}s)')
+        finally:
+            os.unlink(path)
+            LedgerImport.objects.filter(source=path).delete()
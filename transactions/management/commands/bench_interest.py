@@ -0,0 +1,85 @@
+import time
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions.bench import BenchCommand
+from transactions.constants import INTEREST
+from transactions.interest import accrue_interest
+from transactions.models import Transaction
+from transactions.seed import create_accounts
+
+CENT = Decimal('0.01')
+
+
+def balances(accounts):
+    for account in accounts:
+        account.balance = Decimal(account.account_no * 7919 % 10_000_000).scaleb(-2)
+    UserBankAccount.objects.bulk_update(accounts, ['balance'], batch_size=1000)
+
+
+def interest(balance, rate):
+    return (balance * rate / settings.INTEREST_DAY_COUNT).quantize(CENT, rounding=ROUND_HALF_EVEN)
+
+
+class Command(BenchCommand):
+    help = (
+        "Accrue a day's interest on Savings accounts with the batch engine and with one save() per account, "
+        'compare accounts per second, and check the amounts and that a re-run credits nothing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=20000)
+        parser.add_argument('--naive', type=int, default=1000, help='Accounts for the one-save()-per-account run.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark accounts afterwards.')
+
+    def handle(self, *args, **options):
+        count, rate, today = options['accounts'], settings.SAVINGS_INTEREST_RATE, timezone.localdate()
+        accounts = create_accounts(count, prefix='bench-interest', account_type='Savings')
+        naive = create_accounts(options['naive'], prefix='bench-interest-naive', account_type='Savings')
+        balances(accounts)
+        balances(naive)
+        opening = {account.pk: account.balance for account in accounts}
+        numbers = (accounts[0].account_no, accounts[-1].account_no)
+        scope = UserBankAccount.objects.filter(account_no__range=numbers)
+
+        started = time.perf_counter()
+        covered, credited, total = accrue_interest(today, rate, options['chunk_size'], scope)
+        batched = time.perf_counter() - started
+        rerun = accrue_interest(today, rate, options['chunk_size'], scope)
+
+        started = time.perf_counter()
+        for account in naive:
+            with transaction.atomic():
+                account = UserBankAccount.objects.select_for_update().get(pk=account.pk)
+                amount = interest(account.balance, rate)
+                account.balance += amount
+                account.interest_accrued_through = today
+                account.save()
+                if amount:
+                    Transaction.objects.create(account=account, amount=amount, transaction_type=INTEREST,
+                                               balance_after_transaction=account.balance)
+        single = time.perf_counter() - started
+
+        exact = all(
+            balance == opening[pk] + interest(opening[pk], rate)
+            for pk, balance in scope.values_list('pk', 'balance')
+        )
+
+        self.stdout.write(f'accounts:   {covered} ({credited} credited, {total} interest)')
+        self.stdout.write(f'batch:      {batched:.3f}s, {covered / batched:,.0f} accounts/s')
+        self.stdout.write(f'save():     {single:.3f}s, {len(naive) / single:,.0f} accounts/s '
+                          f'({len(naive)} accounts)')
+        self.stdout.write(f'speedup:    {covered / batched / (len(naive) / single):.1f}x')
+        if exact:
+            self.stdout.write(self.style.SUCCESS('amounts:    exact'))
+        else:
+            self.stdout.write(self.style.ERROR('amounts:    DRIFT'))
+        if rerun[0] == 0:
+            self.stdout.write(self.style.SUCCESS('re-run:     credited nothing'))
+        else:
+            self.stdout.write(self.style.ERROR(f're-run:     covered {rerun[0]} accounts again'))
@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions import journal
+from transactions.bench import BenchCommand
+from transactions.constants import CASH, DEPOSIT
+from transactions.models import JournalPosting
+from transactions.seed import create_accounts
+
+
+class Command(BenchCommand):
+    help = (
+        'Give one account a long journal history and time reading its balance by summing every posting '
+        'against reading it from a snapshot plus the postings since.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--postings', type=int, default=200000)
+        parser.add_argument('--after-snapshot', type=int, default=100, help='Postings written after the snapshot.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark account afterwards.')
+
+    def write(self, account, count, start, batch_size=5000):
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            journal.record(DEPOSIT, start + timedelta(seconds=offset), [
+                *(journal.customer(account.pk, Decimal('1.00')) for _ in range(size)),
+                journal.book(CASH, Decimal(size)),
+            ], batch_size=batch_size)
+
+    def timed(self, read, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            value = read()
+        return value, (time.perf_counter() - started) / repeat * 1000
+
+    def handle(self, *args, **options):
+        [account] = create_accounts(1, prefix='bench-journal')
+        now = timezone.now()
+        self.write(account, options['postings'], now - timedelta(days=30))
+        journal.snapshot_accounts(UserBankAccount.objects.filter(pk=account.pk))
+        self.write(account, options['after_snapshot'], now)
+
+        replayed, full = self.timed(
+            lambda: -JournalPosting.objects.filter(account=account).aggregate(total=Sum('amount'))['total'],
+            options['repeat'],
+        )
+        derived, snapshot = self.timed(lambda: journal.balance_at(account), options['repeat'])
+
+        self.stdout.write(f'postings:   {options["postings"] + options["after_snapshot"]}')
+        self.stdout.write(f'full sum:   {full:.2f} ms')
+        self.stdout.write(f'snapshot:   {snapshot:.2f} ms')
+        self.stdout.write(f'speedup:    {full / snapshot:.0f}x')
+        if replayed == derived:
+            self.stdout.write(self.style.SUCCESS(f'balance:    {derived}, equal'))
+        else:
+            self.stdout.write(self.style.ERROR(f'balance:    {derived} from the snapshot, {replayed} summed'))
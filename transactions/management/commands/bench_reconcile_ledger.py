@@ -0,0 +1,65 @@
+import os
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions.bench import BenchCommand
+from transactions.models import LedgerCheck
+from transactions.reconciliation import reconcile
+from transactions.seed import create_accounts, delete_users, seed_transactions
+
+
+class Command(BenchCommand):
+    help = (
+        'Seed a ledger, break the balances of a few accounts and time reconcile_ledger on it with one worker '
+        'and with a process pool. Needs a database the workers can reach, such as PostgreSQL.'
+    )
+    rolled_back = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--accounts', type=int, default=10_000)
+        parser.add_argument('--drifted', type=int, default=10, help='Accounts whose balance is broken on purpose.')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()])
+        parser.add_argument('--shard-size', type=int, default=250)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded accounts afterwards.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError('Worker processes cannot share an in-memory SQLite database.')
+        per_account = options['rows'] // options['accounts']
+        started = time.perf_counter()
+        accounts = create_accounts(options['accounts'], prefix='bench-ledger', balance=Decimal('1000.00'))
+        start = timezone.now() - timedelta(minutes=per_account)
+        for account in accounts:
+            seed_transactions(account, per_account, start=start)
+        self.stdout.write(f'seeded {per_account * len(accounts):,} rows in {time.perf_counter() - started:.1f}s')
+
+        broken = {account.account_no for account in random.sample(accounts, options['drifted'])}
+        UserBankAccount.objects.filter(account_no__in=broken).update(balance=F('balance') + 1)
+        queryset = UserBankAccount.objects.filter(pk__in=[account.pk for account in accounts]).order_by('pk')
+        try:
+            for workers in options['workers']:
+                LedgerCheck.objects.filter(account__in=queryset).delete()
+                connection.close()
+                started = time.perf_counter()
+                report = reconcile(queryset, workers=workers, shard_size=options['shard_size'])
+                elapsed = time.perf_counter() - started
+                found = {row['account_no'] for row in report['drifted']}
+                self.stdout.write(
+                    f'workers={workers}: {report["transactions"]:,} rows in {elapsed:.1f}s, '
+                    f'{report["transactions"] / elapsed:,.0f} rows/s, '
+                    f'{report["accounts"] / elapsed:,.0f} accounts/s, '
+                    f'drift found {"exactly" if found == broken else "WRONG"} ({len(found)}/{len(broken)})'
+                )
+        finally:
+            if not options['keep']:
+                delete_users(User.objects.filter(account__in=accounts))
@@ -0,0 +1,44 @@
+import time
+
+from transactions.bench import BenchCommand
+from transactions.models import Transaction
+from transactions.pagination import encode_cursor, keyset_page
+from transactions.seed import create_accounts, seed_transactions
+
+
+class Command(BenchCommand):
+    help = 'Compare transaction report latency on the first and a deep page, keyset against OFFSET.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded account afterwards.')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        [account] = create_accounts(1, prefix='bench-report')
+        started = time.perf_counter()
+        seed_transactions(account, options['rows'])
+        self.stdout.write(f'seeded {options["rows"]:,} rows in {time.perf_counter() - started:.1f}s')
+
+        queryset = Transaction.objects.filter(account=account)
+        offset = (options['page'] - 1) * page_size
+        boundary = queryset.order_by('timestamp', 'pk')[offset - 1] if offset else None
+        after = encode_cursor(boundary) if boundary else None
+
+        results = {
+            'keyset page 1': lambda: keyset_page(queryset, page_size),
+            f'keyset page {options["page"]}': lambda: keyset_page(queryset, page_size, after=after),
+            'offset page 1': lambda: list(queryset.order_by('timestamp', 'pk')[:page_size]),
+            f'offset page {options["page"]}': lambda: list(queryset.order_by('timestamp', 'pk')[offset:offset + page_size]),
+        }
+        for label, fetch in results.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                fetch()
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(f'{label:<20} median {timings[len(timings) // 2] * 1000:8.2f} ms')
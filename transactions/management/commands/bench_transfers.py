@@ -0,0 +1,82 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+
+from accounts.models import UserBankAccount
+from transactions.bench import BenchCommand
+from transactions.seed import create_accounts, delete_users
+from transactions.services import transfer
+
+
+class Command(BenchCommand):
+    help = 'Run concurrent transfers between a few hot accounts and check that the final balances are exact.'
+    rolled_back = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--accounts', type=int, default=4)
+        parser.add_argument('--amount', type=Decimal, default=Decimal('10.00'))
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark accounts afterwards.')
+
+    def handle(self, *args, **options):
+        accounts = create_accounts(options['accounts'], prefix='bench-transfer', balance=Decimal('1000000.00'))
+        try:
+            opening = {account.pk: account.balance for account in accounts}
+            rng = random.Random(options['seed'])
+            plan = [tuple(rng.sample(accounts, 2)) for _ in range(options['transfers'])]
+
+            expected = dict(opening)
+            for sender, recipient in plan:
+                expected[sender.pk] -= options['amount']
+                expected[recipient.pk] += options['amount']
+
+            retries = []
+            lock = threading.Lock()
+
+            def run(chunk):
+                retried = 0
+                try:
+                    for sender, recipient in chunk:
+                        while True:
+                            try:
+                                transfer(sender, recipient, options['amount'])
+                                break
+                            except OperationalError:
+                                retried += 1
+                                time.sleep(0.001)
+                finally:
+                    connection.close()
+                    with lock:
+                        retries.append(retried)
+
+            threads = [
+                threading.Thread(target=run, args=(plan[i::options['threads']],))
+                for i in range(options['threads'])
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            final = dict(UserBankAccount.objects.filter(pk__in=opening).values_list('pk', 'balance'))
+            exact = final == expected and sum(final.values()) == sum(opening.values())
+
+            self.stdout.write(f'transfers:  {len(plan)} on {options["threads"]} threads')
+            self.stdout.write(f'elapsed:    {elapsed:.3f}s')
+            self.stdout.write(f'throughput: {len(plan) / elapsed:,.0f} transfers/s')
+            self.stdout.write(f'retries:    {sum(retries)}')
+            if exact:
+                self.stdout.write(self.style.SUCCESS('balances:   exact'))
+            else:
+                self.stdout.write(self.style.ERROR(f'balances:   DRIFT expected={expected} actual={final}'))
+        finally:
+            if not options['keep']:
+                delete_users(User.objects.filter(account__in=accounts))
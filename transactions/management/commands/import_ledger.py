@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.ledger_import import InvalidHeader, InvalidRow, LedgerImporter, read_rows
+from transactions.models import LedgerImport
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical transactions from CSV or JSON Lines with the columns account_no, timestamp, '
+        'transaction_type, amount and optionally loan_approve. Rows of each account must be in time order. '
+        'Re-running the same file resumes from its last committed batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument('--skip-invalid', action='store_true', help='Report and skip invalid rows instead of stopping.')
+        parser.add_argument('--no-copy', action='store_true', help='Use INSERT even on PostgreSQL.')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild daily balances of imported accounts.')
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint of a previous run of this file.')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['restart']:
+            LedgerImport.objects.filter(source=path).delete()
+
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        importer = LedgerImporter(
+            path,
+            batch_size=options['batch_size'],
+            skip_invalid=options['skip_invalid'],
+            use_copy=not options['no_copy'],
+            log=log,
+        )
+        resumed_from = importer.checkpoint.line
+        started = time.perf_counter()
+        try:
+            imported = importer.run(read_rows(path, fmt))
+        except InvalidHeader as exc:
+            raise CommandError(exc)
+        except InvalidRow as exc:
+            raise CommandError(f'{exc} (rows before line {importer.checkpoint.line + 1} are committed; fix the file and re-run to resume)')
+        elapsed = time.perf_counter() - started
+
+        if not options['skip_rollups']:
+            importer.rebuild_rollups()
+
+        if resumed_from:
+            self.stdout.write(f'resumed after line {resumed_from}')
+        self.stdout.write(f'imported {imported} rows into {len(importer.balances)} accounts, skipped {importer.skipped}')
+        self.stdout.write(f'{imported / elapsed if elapsed else 0:,.0f} rows/s')
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from transactions import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the monthly transaction partitions for the coming months (and for any month whose rows sit in '
+        'the default partition) and detach the partitions older than the retention window. PostgreSQL only.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.TRANSACTION_PARTITIONS_AHEAD,
+                            help='Months after the current one to create partitions for.')
+        parser.add_argument('--retain', type=int, default=settings.TRANSACTION_PARTITION_RETENTION,
+                            help='Months before the current one to keep attached; older partitions are detached.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if not partitions.supported(connection):
+            raise CommandError('Transactions are only partitioned on PostgreSQL.')
+        current = partitions.month_start(timezone.now())
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                raise CommandError(f'{partitions.TABLE} is not partitioned; run the migrations first.')
+            existing = partitions.month_partitions(cursor)
+            wanted = {partitions.add_months(current, offset) for offset in range(options['ahead'] + 1)}
+            wanted |= partitions.months_with_rows(cursor, partitions.DEFAULT_PARTITION)
+            for month in sorted(wanted - existing.keys()):
+                name = partitions.partition_name(month)
+                if options['dry_run']:
+                    self.stdout.write(f'would create {name}')
+                    continue
+                moved = partitions.create_partition(cursor, month)
+                existing[month] = name
+                self.stdout.write(f'created {name} ({moved} rows from the default partition)')
+
+            if options['retain'] is None:
+                return
+            cutoff = partitions.add_months(current, -options['retain'])
+            for month, name in sorted(existing.items()):
+                if month >= cutoff:
+                    break
+                if partitions.holds_open_loans(cursor, name):
+                    self.stdout.write(f'kept {name}: it holds open loans')
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f'would detach {name}')
+                    continue
+                partitions.detach_partition(cursor, name)
+                self.stdout.write(f'detached {name}')
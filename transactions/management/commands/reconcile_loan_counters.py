@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserBankAccount
+from transactions.services import reconcile_loan_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the loan counters of every account (or the given ones) from its loan transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_no', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        accounts = UserBankAccount.objects.all()
+        if options['account_no']:
+            accounts = accounts.filter(account_no__in=options['account_no'])
+        self.stdout.write(f'fixed loan counters of {reconcile_loan_counters(accounts)} accounts')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserBankAccount
+from transactions.journal import snapshot_accounts, snapshot_books
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot the journal balance of every account (or the given ones) and of the bank\'s books, so '
+        'balance reads only add up the postings since. Reports accounts whose balance differs from the journal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_no', nargs='*', type=int)
+        parser.add_argument('--chunk-size', type=int, default=500, help='Accounts locked per transaction.')
+
+    def handle(self, *args, **options):
+        accounts = None
+        if options['account_no']:
+            accounts = UserBankAccount.objects.filter(account_no__in=options['account_no'])
+        taken, mismatched = snapshot_accounts(accounts, options['chunk_size'])
+        books = 0 if accounts is not None else snapshot_books()
+        self.stdout.write(f'snapshotted {taken} accounts and {books} books')
+        for row in mismatched:
+            self.stdout.write(self.style.ERROR(
+                f'{row["account_no"]}: balance {row["balance"]}, journal {row["journal"]}'
+            ))
@@ -0,0 +1,22 @@
+# Generated by Django 5.0 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_bank_name'),
+        ('transactions', '0003_transaction_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'timestamp', 'id'], name='txn_account_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('transaction_type', 3)), fields=['account', 'loan_approve'], name='txn_account_loan_idx'),
+        ),
+    ]
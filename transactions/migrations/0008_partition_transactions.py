@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-16 23:50
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def partition(apps, schema_editor):
+    from transactions import partitions
+    if partitions.supported(schema_editor.connection):
+        with schema_editor.connection.cursor() as cursor:
+            partitions.partition_table(cursor, timezone.now(), ahead=3)
+
+
+def unpartition(apps, schema_editor):
+    from transactions import partitions
+    if partitions.supported(schema_editor.connection):
+        with schema_editor.connection.cursor() as cursor:
+            partitions.unpartition_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition, elidable=False),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0 on 2026-10-16 23:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_account_archived_until'),
+        ('transactions', '0008_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('offset', models.PositiveBigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_blocks', to='accounts.userbankaccount')),
+            ],
+            options={
+                'ordering': ['first_timestamp', 'pk'],
+                'indexes': [models.Index(fields=['account', 'last_timestamp'], name='archive_account_last_idx')],
+            },
+        ),
+    ]
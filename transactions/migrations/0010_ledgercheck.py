@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-16 23:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_account_archived_until'),
+        ('transactions', '0009_archivedblock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheck',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger_check', serialize=False, to='accounts.userbankaccount')),
+                ('version', models.PositiveBigIntegerField()),
+                ('drift', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('chain_breaks', models.PositiveIntegerField()),
+                ('checked_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2 on 2026-10-17 00:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def open_balances(apps, schema_editor):
+    """Start the journal with one opening-balance entry holding every account's current balance."""
+    UserBankAccount = apps.get_model('accounts', 'UserBankAccount')
+    JournalEntry = apps.get_model('transactions', 'JournalEntry')
+    JournalPosting = apps.get_model('transactions', 'JournalPosting')
+    accounts = UserBankAccount.objects.exclude(balance=0)
+    total = accounts.aggregate(total=Sum('balance'))['total']
+    if total is None:
+        return
+    now = timezone.now()
+    entry = JournalEntry.objects.create(kind=None, timestamp=now)
+    JournalPosting.objects.bulk_create(
+        (JournalPosting(entry=entry, account_id=pk, amount=-balance, timestamp=now)
+         for pk, balance in accounts.values_list('pk', 'balance').iterator(chunk_size=5000)),
+        batch_size=5000,
+    )
+    JournalPosting.objects.create(entry=entry, book='opening_balances', amount=total, timestamp=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_account_interest_accrued_through'),
+        ('transactions', '0011_interest_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.IntegerField(choices=[(1, 'Deposite'), (2, 'Withdrawal'), (3, 'Loan'), (4, 'Loan Paid'), (5, 'Transfered'), (6, 'Received'), (7, 'Interest')], null=True)),
+                ('timestamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.CharField(blank=True, choices=[('cash', 'Cash'), ('loans', 'Loans receivable'), ('interest_expense', 'Interest expense'), ('opening_balances', 'Opening balances'), ('suspense', 'Suspense')], max_length=20)),
+                ('through', models.PositiveBigIntegerField()),
+                ('timestamp', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('account', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='accounts.userbankaccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'through'], name='snapshot_account_idx'), models.Index(condition=models.Q(('book', ''), _negated=True), fields=['book', 'through'], name='snapshot_book_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='JournalPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.CharField(blank=True, choices=[('cash', 'Cash'), ('loans', 'Loans receivable'), ('interest_expense', 'Interest expense'), ('opening_balances', 'Opening balances'), ('suspense', 'Suspense')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('timestamp', models.DateTimeField()),
+                ('transaction_id', models.BigIntegerField(null=True)),
+                ('account', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='accounts.userbankaccount')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='transactions.journalentry')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'id'], name='posting_account_idx'), models.Index(condition=models.Q(('book', ''), _negated=True), fields=['book', 'id'], name='posting_book_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('account__isnull', False), ('book', '')), models.Q(('account__isnull', True), models.Q(('book', ''), _negated=True)), _connector='OR'), name='posting_account_or_book')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop, elidable=False),
+    ]
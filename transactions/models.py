@@ -1,16 +1,143 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.contrib.auth.models import User
 from accounts.models import UserBankAccount
 # Create your models here.
-from .constants import TRANSACTION_TYPE
+from .constants import BOOKS, LOAN, TRANSACTION_TYPE
 
 class Transaction(models.Model):
-    account = models.ForeignKey(UserBankAccount, related_name = 'transactions', on_delete = models.CASCADE)
+    # Account lookups use txn_account_timestamp_idx, whose first column is the account.
+    account = models.ForeignKey(UserBankAccount, related_name = 'transactions', on_delete = models.CASCADE, db_index=False)
     
     amount = models.DecimalField(decimal_places=2, max_digits = 12)
     balance_after_transaction = models.DecimalField(decimal_places=2, max_digits = 12)
     transaction_type = models.IntegerField(choices=TRANSACTION_TYPE, null = True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     loan_approve = models.BooleanField(default=False) 
     
     class Meta:
-        ordering = ['timestamp'] 
\ No newline at end of file
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['account', 'timestamp', 'id'], name='txn_account_timestamp_idx'),
+            models.Index(fields=['account', 'loan_approve'], condition=Q(transaction_type=LOAN), name='txn_account_loan_idx'),
+        ]
+
+
+class DailyBalance(models.Model):
+    account = models.ForeignKey(UserBankAccount, related_name='daily_balances', on_delete=models.CASCADE)
+    date = models.DateField()
+    opening_balance = models.DecimalField(decimal_places=2, max_digits=12)
+    closing_balance = models.DecimalField(decimal_places=2, max_digits=12)
+    credits = models.DecimalField(decimal_places=2, max_digits=14, default=0)
+    debits = models.DecimalField(decimal_places=2, max_digits=14, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'date'], name='daily_balance_account_date_uniq'),
+        ]
+
+
+class LedgerImport(models.Model):
+    source = models.CharField(max_length=255, unique=True)
+    line = models.PositiveBigIntegerField(default=0)
+    imported = models.PositiveBigIntegerField(default=0)
+    state = models.JSONField(default=dict)
+    finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a money-moving POST, replayed for retries carrying the same key."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.BinaryField(max_length=32)
+    fingerprint = models.BinaryField(max_length=16)
+    status_code = models.PositiveSmallIntegerField()
+    location = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.TextField(blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+
+
+class ArchivedBlock(models.Model):
+    """One compressed month of an account's archive file; ``transactions.archive`` reads it by offset."""
+    account = models.ForeignKey(UserBankAccount, related_name='archived_blocks', on_delete=models.CASCADE)
+    month = models.DateField()
+    offset = models.PositiveBigIntegerField()
+    length = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        ordering = ['first_timestamp', 'pk']
+        indexes = [
+            models.Index(fields=['account', 'last_timestamp'], name='archive_account_last_idx'),
+        ]
+
+
+class LedgerCheck(models.Model):
+    """Outcome of the last ``reconcile_ledger`` replay of an account, and the account version it saw."""
+    account = models.OneToOneField(UserBankAccount, primary_key=True, related_name='ledger_check', on_delete=models.CASCADE)
+    version = models.PositiveBigIntegerField()
+    drift = models.DecimalField(decimal_places=2, max_digits=14)
+    chain_breaks = models.PositiveIntegerField()
+    checked_at = models.DateTimeField()
+
+
+class JournalEntry(models.Model):
+    """One balanced movement of money, written with its postings by ``transactions.journal`` and never changed."""
+    # The transaction type that moved the money; null for opening balances
+    kind = models.IntegerField(choices=TRANSACTION_TYPE, null=True)
+    timestamp = models.DateTimeField()
+
+
+class JournalPosting(models.Model):
+    entry = models.ForeignKey(JournalEntry, related_name='postings', on_delete=models.CASCADE)
+    # Either a customer account or one of the bank's books
+    account = models.ForeignKey(UserBankAccount, null=True, related_name='postings', on_delete=models.CASCADE, db_index=False)
+    book = models.CharField(max_length=20, choices=BOOKS, blank=True)
+    # Debits positive, credits negative; an entry's postings sum to zero
+    amount = models.DecimalField(decimal_places=2, max_digits=14)
+    # The entry's, copied so balance reads stay on this table
+    timestamp = models.DateTimeField()
+    # The Transaction row showing this posting; not a foreign key, as those rows are partitioned and archived
+    transaction_id = models.BigIntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'id'], name='posting_account_idx'),
+            models.Index(fields=['book', 'id'], condition=~Q(book=''), name='posting_book_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(account__isnull=False, book='') | (Q(account__isnull=True) & ~Q(book='')),
+                name='posting_account_or_book',
+            ),
+        ]
+
+
+class BalanceSnapshot(models.Model):
+    """Balance of an account or book over its postings up to ``through``, taken by ``snapshot_balances``."""
+    account = models.ForeignKey(UserBankAccount, null=True, related_name='balance_snapshots', on_delete=models.CASCADE, db_index=False)
+    book = models.CharField(max_length=20, choices=BOOKS, blank=True)
+    # Id of the last posting included, and the latest timestamp among those postings
+    through = models.PositiveBigIntegerField()
+    timestamp = models.DateTimeField()
+    balance = models.DecimalField(decimal_places=2, max_digits=16)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'through'], name='snapshot_account_idx'),
+            models.Index(fields=['book', 'through'], condition=~Q(book=''), name='snapshot_book_idx'),
+        ]
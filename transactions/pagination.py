@@ -0,0 +1,82 @@
+"""
+Keyset pagination over ``(timestamp, id)``.
+
+Pages are addressed by opaque cursors built from the boundary row instead of
+an OFFSET, so every page costs one index range scan however deep it is. The
+row comparison is spelled with a redundant plain bound on ``timestamp`` so the
+planner can use it as an index condition and, on a partitioned table, skip the
+partitions on the far side of the cursor.
+"""
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+
+
+def encode_cursor(row):
+    raw = f'{row.timestamp.isoformat()}|{row.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest('Invalid page cursor')
+
+
+def _page_query(queryset, page_size, after, before):
+    if before:
+        timestamp, pk = decode_cursor(before)
+        return (
+            queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk), timestamp__lte=timestamp)
+            .order_by('-timestamp', '-pk')[:page_size + 1]
+        )
+    if after:
+        timestamp, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk), timestamp__gte=timestamp)
+    return queryset.order_by('timestamp', 'pk')[:page_size + 1]
+
+
+def _page(rows, page_size, after, before):
+    if before:
+        has_previous, has_next = len(rows) > page_size, True
+        rows = rows[:page_size][::-1]
+    else:
+        has_previous, has_next = bool(after), len(rows) > page_size
+        rows = rows[:page_size]
+
+    previous_cursor = encode_cursor(rows[0]) if rows and has_previous else None
+    next_cursor = encode_cursor(rows[-1]) if rows and has_next else None
+    return rows, previous_cursor, next_cursor
+
+
+def keyset_page(queryset, page_size, after=None, before=None):
+    """Return ``(rows, previous_cursor, next_cursor)`` for one page of ``queryset``."""
+    return _page(list(_page_query(queryset, page_size, after, before)), page_size, after, before)
+
+
+def merged_keyset_page(queryset, older_rows, page_size, after=None, before=None):
+    """``keyset_page`` over ``queryset`` plus rows kept outside it, such as the archive.
+
+    ``older_rows(after, before)`` takes the decoded cursors and yields the
+    outside rows past them in page order: ascending, or descending for ``before``.
+    """
+    rows = heapq.merge(
+        _page_query(queryset, page_size, after, before),
+        older_rows(after and decode_cursor(after), before and decode_cursor(before)),
+        key=lambda row: (row.timestamp, row.pk),
+        reverse=bool(before),
+    )
+    return _page(list(islice(rows, page_size + 1)), page_size, after, before)
+
+
+async def akeyset_page(queryset, page_size, after=None, before=None):
+    """``keyset_page`` on the async ORM."""
+    rows = [row async for row in _page_query(queryset, page_size, after, before)]
+    return _page(rows, page_size, after, before)
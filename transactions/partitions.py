@@ -0,0 +1,163 @@
+"""
+Monthly range partitions of ``transactions_transaction`` on PostgreSQL.
+
+Migration 0008 turns the table into one partitioned by ``timestamp``. Each
+calendar month (UTC) gets its own partition, named
+``transactions_transaction_yYYYYmMM``. A default partition catches rows
+that no month partition covers yet. PostgreSQL requires the partition key in
+every unique constraint, so the primary key becomes ``(id, timestamp)``. Ids
+still come from the table's single sequence. Indexes and the account foreign
+key are declared on the parent and cascade to every partition.
+
+A query filtered on ``timestamp`` only scans the partitions its range
+overlaps. The date-filtered report is one of these. Other account queries
+read each partition through its own copy of the account index.
+
+``manage_partitions`` creates the coming months' partitions ahead of time.
+Rows that landed in the default partition are moved into the new month
+partition. The command also detaches partitions older than a retention
+window. A detached partition becomes an ordinary table, ready to be archived
+or dropped. Partitions that still hold open loans stay attached, so those
+loans can still be repaid.
+
+On other database backends the table stays as it is.
+"""
+import re
+from datetime import datetime, timezone
+
+from .constants import LOAN
+from .models import Transaction
+
+TABLE = Transaction._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def supported(connection):
+    return connection.vendor == 'postgresql'
+
+
+def month_start(value):
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month:%Y}m{month:%m}'
+
+
+def bounds(month):
+    return f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def month_partitions(cursor):
+    """The attached month partitions as ``{month: name}``, oldest first."""
+    cursor.execute(
+        'SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s)', [TABLE],
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)] = name
+    return dict(sorted(partitions.items()))
+
+
+def months_with_rows(cursor, table):
+    cursor.execute(
+        f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE 'UTC') FROM {table}"
+    )
+    return {value.replace(tzinfo=timezone.utc) for (value,) in cursor.fetchall()}
+
+
+def _schema(cursor, table):
+    """``CREATE INDEX`` statements and ``(name, definition)`` constraints of ``table``, primary key aside."""
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s"
+        " AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p')",
+        [table, table],
+    )
+    indexes = [indexdef for (indexdef,) in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+        " WHERE conrelid = to_regclass(%s) AND contype IN ('c', 'f')",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _rebuild(cursor, partitioned, months=()):
+    """Copy the table into a new one, partitioned or not, keeping its indexes and constraints."""
+    indexes, constraints = _schema(cursor, TABLE)
+    old = f'{TABLE}_old'
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+    if partitioned:
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {old}) PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+        for month in sorted(set(months) | months_with_rows(cursor, old)):
+            cursor.execute(f'CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} FOR VALUES {bounds(month)}')
+    else:
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {old})')
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+    cursor.execute(f'DROP TABLE {old} CASCADE')
+    if partitioned:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, "timestamp")')
+        cursor.execute(f'CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id')
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER id SET DEFAULT nextval('{TABLE}_id_seq')")
+    else:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER id ADD GENERATED BY DEFAULT AS IDENTITY')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+    )
+    for indexdef in indexes:
+        cursor.execute(indexdef)
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+
+def partition_table(cursor, now, ahead):
+    """Partition the table by month, from its oldest row to ``ahead`` months after ``now``."""
+    month = month_start(now)
+    _rebuild(cursor, True, [add_months(month, offset) for offset in range(ahead + 1)])
+
+
+def unpartition_table(cursor):
+    """Turn the attached partitions back into one plain table."""
+    _rebuild(cursor, False)
+
+
+def create_partition(cursor, month):
+    """Attach the partition of ``month``; returns the number of rows it took over from the default partition."""
+    name = partition_name(month)
+    # Writers wait while rows move, so none can land in the default partition before the attach checks it.
+    cursor.execute(f'LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE')
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE})')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *)'
+        f' INSERT INTO {name} SELECT * FROM moved',
+        [month, add_months(month, 1)],
+    )
+    moved = cursor.rowcount
+    cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES {bounds(month)}')
+    return moved
+
+
+def holds_open_loans(cursor, name):
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name} WHERE transaction_type = %s)', [LOAN])
+    return cursor.fetchone()[0]
+
+
+def detach_partition(cursor, name):
+    cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
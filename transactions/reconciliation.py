@@ -0,0 +1,206 @@
+"""
+Ledger reconciliation: replay every account's balance chain and report drift.
+
+``replay`` walks one account's rows in id order, archived rows included.
+That is the order their postings changed the balance, because each posting
+inserts its row while it holds the account's row lock. Every deposit,
+withdrawal and transfer records the balance it left. That balance minus the
+row's own effect must equal the running balance, and a row where it does
+not is a chain break.
+
+Loan rows are the exception. An approval or repayment changes the balance
+after the loan row was written, at a time that is not recorded, and
+overwrites the balance on the row. Their effects are therefore pending until
+a gap in the chain adds up to some of them. The balance the replay ends
+with, plus whatever is still pending, must equal
+``UserBankAccount.balance``. The difference is the account's drift. History
+is assumed to start at the balance before the first row, unless a loan event
+explains the difference. An account with no such rows starts from zero.
+
+``reconcile`` splits accounts into shards and checks them in a process pool.
+Each worker reads its shard through one server-side cursor. On PostgreSQL
+that read happens inside a REPEATABLE READ snapshot, so balances and rows
+agree even while postings continue. ``LedgerCheck`` stores the account
+version each replay saw. An incremental run only replays accounts whose
+version has moved since, which is every account a posting, loan decision,
+import, archive or profile edit touched.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from itertools import groupby
+from multiprocessing import get_context
+from operator import itemgetter
+
+import django
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from . import archive
+from .constants import DEBIT_TYPES, LOAN, LOAN_PAID
+from .models import LedgerCheck, Transaction
+
+COLUMNS = ['account_id', 'id', 'transaction_type', 'amount', 'balance_after_transaction', 'loan_approve']
+MAX_SETTLE_STEPS = 4096
+REPORTED_BREAKS = 20
+
+
+def settle(pending, gap):
+    """Pick loan events that add up to ``gap``.
+
+    ``pending`` is a list of ``[loan_id, deltas]`` lists; an event can only
+    settle after the earlier ones of its loan, so the pick takes a prefix of
+    each loan's deltas. Returns how many to take of each, or None.
+    """
+    steps = 0
+
+    def search(index, remaining):
+        nonlocal steps
+        steps += 1
+        if not remaining:
+            return [0] * (len(pending) - index)
+        if index == len(pending) or steps > MAX_SETTLE_STEPS:
+            return None
+        total = Decimal(0)
+        for taken in range(len(pending[index][1]) + 1):
+            if taken:
+                total += pending[index][1][taken - 1]
+            rest = search(index + 1, remaining - total)
+            if rest is not None:
+                return [taken, *rest]
+        return None
+
+    return search(0, gap)
+
+
+def take(pending, counts):
+    for entry, count in zip(pending, counts):
+        del entry[1][:count]
+    pending[:] = [entry for entry in pending if entry[1]]
+
+
+def replay(balance, rows):
+    """Replay ``rows`` (id order, ``COLUMNS`` without the account) against the account ``balance``."""
+    running, pending, early, breaks, count = None, [], set(), [], 0
+    for pk, transaction_type, amount, recorded, loan_approve in rows:
+        count += 1
+        if transaction_type == LOAN:
+            if loan_approve:
+                pending.append([pk, [amount]])
+            continue
+        if transaction_type == LOAN_PAID:
+            pending.append([pk, [amount, -amount]])
+            continue
+        opening = recorded - amount if transaction_type not in DEBIT_TYPES else recorded + amount
+        if running is None:
+            early = {loan for loan, _ in pending}
+            running = opening
+        elif opening != running:
+            counts = settle(pending, opening - running)
+            if counts is None:
+                breaks.append({'id': pk, 'expected': str(running), 'recorded': str(opening)})
+            else:
+                take(pending, counts)
+        running = recorded
+
+    expected = (running or Decimal(0)) + sum((sum(deltas) for _, deltas in pending), Decimal(0))
+    drift = balance - expected
+    if drift and early and settle([entry for entry in pending if entry[0] in early], -drift) is not None:
+        # Those loan events happened before the first row, so the opening balance already has them.
+        expected, drift = balance, Decimal(0)
+    return {'transactions': count, 'expected': expected, 'drift': drift, 'breaks': breaks}
+
+
+def _archived(account):
+    return [
+        (txn.pk, txn.transaction_type, txn.amount, txn.balance_after_transaction, txn.loan_approve)
+        for txn in archive.rows(account)
+    ]
+
+
+def check_shard(pks, chunk_size=5000):
+    """Replay the accounts ``pks`` and record their checks; returns the totals and the drifted accounts."""
+    drifted, checks, total = [], [], 0
+
+    def check(account, history):
+        nonlocal total
+        if account.archived_until is not None:
+            history = _archived(account) + history
+        outcome = replay(account.balance, sorted(history))
+        total += outcome['transactions']
+        checks.append(LedgerCheck(
+            account=account,
+            version=account.version,
+            drift=outcome['drift'],
+            chain_breaks=len(outcome['breaks']),
+            checked_at=timezone.now(),
+        ))
+        if outcome['drift'] or outcome['breaks']:
+            drifted.append({
+                'account_no': account.account_no,
+                'balance': str(account.balance),
+                'expected': str(outcome['expected']),
+                'drift': str(outcome['drift']),
+                'chain_breaks': len(outcome['breaks']),
+                'first_breaks': outcome['breaks'][:REPORTED_BREAKS],
+            })
+
+    snapshot = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        accounts = UserBankAccount.objects.in_bulk(pks)
+        rows = (
+            Transaction.objects.filter(account_id__in=pks)
+            .order_by('account_id', 'timestamp', 'pk')
+            .values_list(*COLUMNS)
+            .iterator(chunk_size=chunk_size)
+        )
+        seen = set()
+        for account_id, group in groupby(rows, key=itemgetter(0)):
+            seen.add(account_id)
+            check(accounts[account_id], [row[1:] for row in group])
+        for pk in accounts.keys() - seen:
+            check(accounts[pk], [])
+    LedgerCheck.objects.bulk_create(
+        checks,
+        update_conflicts=True,
+        unique_fields=['account'],
+        update_fields=['version', 'drift', 'chain_breaks', 'checked_at'],
+    )
+    return {'accounts': len(accounts), 'transactions': total, 'drifted': drifted}
+
+
+def pending_accounts(incremental=False):
+    accounts = UserBankAccount.objects.order_by('pk')
+    if incremental:
+        accounts = accounts.filter(Q(ledger_check__isnull=True) | ~Q(ledger_check__version=F('version')))
+    return accounts
+
+
+def reconcile(accounts, workers=None, shard_size=1000, chunk_size=5000):
+    """Check ``accounts`` in shards, in ``workers`` processes (0: in this one); returns the report."""
+    pks = list(accounts.values_list('pk', flat=True))
+    shards = [pks[start:start + shard_size] for start in range(0, len(pks), shard_size)]
+    report = {'accounts': 0, 'transactions': 0, 'drifted': []}
+
+    def add(result):
+        report['accounts'] += result['accounts']
+        report['transactions'] += result['transactions']
+        report['drifted'] += result['drifted']
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 0 or len(shards) < 2:
+        for shard in shards:
+            add(check_shard(shard, chunk_size))
+    else:
+        # Workers start fresh and open their own connections; forked ones would share this one.
+        with ProcessPoolExecutor(min(workers, len(shards)), mp_context=get_context('spawn'),
+                                 initializer=django.setup) as pool:
+            for result in pool.map(check_shard, shards, [chunk_size] * len(shards)):
+                add(result)
+    report['drifted'].sort(key=itemgetter('account_no'))
+    return report
@@ -0,0 +1,155 @@
+"""
+Per-account, per-day balance rollups.
+
+The posting engine calls ``record_movement`` for every balance change (and
+``record_movements`` for a batch of them), so a date-range report reads one
+``DailyBalance`` row per day instead of scanning raw transactions.
+``rebuild_account`` recomputes an account's rollup from its transaction
+history, archived rows included, for the ``backfill_daily_balances`` command.
+"""
+import heapq
+from decimal import Decimal
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from . import archive
+from .constants import DEBIT_TYPES, LOAN, LOAN_PAID
+from .models import DailyBalance, Transaction
+
+
+def record_movement(account, when, delta, balance):
+    """Add one balance movement of ``delta`` that left the account at ``balance``."""
+    day = timezone.localdate(when)
+    credit, debit = (delta, Decimal(0)) if delta > 0 else (Decimal(0), -delta)
+    updated = DailyBalance.objects.filter(account=account, date=day).update(
+        closing_balance=balance,
+        credits=F('credits') + credit,
+        debits=F('debits') + debit,
+        count=F('count') + 1,
+    )
+    if not updated:
+        DailyBalance.objects.create(
+            account=account,
+            date=day,
+            opening_balance=balance - delta,
+            closing_balance=balance,
+            credits=credit,
+            debits=debit,
+            count=1,
+        )
+
+
+def record_movements(when, movements, batch_size=500):
+    """Bulk ``record_movement`` for one day.
+
+    ``movements`` maps an account pk to ``(credits, debits, count, closing_balance)``.
+    Rows are read, changed and written back, so the caller must hold the row
+    locks of all these accounts.
+    """
+    day = timezone.localdate(when)
+    pks = list(movements)
+    existing = {}
+    for start in range(0, len(pks), batch_size):
+        existing.update(
+            (row.account_id, row)
+            for row in DailyBalance.objects.filter(account_id__in=pks[start:start + batch_size], date=day)
+        )
+    changed, created = [], []
+    for pk, (credits, debits, count, balance) in movements.items():
+        row = existing.get(pk)
+        if row is None:
+            created.append(DailyBalance(
+                account_id=pk,
+                date=day,
+                opening_balance=balance - credits + debits,
+                closing_balance=balance,
+                credits=credits,
+                debits=debits,
+                count=count,
+            ))
+            continue
+        row.closing_balance = balance
+        row.credits += credits
+        row.debits += debits
+        row.count += count
+        changed.append(row)
+    DailyBalance.objects.bulk_update(changed, ['closing_balance', 'credits', 'debits', 'count'], batch_size=batch_size)
+    DailyBalance.objects.bulk_create(created, batch_size=batch_size)
+
+
+def summarize(account, start_date, end_date):
+    days = list(DailyBalance.objects.filter(account=account, date__range=(start_date, end_date)))
+    if days:
+        opening, closing = days[0].opening_balance, days[-1].closing_balance
+    else:
+        previous = DailyBalance.objects.filter(account=account, date__lt=start_date).order_by('-date').first()
+        if previous is not None:
+            opening = closing = previous.closing_balance
+        else:
+            # Before the first movement the balance is what the next movement opened with (or still is).
+            following = DailyBalance.objects.filter(account=account, date__gt=end_date).order_by('date').first()
+            opening = closing = following.opening_balance if following else account.balance
+    return {
+        'opening_balance': opening,
+        'closing_balance': closing,
+        'credits': sum((day.credits for day in days), Decimal(0)),
+        'debits': sum((day.debits for day in days), Decimal(0)),
+        'count': sum(day.count for day in days),
+    }
+
+
+def history_effect(transaction_type, amount, loan_approve):
+    """Balance effect of a stored row when replaying history.
+
+    Approval and repayment times of loans are not stored, so an approved loan
+    is booked at its request time and a repaid loan (credit and repayment
+    cancel out) is not booked at all.
+    """
+    if transaction_type == LOAN_PAID or (transaction_type == LOAN and not loan_approve):
+        return Decimal(0)
+    return -amount if transaction_type in DEBIT_TYPES else amount
+
+
+def rebuild_account(account, chunk_size=5000):
+    with transaction.atomic():
+        balance = UserBankAccount.objects.select_for_update().values_list('balance', flat=True).get(pk=account.pk)
+        days = {}
+        rows = (
+            Transaction.objects.filter(account=account)
+            .order_by('timestamp', 'pk')
+            .values_list('timestamp', 'transaction_type', 'amount', 'loan_approve')
+            .iterator(chunk_size=chunk_size)
+        )
+        archived = (
+            (txn.timestamp, txn.transaction_type, txn.amount, txn.loan_approve)
+            for txn in archive.rows(account)
+        )
+        for timestamp, transaction_type, amount, loan_approve in heapq.merge(archived, rows, key=itemgetter(0)):
+            delta = history_effect(transaction_type, amount, loan_approve)
+            if not delta:
+                continue
+            day = days.setdefault(timezone.localdate(timestamp), [Decimal(0), Decimal(0), 0])
+            day[0 if delta > 0 else 1] += abs(delta)
+            day[2] += 1
+
+        closing = balance - sum(credits - debits for credits, debits, _ in days.values())
+        rollup = []
+        for date, (credits, debits, count) in days.items():
+            opening, closing = closing, closing + credits - debits
+            rollup.append(DailyBalance(
+                account=account,
+                date=date,
+                opening_balance=opening,
+                closing_balance=closing,
+                credits=credits,
+                debits=debits,
+                count=count,
+            ))
+        DailyBalance.objects.filter(account=account).delete()
+        DailyBalance.objects.bulk_create(rollup, batch_size=chunk_size)
+        UserBankAccount.objects.filter(pk=account.pk).update(version=F('version') + 1)
+    return len(rollup)
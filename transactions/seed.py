@@ -0,0 +1,85 @@
+"""
+Helpers that seed benchmark data straight through ``bulk_create``.
+
+Seeded balances are journaled as opening balances, not movement by movement.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from accounts.models import Bank, UserBankAccount
+from accounts.numbers import reserve
+from . import journal
+from .constants import DEPOSIT, WITHDRAWAL
+from .models import BalanceSnapshot, JournalEntry, JournalPosting, Transaction
+
+
+def create_accounts(count, prefix='bench', balance=Decimal('0.00'), account_type='Current'):
+    bank = Bank.objects.first() or Bank.objects.create()
+    numbers = reserve(count)
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}-{account_no}', email=f'{prefix}-{account_no}@example.com')
+        for account_no in numbers
+    ])
+    accounts = UserBankAccount.objects.bulk_create([
+        UserBankAccount(
+            user=user,
+            bank=bank,
+            account_type=account_type,
+            account_no=account_no,
+            balance=balance,
+        )
+        for account_no, user in zip(numbers, users)
+    ])
+    journal.open_balances(timezone.now(), {account.pk: balance for account in accounts})
+    return accounts
+
+
+def seed_transactions(account, count, start=None, step=timedelta(minutes=1), batch_size=10000):
+    """Write ``count`` alternating deposits and withdrawals and leave a consistent balance chain."""
+    timestamp = start or timezone.now() - step * count
+    balance = account.balance
+    batch = []
+    for i in range(count):
+        if i % 3 == 2:
+            amount, transaction_type = Decimal('50.00'), WITHDRAWAL
+            balance -= amount
+        else:
+            amount, transaction_type = Decimal('100.00'), DEPOSIT
+            balance += amount
+        batch.append(Transaction(
+            account=account,
+            amount=amount,
+            balance_after_transaction=balance,
+            transaction_type=transaction_type,
+            timestamp=timestamp,
+        ))
+        timestamp += step
+        if len(batch) == batch_size:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    Transaction.objects.bulk_create(batch)
+    journal.open_balances(timezone.now(), {account.pk: balance - account.balance})
+    account.balance = balance
+    account.save(update_fields=['balance'])
+    return account
+
+
+def delete_users(users):
+    """Delete benchmark ``users`` with their accounts and the journal entries that touched them.
+
+    Book snapshots taken since the first of those entries are dropped too,
+    so book balances are summed again from the snapshots before.
+    """
+    with transaction.atomic():
+        touched = JournalPosting.objects.filter(account__user__in=users).values('entry')
+        entries = JournalEntry.objects.filter(pk__in=touched)
+        first = JournalPosting.objects.filter(entry__in=entries).aggregate(first=Min('pk'))['first']
+        if first is not None:
+            BalanceSnapshot.objects.filter(account=None, through__gte=first).delete()
+            entries.delete()
+        users.delete()
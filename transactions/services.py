@@ -0,0 +1,259 @@
+"""
+Posting engine shared by every view that moves money.
+
+A posting changes the account balance, writes its ``Transaction`` row and
+records its entry in the double-entry journal (``transactions.journal``) in
+one database transaction. Balances are moved with ``F()`` updates, so the row
+lock is only held from the UPDATE until commit, and transfers update their two
+accounts in primary key order so opposite transfers cannot deadlock.
+
+Loan postings also move the account's loan counters (``active_loans``,
+``pending_loans``, ``loan_principal``) in the same transaction, so the loan
+limit is read from the account row instead of counting loans. Every
+change to an account also bumps its ``version``, which the account's pages
+use as their ETag.
+
+``batch_transfer`` pays many recipients from one account in a number of
+queries that depends on the batch size only through chunking: the sender is
+debited once, recipients are credited with ``CASE`` updates and the rows are
+written with ``bulk_create``. It locks all the accounts up front in primary
+key order, the same order ``transfer`` updates them in.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from core import metrics
+from .constants import (
+    DEBIT_TYPES, LOAN, LOAN_PAID, MIN_TRANSFER_AMOUNT, TRANSACTION_TYPE_NAMES, TRANSFER_FROM_OTHER, TRANSFER_TO_OTHER,
+)
+from . import journal
+from .models import Transaction
+from .rollups import record_movement, record_movements
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+class LoanNotPayable(Exception):
+    pass
+
+
+class BatchRejected(Exception):
+    """``errors`` is a list of ``(line, message)``; ``line`` is None for errors about the whole batch."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(message for _, message in errors))
+        self.errors = errors
+
+
+def signed_amount(txn):
+    if txn.transaction_type == LOAN:
+        return txn.amount if txn.loan_approve else Decimal(0)
+    if txn.transaction_type in DEBIT_TYPES:
+        return -txn.amount
+    return txn.amount
+
+
+def _apply(account, delta, when):
+    accounts = UserBankAccount.objects.filter(pk=account.pk)
+    if delta < 0:
+        accounts = accounts.filter(balance__gte=-delta)
+    if delta and not accounts.update(balance=F('balance') + delta, version=F('version') + 1):
+        raise InsufficientFunds(f'Account {account} cannot cover {-delta}')
+    account.balance = UserBankAccount.objects.values_list('balance', flat=True).get(pk=account.pk)
+    if delta:
+        record_movement(account, when, delta, account.balance)
+    return account.balance
+
+
+def _move_loan_counters(account, active=0, pending=0, principal=0):
+    UserBankAccount.objects.filter(pk=account.pk).update(
+        active_loans=F('active_loans') + active,
+        pending_loans=F('pending_loans') + pending,
+        loan_principal=F('loan_principal') + principal,
+        version=F('version') + 1,
+    )
+
+
+def count_committed(*txns):
+    """Add ``txns`` to the ``bank_transactions`` metrics once the current transaction commits."""
+    def record():
+        for txn in txns:
+            name = TRANSACTION_TYPE_NAMES[txn.transaction_type]
+            metrics.transactions.inc(name)
+            metrics.transaction_amount.inc(name, amount=txn.amount)
+    transaction.on_commit(record)
+
+
+def post(txn):
+    with transaction.atomic():
+        delta = signed_amount(txn)
+        txn.balance_after_transaction = _apply(txn.account, delta, txn.timestamp)
+        txn.save()
+        if delta:
+            journal.movement(txn.transaction_type, txn.timestamp, txn.account_id, delta, txn.pk)
+        if txn.transaction_type == LOAN and txn.loan_approve:
+            _move_loan_counters(txn.account, active=1, principal=txn.amount)
+        elif txn.transaction_type == LOAN:
+            _move_loan_counters(txn.account, pending=1)
+        count_committed(txn)
+    return txn
+
+
+def post_transaction(account, amount, transaction_type, **fields):
+    return post(Transaction(account=account, amount=amount, transaction_type=transaction_type, **fields))
+
+
+def transfer(sender, recipient, amount):
+    debit = Transaction(account=sender, amount=amount, transaction_type=TRANSFER_TO_OTHER)
+    credit = Transaction(account=recipient, amount=amount, transaction_type=TRANSFER_FROM_OTHER)
+    with transaction.atomic():
+        for txn in sorted((debit, credit), key=lambda txn: txn.account.pk):
+            txn.balance_after_transaction = _apply(txn.account, signed_amount(txn), txn.timestamp)
+        Transaction.objects.bulk_create([debit, credit])
+        journal.record(TRANSFER_TO_OTHER, debit.timestamp, [
+            journal.customer(sender.pk, -amount, debit.pk), journal.customer(recipient.pk, amount, credit.pk),
+        ])
+        count_committed(debit, credit)
+    return debit
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def batch_transfer(sender, lines, chunk_size=500):
+    """Pay every ``(account_no, amount)`` line from ``sender``, all or nothing.
+
+    Returns the recipients' credit rows in line order; their accounts carry
+    the new balances. Invalid lines raise ``BatchRejected`` listing each one.
+    """
+    errors = []
+    if not lines:
+        raise BatchRejected([(None, 'The batch has no transfers.')])
+    recipients = UserBankAccount.objects.select_related('user').in_bulk(
+        {account_no for account_no, _ in lines}, field_name='account_no',
+    )
+    for line, (account_no, amount) in enumerate(lines):
+        if account_no not in recipients:
+            errors.append((line, 'Recipient account does not exist.'))
+        elif recipients[account_no].pk == sender.pk:
+            errors.append((line, 'Cannot transfer to your own account.'))
+        if amount < MIN_TRANSFER_AMOUNT:
+            errors.append((line, f'The transfer amount must be at least {MIN_TRANSFER_AMOUNT} $'))
+    if errors:
+        raise BatchRejected(errors)
+
+    total = sum(amount for _, amount in lines)
+    credits, counts = defaultdict(Decimal), defaultdict(int)
+    for account_no, amount in lines:
+        credits[recipients[account_no].pk] += amount
+        counts[recipients[account_no].pk] += 1
+    now = timezone.now()
+    with transaction.atomic():
+        balances = {}
+        for pks in _chunks(sorted({sender.pk, *credits}), chunk_size):
+            balances.update(
+                UserBankAccount.objects.select_for_update().filter(pk__in=pks).order_by('pk').values_list('pk', 'balance')
+            )
+        if balances[sender.pk] < total:
+            raise BatchRejected([(None, f'Insufficient funds: the batch totals {total}.')])
+        UserBankAccount.objects.filter(pk=sender.pk).update(balance=F('balance') - total, version=F('version') + 1)
+        for pks in _chunks(sorted(credits), chunk_size):
+            UserBankAccount.objects.filter(pk__in=pks).update(balance=F('balance') + Case(
+                *[When(pk=pk, then=Value(credits[pk])) for pk in pks],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ), version=F('version') + 1)
+
+        running = dict(balances)
+        debits, received = [], []
+        for account_no, amount in lines:
+            recipient = recipients[account_no]
+            running[sender.pk] -= amount
+            running[recipient.pk] += amount
+            debits.append(Transaction(account=sender, amount=amount, transaction_type=TRANSFER_TO_OTHER,
+                                      balance_after_transaction=running[sender.pk], timestamp=now))
+            received.append(Transaction(account=recipient, amount=amount, transaction_type=TRANSFER_FROM_OTHER,
+                                        balance_after_transaction=running[recipient.pk], timestamp=now))
+        Transaction.objects.bulk_create(debits + received, batch_size=chunk_size)
+        journal.record(TRANSFER_TO_OTHER, now, [
+            *(journal.customer(sender.pk, -txn.amount, txn.pk) for txn in debits),
+            *(journal.customer(txn.account_id, txn.amount, txn.pk) for txn in received),
+        ], batch_size=chunk_size)
+
+        movements = {pk: (amount, Decimal(0), counts[pk], running[pk]) for pk, amount in credits.items()}
+        movements[sender.pk] = (Decimal(0), total, len(lines), running[sender.pk])
+        record_movements(now, movements, batch_size=chunk_size)
+        for account in (sender, *recipients.values()):
+            account.balance = running.get(account.pk, account.balance)
+        count_committed(*debits, *received)
+    return received
+
+
+def approve_loan(loan):
+    with transaction.atomic():
+        approved = Transaction.objects.select_for_update().values_list('loan_approve', flat=True).get(pk=loan.pk)
+        if approved:
+            # Already booked; saving the instance could only overwrite the booked row.
+            loan.refresh_from_db()
+            return loan
+        now = timezone.now()
+        loan.loan_approve = True
+        loan.balance_after_transaction = _apply(loan.account, loan.amount, now)
+        journal.movement(LOAN, now, loan.account_id, loan.amount, loan.pk)
+        _move_loan_counters(loan.account, active=1, pending=-1, principal=loan.amount)
+        loan.save()
+    return loan
+
+
+def repay_loan(loan):
+    with transaction.atomic():
+        loan = Transaction.objects.select_for_update().select_related('account').get(pk=loan.pk)
+        if loan.transaction_type != LOAN or not loan.loan_approve:
+            raise LoanNotPayable(f'Loan {loan.pk} is not an approved open loan')
+        now = timezone.now()
+        loan.balance_after_transaction = _apply(loan.account, -loan.amount, now)
+        journal.movement(LOAN_PAID, now, loan.account_id, -loan.amount, loan.pk)
+        loan.transaction_type = LOAN_PAID
+        loan.save(update_fields=['balance_after_transaction', 'transaction_type'])
+        _move_loan_counters(loan.account, active=-1, principal=-loan.amount)
+        count_committed(loan)
+    return loan
+
+
+def _loan_aggregate(aggregate, output_field, **filters):
+    loans = (
+        Transaction.objects.filter(account=OuterRef('pk'), transaction_type=LOAN, **filters)
+        .order_by().values('account').annotate(value=aggregate).values('value')
+    )
+    return Coalesce(Subquery(loans, output_field=output_field), Value(0), output_field=output_field)
+
+
+def reconcile_loan_counters(accounts=None):
+    """Rebuild the loan counters of ``accounts`` from their loans and return the number that had drifted."""
+    accounts = UserBankAccount.objects.all() if accounts is None else accounts
+    expected = {
+        'active_loans': _loan_aggregate(Count('pk'), IntegerField(), loan_approve=True),
+        'pending_loans': _loan_aggregate(Count('pk'), IntegerField(), loan_approve=False),
+        'loan_principal': _loan_aggregate(Sum('amount'), DecimalField(max_digits=12, decimal_places=2), loan_approve=True),
+    }
+    with transaction.atomic():
+        drifted = list(
+            accounts.select_for_update()
+            .annotate(**{f'expected_{field}': value for field, value in expected.items()})
+            .filter(~Q(active_loans=F('expected_active_loans'))
+                    | ~Q(pending_loans=F('expected_pending_loans'))
+                    | ~Q(loan_principal=F('expected_loan_principal')))
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            UserBankAccount.objects.filter(pk__in=drifted).update(**expected, version=F('version') + 1)
+    return len(drifted)
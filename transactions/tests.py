@@ -1,3 +1,1128 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import re
+import resource
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_EVEN, Decimal
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import BadRequest
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import F, Sum
+from django.test import Client, TestCase, TransactionTestCase, tag
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.admin import UserBankAccountAdmin
+from accounts.models import Bank, UserBankAccount
+from core.models import OutboxEmail
+from . import archive, interest, journal, partitions
+from .admin import TransactionAdmin
+from .bench import is_scratch_database
+from .constants import (
+    CASH, DEPOSIT, INTEREST, INTEREST_EXPENSE, LOAN, LOANS, TRANSFER_FROM_OTHER, TRANSFER_TO_OTHER, WITHDRAWAL,
+)
+from .models import (
+    ArchivedBlock, BalanceSnapshot, DailyBalance, IdempotencyKey, JournalEntry, JournalPosting, Transaction,
+)
+from .pagination import keyset_page
+from .rollups import rebuild_account, summarize
+from .seed import create_accounts, seed_transactions
+from .services import InsufficientFunds, approve_loan, batch_transfer, post_transaction, repay_loan, transfer
+
+SEQUENTIAL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN transactions_transaction\b(?! USING)'),
+    # Empty partitions of future months are scanned at no cost.
+    'postgresql': re.compile(r'\bSeq Scan on transactions_transaction\w*(?: \w+)? +\(cost=(?!0\.00\.\.0\.00 )'),
+}
+SORT = {
+    'sqlite': re.compile(r'\bUSE TEMP B-TREE FOR ORDER BY\b'),
+    'postgresql': re.compile(r'\bSort\b(?! Key)'),
+}
+
+
+class QueryPlanTests(TestCase):
+    """Every view query on transactions_transaction must be served by an index.
+
+    Report pages must also come out of the index already ordered, without a sort step.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        accounts = create_accounts(5, prefix='plan')
+        for account in accounts:
+            seed_transactions(account, 400, start=timezone.now() - timedelta(days=30), step=timedelta(hours=1))
+            Transaction.objects.bulk_create([
+                Transaction(account=account, amount=1000, balance_after_transaction=account.balance,
+                            transaction_type=LOAN, loan_approve=i % 2 == 0)
+                for i in range(4)
+            ])
+        cls.account = accounts[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def assertIndexedPlans(self, request, ordered=False):
+        with CaptureQueriesContext(connection) as queries:
+            request()
+        statements = [q['sql'] for q in queries if 'FROM "transactions_transaction"' in q['sql']]
+        self.assertTrue(statements)
+        for sql in statements:
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+                plan = '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+            self.assertIsNone(SEQUENTIAL_SCAN[connection.vendor].search(plan), f'{sql}\n{plan}')
+            if ordered and 'ORDER BY' in sql:
+                self.assertIsNone(SORT[connection.vendor].search(plan), f'{sql}\n{plan}')
+
+    def test_report(self):
+        self.assertIndexedPlans(lambda: self.client.get(reverse('transaction_report')), ordered=True)
+
+    def test_report_deep_page(self):
+        page = self.client.get(reverse('transaction_report'), {'page_size': 100})
+        self.assertIndexedPlans(
+            lambda: self.client.get(f"{reverse('transaction_report')}?{page.context['next_page_query']}"), ordered=True
+        )
+
+    def test_report_date_range(self):
+        today = timezone.now().date()
+        dates = {'start_date': str(today - timedelta(days=7)), 'end_date': str(today)}
+        self.assertIndexedPlans(lambda: self.client.get(reverse('transaction_report'), dates))
+
+    def test_loan_list(self):
+        self.assertIndexedPlans(lambda: self.client.get(reverse('loan_list')))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.account] = create_accounts(1, prefix='pages', balance=Decimal('1000.00'))
+        # Three runs of rows sharing a timestamp, so pages split inside a run and only the id breaks ties.
+        start = timezone.now() - timedelta(days=1)
+        for offset, count in ((0, 7), (1, 9), (2, 6)):
+            seed_transactions(cls.account, count, start=start + timedelta(hours=offset), step=timedelta(0))
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def queryset(self):
+        return Transaction.objects.filter(account=self.account)
+
+    def test_pages_forward_and_backward_through_equal_timestamps(self):
+        expected = list(self.queryset().order_by('timestamp', 'pk').values_list('pk', flat=True))
+        forward, cursor, pages = [], None, []
+        while True:
+            rows, previous_cursor, cursor = keyset_page(self.queryset(), 4, after=cursor)
+            forward += [row.pk for row in rows]
+            pages.append(previous_cursor)
+            if cursor is None:
+                break
+        self.assertEqual(forward, expected)
+        self.assertIsNone(pages[0])
+
+        last_page = [row.pk for row in rows]
+        backward, cursor = [], previous_cursor
+        while cursor is not None:
+            rows, cursor, next_cursor = keyset_page(self.queryset(), 4, before=cursor)
+            self.assertIsNotNone(next_cursor)
+            backward = [row.pk for row in rows] + backward
+        self.assertEqual(backward + last_page, expected)
+
+    def test_invalid_cursors_are_bad_requests(self):
+        [row] = self.queryset().order_by('pk')[:1]
+        tampered = base64.urlsafe_b64encode(f'{row.timestamp.isoformat()}|{row.pk}; DROP'.encode()).decode()
+        for cursor in ('not a cursor', tampered, base64.urlsafe_b64encode(b'yesterday|1').decode(), '\u00e9'):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(BadRequest):
+                    keyset_page(self.queryset(), 4, after=cursor)
+                self.assertEqual(self.client.get(reverse('transaction_report'), {'before': cursor}).status_code, 400)
+                self.assertEqual(self.client.get(reverse('api_transactions'), {'after': cursor}).status_code, 400)
+
+    @override_settings(TRANSACTION_REPORT_PAGE_SIZE=5, TRANSACTION_REPORT_MAX_PAGE_SIZE=8)
+    def test_page_size_is_clamped(self):
+        for page_size, expected in (('1000', 8), ('0', 1), ('-3', 1), ('six', 5), ('6', 6)):
+            with self.subTest(page_size=page_size):
+                page = self.client.get(reverse('transaction_report'), {'page_size': page_size})
+                self.assertEqual(len(page.context['object_list']), expected)
+                results = self.client.get(reverse('api_transactions'), {'page_size': page_size}).json()['results']
+                self.assertEqual(len(results), expected)
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.account] = create_accounts(1, prefix='archive', balance=Decimal('100000.00'))
+        seed_transactions(cls.account, 500, start=timezone.now() - timedelta(days=500), step=timedelta(days=1))
+        cls.loan = Transaction.objects.create(account=cls.account, amount=300, balance_after_transaction=0,
+                                              transaction_type=LOAN)
+        Transaction.objects.filter(pk=cls.loan.pk).update(timestamp=timezone.now() - timedelta(days=450))
+        rebuild_account(cls.account)
+        cls.cutoff = partitions.month_start(timezone.now() - timedelta(days=365))
+
+    def setUp(self):
+        self.enterContext(override_settings(TRANSACTION_ARCHIVE_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        self.client.force_login(self.account.user)
+
+    def archive(self):
+        out = StringIO()
+        call_command('archive_transactions', stdout=out)
+        return out.getvalue()
+
+    def test_closed_months_move_to_the_archive_except_open_loans(self):
+        months = Transaction.objects.filter(timestamp__lt=self.cutoff).dates('timestamp', 'month').count()
+        old = Transaction.objects.filter(timestamp__lt=self.cutoff).count()
+        self.assertIn(f'archived {old - 1} transactions', self.archive())
+        self.assertEqual(list(Transaction.objects.filter(timestamp__lt=self.cutoff)), [self.loan])
+        self.assertEqual(ArchivedBlock.objects.filter(account=self.account).count(), months)
+        self.assertEqual(UserBankAccount.objects.get(pk=self.account.pk).archived_until, self.cutoff)
+        self.assertIn('archived 0 transactions', self.archive())
+
+    def test_report_and_export_read_archived_ranges(self):
+        today = timezone.localdate()
+        queries = [
+            {'page_size': 9},
+            {'page_size': 9, 'start_date': str((self.cutoff - timedelta(days=40)).date()),
+             'end_date': str((self.cutoff + timedelta(days=20)).date())},
+            {'page_size': 9, 'start_date': str(today - timedelta(days=30)), 'end_date': str(today)},
+        ]
+        expected = [(self.pages(query, 'after'), self.pages(query, 'before')) for query in queries]
+        statement = b''.join(self.client.get(reverse('transaction_export'), {'format': 'jsonl'}).streaming_content)
+        self.archive()
+        self.assertEqual([(self.pages(query, 'after'), self.pages(query, 'before')) for query in queries], expected)
+        self.assertEqual(
+            b''.join(self.client.get(reverse('transaction_export'), {'format': 'jsonl'}).streaming_content), statement,
+        )
+
+    def pages(self, query, key):
+        """The report for ``query`` page by page, forward from the first page or backward from the last."""
+        url = reverse('transaction_report')
+        response = self.client.get(url, query)
+        if key == 'before':
+            while response.context['next_page_query']:
+                response = self.client.get(f"{url}?{response.context['next_page_query']}")
+        pages = [[txn.pk for txn in response.context['object_list']]]
+        follow = 'next_page_query' if key == 'after' else 'previous_page_query'
+        while response.context[follow]:
+            response = self.client.get(f'{url}?{response.context[follow]}')
+            pages.append([txn.pk for txn in response.context['object_list']])
+        return pages if key == 'after' else pages[::-1]
+
+    def test_an_archived_month_decompresses_one_block(self):
+        self.archive()
+        month = partitions.add_months(self.cutoff, -3)
+        dates = {'start_date': str((month + timedelta(days=2)).date()), 'end_date': str((month + timedelta(days=9)).date())}
+        with patch('transactions.archive.decode', wraps=archive.decode) as decode:
+            response = self.client.get(reverse('transaction_report'), dates)
+        self.assertEqual(len(response.context['object_list']), 8)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_rollups_rebuild_from_the_archive(self):
+        fields = ['date', 'opening_balance', 'closing_balance', 'credits', 'debits', 'count']
+        before = list(DailyBalance.objects.filter(account=self.account).values_list(*fields))
+        self.archive()
+        rebuild_account(self.account)
+        self.assertEqual(list(DailyBalance.objects.filter(account=self.account).values_list(*fields)), before)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Transactions are only partitioned on PostgreSQL')
+class PartitionTests(TestCase):
+    """Run against a local PostgreSQL with DATABASE_URL=postgres://..."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        cls.current = partitions.month_start(timezone.now())
+        cls.start = partitions.add_months(cls.current, -3) + timedelta(days=20)
+        [cls.account] = create_accounts(1, prefix='partition', balance=Decimal('1000.00'))
+        seed_transactions(cls.account, 90, start=cls.start, step=timedelta(days=1))
+        cls.old_loan = Transaction.objects.create(account=cls.account, amount=500, balance_after_transaction=0,
+                                                  transaction_type=LOAN)
+        Transaction.objects.filter(pk=cls.old_loan.pk).update(timestamp=cls.start)
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def manage(self, *args):
+        out = StringIO()
+        call_command('manage_partitions', *args, stdout=out)
+        return out.getvalue()
+
+    def partition_of(self, queryset):
+        with connection.cursor() as cursor:
+            sql, params = queryset.values_list('pk').query.sql_with_params()
+            cursor.execute(f'SELECT DISTINCT tableoid::regclass::text FROM {partitions.TABLE} WHERE id IN ({sql})', params)
+            return {name for (name,) in cursor.fetchall()}
+
+    def test_rows_move_from_the_default_partition_into_new_months(self):
+        first = partitions.add_months(self.current, -3)
+        self.assertIn(partitions.DEFAULT_PARTITION, self.partition_of(Transaction.objects.all()))
+        self.assertIn(f'created {partitions.partition_name(first)}', self.manage())
+        self.assertEqual(self.partition_of(Transaction.objects.filter(timestamp__lt=partitions.add_months(first, 1))),
+                         {partitions.partition_name(first)})
+        self.assertNotIn(partitions.DEFAULT_PARTITION, self.partition_of(Transaction.objects.all()))
+        self.assertEqual(self.manage(), '')
+
+    def test_report_and_loans_span_partition_boundaries(self):
+        self.manage()
+        seen, query = [], 'page_size=7'
+        while query:
+            response = self.client.get(f"{reverse('transaction_report')}?{query}")
+            seen += [txn.pk for txn in response.context['object_list']]
+            query = response.context['next_page_query']
+        self.assertEqual(seen, list(Transaction.objects.filter(account=self.account).values_list('pk', flat=True)))
+        self.assertEqual(len(self.client.get(reverse('loan_list')).context['loans']), 1)
+
+    def test_date_filtered_queries_only_scan_their_partitions(self):
+        self.manage()
+        month = partitions.add_months(self.current, -2)
+        queryset = Transaction.objects.filter(account=self.account, timestamp__gte=month + timedelta(days=3),
+                                              timestamp__lt=month + timedelta(days=10))
+        plan = queryset.explain()
+        self.assertIn(partitions.partition_name(month), plan)
+        self.assertEqual(plan.count(f'{partitions.TABLE}_'), 1, plan)
+
+    def test_old_partitions_are_detached_unless_they_hold_open_loans(self):
+        self.manage()
+        oldest, second = partitions.add_months(self.current, -3), partitions.add_months(self.current, -2)
+        output = self.manage('--retain', '1')
+        self.assertIn(f'kept {partitions.partition_name(oldest)}: it holds open loans', output)
+        self.assertIn(f'detached {partitions.partition_name(second)}', output)
+        self.assertFalse(Transaction.objects.filter(timestamp__gte=second, timestamp__lt=partitions.add_months(second, 1)))
+        self.assertTrue(Transaction.objects.filter(pk=self.old_loan.pk))
+
+
+class StatementExportTests(TestCase):
+    def test_jsonl_export_honours_date_range(self):
+        [account] = create_accounts(1, prefix='export')
+        seed_transactions(account, 72, start=timezone.now() - timedelta(days=3), step=timedelta(hours=1))
+        self.client.force_login(account.user)
+        yesterday = str(timezone.localdate() - timedelta(days=1))
+        response = self.client.get(reverse('transaction_export'), {
+            'format': 'jsonl', 'start_date': yesterday, 'end_date': yesterday,
+        })
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        expected = Transaction.objects.filter(account=account, timestamp__date=yesterday)
+        self.assertEqual([row['id'] for row in rows], list(expected.values_list('pk', flat=True)))
+
+    def test_malformed_dates_are_rejected(self):
+        [account] = create_accounts(1, prefix='export')
+        self.client.force_login(account.user)
+        for name in ('transaction_export', 'transaction_report'):
+            response = self.client.get(reverse(name), {'start_date': '2024-13-01', 'end_date': 'today'})
+            self.assertEqual(response.status_code, 400)
+
+
+@tag('slow')
+class StatementExportMemoryTests(TestCase):
+    ROWS = 1_000_000
+    RSS_CEILING_KB = 64 * 1024
+
+    @classmethod
+    def setUpTestData(cls):
+        [cls.account] = create_accounts(1, prefix='export-memory')
+        seed_transactions(cls.account, cls.ROWS)
+
+    def test_csv_export_streams_in_flat_memory(self):
+        self.client.force_login(self.account.user)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        response = self.client.get(reverse('transaction_export'), {'format': 'csv'})
+        lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        self.assertEqual(lines, self.ROWS + 1)
+        self.assertLess(peak - baseline, self.RSS_CEILING_KB)
+
+
+class LoanCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.account] = create_accounts(1, prefix='loans', balance=Decimal('5000.00'))
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def request_loan(self, amount):
+        self.client.post(reverse('loan_request'), {'amount': amount, 'transaction_type': LOAN})
+        return Transaction.objects.filter(account=self.account, transaction_type=LOAN).latest('pk')
+
+    def counters(self):
+        return UserBankAccount.objects.values_list('active_loans', 'pending_loans', 'loan_principal').get(
+            pk=self.account.pk)
+
+    def test_counters_follow_request_approval_and_repayment(self):
+        first, second = self.request_loan('1000'), self.request_loan('400')
+        self.assertEqual(self.counters(), (0, 2, 0))
+        approve_loan(first)
+        approve_loan(first)
+        approve_loan(second)
+        self.assertEqual(self.counters(), (2, 0, 1400))
+        self.client.get(reverse('pay', args=[first.pk]))
+        self.assertEqual(self.counters(), (1, 0, 400))
+
+    def test_approved_loans_cannot_be_changed_in_the_admin(self):
+        loan = approve_loan(self.request_loan('1000'))
+        admin_user = User.objects.create_superuser('loan-admin', password='secret')
+        self.client.force_login(admin_user)
+        url = reverse('admin:transactions_transaction_change', args=[loan.pk])
+        self.assertNotContains(self.client.get(url), 'name="amount"')
+        self.client.post(url, {'amount': '9000', 'loan_approve': '', 'balance_after_transaction': '6000.00'})
+        stale = Transaction.objects.get(pk=loan.pk)
+        stale.amount = Decimal('9000')
+        approve_loan(stale)
+        loan.refresh_from_db()
+        self.assertEqual((loan.amount, loan.loan_approve, stale.amount), (Decimal('1000.00'), True, Decimal('1000.00')))
+        self.assertEqual(self.counters(), (1, 0, 1000))
+        self.assertEqual(UserBankAccount.objects.get(pk=self.account.pk).balance, Decimal('6000.00'))
+
+    def test_admin_cannot_move_balances_around_the_journal(self):
+        txn = post_transaction(self.account, Decimal('100.00'), DEPOSIT)
+        admin_user = User.objects.create_superuser('ledger-admin', password='secret')
+        self.client.force_login(admin_user)
+        txn_url = reverse('admin:transactions_transaction_change', args=[txn.pk])
+        account_url = reverse('admin:accounts_userbankaccount_change', args=[self.account.pk])
+        for url, field in ((txn_url, 'amount'), (txn_url, 'balance_after_transaction'), (account_url, 'balance')):
+            self.assertNotContains(self.client.get(url), f'name="{field}"')
+        self.client.post(txn_url, {'amount': '900', 'balance_after_transaction': '1.00'})
+        self.client.post(account_url, {
+            'user': self.account.user_id, 'bank': 1, 'account_type': 'Savings', 'account_no': self.account.account_no,
+            'gender': 'Female', 'balance': '1.00',
+        })
+        account = UserBankAccount.objects.get(pk=self.account.pk)
+        self.assertEqual((account.balance, account.account_type), (Decimal('5100.00'), 'Savings'))
+        self.assertEqual(Transaction.objects.get(pk=txn.pk).amount, Decimal('100.00'))
+        self.assertEqual(journal.snapshot_accounts(UserBankAccount.objects.filter(pk=account.pk))[1], [])
+
+    def test_limit_check_reads_the_counter(self):
+        UserBankAccount.objects.filter(pk=self.account.pk).update(active_loans=3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('loan_request'), {'amount': '100', 'transaction_type': LOAN})
+        self.assertContains(response, 'loan limits')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+    def test_reconcile_command_rebuilds_counters(self):
+        approve_loan(self.request_loan('1000'))
+        self.request_loan('250')
+        UserBankAccount.objects.filter(pk=self.account.pk).update(active_loans=7, pending_loans=0, loan_principal=1)
+        out = StringIO()
+        call_command('reconcile_loan_counters', stdout=out)
+        self.assertIn('fixed loan counters of 1 accounts', out.getvalue())
+        self.assertEqual(self.counters(), (1, 1, 1000))
+
+
+class ReconcileLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        cls.account, cls.other = create_accounts(2, prefix='ledger', balance=Decimal('1000.00'))
+        for account in (cls.account, cls.other):
+            seed_transactions(account, 30)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_ledger', '--workers', '0', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_postings_loans_and_transfers_reconcile(self):
+        transfer(self.account, self.other, Decimal('200.00'))
+        loan = post_transaction(self.account, Decimal('500.00'), LOAN)
+        post_transaction(self.account, Decimal('100.00'), DEPOSIT)
+        approve_loan(loan)
+        paid = post_transaction(self.other, Decimal('300.00'), LOAN)
+        approve_loan(paid)
+        post_transaction(self.other, Decimal('75.00'), WITHDRAWAL)
+        repay_loan(paid)
+        post_transaction(self.account, Decimal('60.00'), WITHDRAWAL)
+        report = self.reconcile()
+        self.assertEqual((report['accounts'], report['transactions'], report['drift']), (2, 67, []))
+
+    def test_drift_and_chain_breaks_are_reported(self):
+        UserBankAccount.objects.filter(pk=self.account.pk).update(balance=F('balance') + 10)
+        broken = Transaction.objects.filter(account=self.other).order_by('pk')[10]
+        Transaction.objects.filter(pk=broken.pk).update(balance_after_transaction=F('balance_after_transaction') - 1)
+        drift = {row['account_no']: row for row in self.reconcile()['drift']}
+        self.assertEqual((drift[self.account.account_no]['drift'], drift[self.account.account_no]['chain_breaks']),
+                         ('10.00', 0))
+        self.assertEqual([b['id'] for b in drift[self.other.account_no]['first_breaks']],
+                         [broken.pk, Transaction.objects.filter(account=self.other).order_by('pk')[11].pk])
+
+    def test_incremental_runs_replay_changed_accounts_only(self):
+        self.assertEqual(self.reconcile('--incremental')['accounts'], 2)
+        self.assertEqual(self.reconcile('--incremental')['accounts'], 0)
+        post_transaction(self.other, Decimal('100.00'), DEPOSIT)
+        report = self.reconcile('--incremental')
+        self.assertEqual((report['accounts'], report['transactions']), (1, 31))
+
+    def test_archived_history_is_replayed(self):
+        Transaction.objects.filter(account=self.account).update(timestamp=F('timestamp') - timedelta(days=400))
+        with override_settings(TRANSACTION_ARCHIVE_DIR=self.enterContext(tempfile.TemporaryDirectory())):
+            call_command('archive_transactions', stdout=StringIO())
+            post_transaction(self.account, Decimal('100.00'), DEPOSIT)
+            report = self.reconcile(str(self.account.account_no))
+        self.assertEqual((report['transactions'], report['drift']), (31, []))
+
+
+class LedgerImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.account] = create_accounts(1, prefix='import', balance=Decimal('100.00'))
+
+    def write(self, name, text):
+        path = f'{self.enterContext(tempfile.TemporaryDirectory())}/{name}'
+        with open(path, 'w') as target:
+            target.write(text)
+        return path
+
+    def csv(self, *rows):
+        lines = ['account_no,timestamp,transaction_type,amount']
+        lines += [f'{self.account.account_no},2024-01-{day:02},{kind},{amount}' for day, kind, amount in rows]
+        return self.write('ledger.csv', '\n'.join(lines) + '\n')
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_ledger', path, '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def history(self):
+        return list(Transaction.objects.filter(account=self.account).order_by('pk').values_list(
+            'amount', 'balance_after_transaction'))
+
+    def test_rows_chain_after_the_balance_and_move_it_once(self):
+        self.run_import(self.csv((1, '1', '50.00'), (2, 'Withdrawal', '30.00'), (3, 'Deposite', '5.25')))
+        self.assertEqual(self.history(), [
+            (Decimal('50.00'), Decimal('150.00')), (Decimal('30.00'), Decimal('120.00')),
+            (Decimal('5.25'), Decimal('125.25')),
+        ])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('125.25'))
+        self.assertEqual(journal.balance_at(self.account), Decimal('125.25'))
+
+    def test_an_interrupted_import_resumes_after_its_last_batch(self):
+        path = self.csv((1, '1', '50.00'), (2, '1', '10.00'), (3, '1', 'ten'), (4, '1', '1.00'))
+        with self.assertRaisesMessage(CommandError, 'line 4'):
+            self.run_import(path)
+        self.assertEqual(len(self.history()), 2)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+
+        with open(path) as source:
+            fixed = source.read().replace(',ten', ',20.00')
+        with open(path, 'w') as target:
+            target.write(fixed)
+        self.assertIn('resumed after line 3', self.run_import(path))
+        self.assertEqual([balance for _, balance in self.history()],
+                         [Decimal('150.00'), Decimal('160.00'), Decimal('180.00'), Decimal('181.00')])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('181.00'))
+
+    def test_invalid_rows_are_rejected_or_skipped(self):
+        path = self.csv((1, '1', '50.00'), (2, 'Withdrawal', '500.00'), (3, 'Refund', '1.00'))
+        with self.assertRaisesMessage(CommandError, 'would drop to -350.00'):
+            self.run_import(path)
+        self.assertIn('skipped 2', self.run_import(path, '--skip-invalid', '--restart'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('150.00'))
+
+    def test_unreadable_files_are_reported(self):
+        with self.assertRaisesMessage(CommandError, 'has no transaction_type, amount column'):
+            self.run_import(self.write('ledger.csv', 'account_no,timestamp\n1,2024-01-01\n'))
+        row = json.dumps({'account_no': self.account.account_no, 'timestamp': '2024-01-01',
+                          'transaction_type': 1, 'amount': '50.00'})
+        path = self.write('ledger.jsonl', f'{row}\n{{"amount": \n[1, 2]\n')
+        with self.assertRaisesMessage(CommandError, 'line 2: invalid JSON'):
+            self.run_import(path)
+        self.assertIn('skipped 2', self.run_import(path, '--skip-invalid', '--restart'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('150.00'))
+
+
+ROLLUP_FIELDS = ('date', 'opening_balance', 'closing_balance', 'credits', 'debits', 'count')
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.account] = create_accounts(1, prefix='rollup', balance=Decimal('1000.00'))
+        # Days 2 and 4 have no activity.
+        for day, hour, amount, transaction_type in [
+            (1, 9, '500.00', DEPOSIT), (1, 15, '120.00', WITHDRAWAL), (3, 10, '75.50', DEPOSIT),
+            (3, 11, '300.00', WITHDRAWAL), (3, 18, '20.00', DEPOSIT), (5, 12, '999.99', WITHDRAWAL),
+        ]:
+            when = timezone.make_aware(datetime(2026, 3, day, hour))
+            post_transaction(cls.account, Decimal(amount), transaction_type, timestamp=when)
+
+    def raw_summary(self, start_date, end_date):
+        rows = Transaction.objects.filter(account=self.account).order_by('timestamp', 'pk')
+        before = [txn for txn in rows if timezone.localdate(txn.timestamp) < start_date]
+        within = [txn for txn in rows if start_date <= timezone.localdate(txn.timestamp) <= end_date]
+        opening = before[-1].balance_after_transaction if before else Decimal('1000.00')
+        return {
+            'opening_balance': opening,
+            'closing_balance': within[-1].balance_after_transaction if within else opening,
+            'credits': sum((txn.amount for txn in within if txn.transaction_type == DEPOSIT), Decimal(0)),
+            'debits': sum((txn.amount for txn in within if txn.transaction_type == WITHDRAWAL), Decimal(0)),
+            'count': len(within),
+        }
+
+    def test_summaries_match_the_raw_transactions(self):
+        for start, end in [(1, 5), (1, 1), (2, 2), (2, 4), (3, 3), (4, 4), (4, 6), (6, 9)]:
+            start_date, end_date = date(2026, 3, start), date(2026, 3, end)
+            with self.subTest(start=start, end=end):
+                self.assertEqual(summarize(self.account, start_date, end_date), self.raw_summary(start_date, end_date))
+        self.assertEqual(summarize(self.account, date(2026, 2, 1), date(2026, 2, 28))['closing_balance'],
+                         Decimal('1000.00'))
+
+    def test_backfill_reproduces_the_rollup_the_postings_built(self):
+        built = list(DailyBalance.objects.filter(account=self.account).order_by('date').values_list(*ROLLUP_FIELDS))
+        self.assertEqual([row[0] for row in built], [date(2026, 3, day) for day in (1, 3, 5)])
+        self.assertEqual(built[-1][2], UserBankAccount.objects.get(pk=self.account.pk).balance)
+        DailyBalance.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_daily_balances', stdout=out)
+        self.assertEqual(out.getvalue(), 'rebuilt 3 daily balances\n')
+        rebuilt = list(DailyBalance.objects.filter(account=self.account).order_by('date').values_list(*ROLLUP_FIELDS))
+        self.assertEqual(rebuilt, built)
+
+
+class InterestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.savings] = create_accounts(1, prefix='savings', balance=Decimal('12345.67'), account_type='Savings')
+        [cls.current] = create_accounts(1, prefix='current', balance=Decimal('12345.67'))
+
+    def expected(self, balance, days, rate=Decimal('0.035')):
+        return (balance * rate * days / 365).quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN)
+
+    def test_accruals_round_half_even_like_decimal(self):
+        rate = interest.rate_units(Decimal('0.365'))
+        cents = np.array([1500, 2500, 1499, 1501, 0, 987654321], dtype=np.int64)
+        days = np.array([1, 1, 1, 1, 1, 3], dtype=np.int64)
+        self.assertEqual(interest.accruals(cents, days, rate, 365).tolist(), [2, 2, 1, 2, 0, 2962963])
+        # Past int64 the arrays switch to Python integers and stay exact.
+        huge = np.array([10 ** 17 + 500], dtype=np.int64)
+        self.assertEqual(interest.accruals(huge, np.array([1]), rate, 365).tolist(), [10 ** 14])
+        with self.assertRaises(ValueError):
+            interest.rate_units(Decimal('0.0000001'))
+
+    def test_savings_accounts_are_credited_once_per_date(self):
+        day = date(2026, 10, 16)
+        amount = self.expected(Decimal('12345.67'), 1)
+        self.assertEqual(interest.accrue_interest(day), (1, 1, amount))
+        self.assertEqual(interest.accrue_interest(day), (0, 0, Decimal(0)))
+        self.savings.refresh_from_db()
+        self.current.refresh_from_db()
+        self.assertEqual((self.savings.balance, self.savings.interest_accrued_through),
+                         (Decimal('12345.67') + amount, day))
+        self.assertEqual(self.current.balance, Decimal('12345.67'))
+        credit = Transaction.objects.get(account=self.savings, transaction_type=INTEREST)
+        self.assertEqual((credit.amount, credit.balance_after_transaction), (amount, self.savings.balance))
+        self.assertEqual(DailyBalance.objects.get(account=self.savings).closing_balance, self.savings.balance)
+
+        out = StringIO()
+        call_command('reconcile_ledger', '--workers', '0', str(self.savings.account_no), stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['drift'], [])
+
+    def test_missed_days_are_made_up(self):
+        interest.accrue_interest(date(2026, 10, 16))
+        self.savings.refresh_from_db()
+        balance = self.savings.balance
+        interest.accrue_interest(date(2026, 10, 19))
+        self.savings.refresh_from_db()
+        self.assertEqual(self.savings.balance, balance + self.expected(balance, 3))
+
+
+class JournalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        cls.account, cls.other = create_accounts(2, prefix='journal', balance=Decimal('1000.00'))
+        [cls.savings] = create_accounts(1, prefix='journal-savings', balance=Decimal('2000.00'), account_type='Savings')
+
+    def test_every_posting_is_a_balanced_entry(self):
+        post_transaction(self.account, Decimal('300.00'), DEPOSIT)
+        post_transaction(self.account, Decimal('120.00'), WITHDRAWAL)
+        loan = post_transaction(self.account, Decimal('500.00'), LOAN)
+        approve_loan(loan)
+        repay_loan(loan)
+        transfer(self.account, self.other, Decimal('200.00'))
+        batch_transfer(self.other, [
+            (self.account.account_no, Decimal('150.00')), (self.savings.account_no, Decimal('160.00')),
+        ])
+        interest.accrue_interest(date(2026, 10, 16))
+
+        self.assertFalse(JournalPosting.objects.values('entry').annotate(total=Sum('amount')).exclude(total=0))
+        for account in UserBankAccount.objects.all():
+            self.assertEqual(journal.balance_at(account), account.balance)
+        paid = Transaction.objects.get(transaction_type=INTEREST).amount
+        self.assertEqual(
+            [journal.balance_at(book=name) for name in (CASH, LOANS, INTEREST_EXPENSE)],
+            [Decimal('180.00'), Decimal('0.00'), paid],
+        )
+
+        out = StringIO()
+        call_command('snapshot_balances', stdout=out)
+        self.assertEqual(out.getvalue(), 'snapshotted 3 accounts and 4 books\n')
+
+    def test_historical_balances_start_from_the_latest_snapshot(self):
+        [account] = create_accounts(1, prefix='journal-history')
+        now = timezone.now()
+        for days, amount in ((3, '100.00'), (2, '200.00')):
+            post_transaction(account, Decimal(amount), DEPOSIT, timestamp=now - timedelta(days=days))
+        journal.snapshot_accounts(UserBankAccount.objects.filter(pk=account.pk))
+        post_transaction(account, Decimal('300.00'), DEPOSIT, timestamp=now - timedelta(days=1))
+
+        self.assertEqual(journal.balance_at(account, at=now - timedelta(days=2, hours=12)), Decimal('100.00'))
+        self.assertEqual(journal.balance_at(account, at=now - timedelta(days=1, hours=12)), Decimal('300.00'))
+        snapshot = BalanceSnapshot.objects.get(account=account)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(journal.balance_at(account), Decimal('600.00'))
+        self.assertEqual(len(queries), 2)
+        self.assertIn(f'> {snapshot.through}', queries[1]['sql'])
+
+    def test_snapshots_report_balances_that_differ_from_the_journal(self):
+        journal.snapshot_accounts()
+        UserBankAccount.objects.filter(pk=self.other.pk).update(balance=F('balance') + 10)
+        taken, mismatched = journal.snapshot_accounts()
+        self.assertEqual(taken, 0)
+        self.assertEqual(mismatched, [
+            {'account_no': self.other.account_no, 'balance': Decimal('1010.00'), 'journal': Decimal('1000.00')},
+        ])
+
+    def test_unbalanced_entries_are_rejected(self):
+        with self.assertRaises(journal.UnbalancedEntry):
+            journal.record(DEPOSIT, timezone.now(), [journal.customer(self.account.pk, Decimal('10.00'))])
+        self.assertEqual(JournalEntry.objects.filter(kind=DEPOSIT).count(), 0)
+
+
+class BenchCommandTests(TestCase):
+    def test_benchmarks_leave_the_database_as_they_found_it(self):
+        out = StringIO()
+        call_command('bench_journal', '--postings', '20', '--after-snapshot', '5', '--repeat', '1', stdout=out)
+        self.assertIn('equal', out.getvalue())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(JournalEntry.objects.exists())
+
+        call_command('bench_journal', '--postings', '20', '--after-snapshot', '5', '--repeat', '1', '--keep',
+                     stdout=StringIO())
+        self.assertTrue(User.objects.filter(username__startswith='bench-journal-').exists())
+
+    def test_benchmarks_refuse_remote_databases(self):
+        self.assertTrue(is_scratch_database(connection))
+        with patch.object(connection, 'vendor', 'postgresql'), patch.dict(connection.settings_dict, HOST='db.example.com'):
+            self.assertFalse(is_scratch_database(connection))
+            with self.assertRaisesMessage(CommandError, '--yes-i-mean-it'):
+                call_command('bench_journal', '--postings', '20', '--repeat', '1', stdout=StringIO())
+        self.assertFalse(User.objects.exists())
+
+
+class BatchTransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.employer] = create_accounts(1, prefix='employer', balance=Decimal('100000.00'))
+        cls.employees = create_accounts(40, prefix='employee', balance=Decimal('10.00'))
+
+    def setUp(self):
+        self.client.force_login(self.employer.user)
+
+    def pay(self, lines, **headers):
+        transfers = [{'account_no': account_no, 'amount': amount} for account_no, amount in lines]
+        return self.client.post(reverse('batch_transfer'), {'transfers': transfers}, content_type='application/json',
+                                headers=headers)
+
+    def balances(self):
+        return dict(UserBankAccount.objects.values_list('account_no', 'balance'))
+
+    def test_pays_every_line_with_consistent_rows_and_rollups(self):
+        lines = [(employee.account_no, '1500.50') for employee in self.employees[:5]]
+        lines.append((self.employees[0].account_no, '200'))
+        response = self.pay(lines)
+        self.assertEqual(response.json(), {'transfers': 6, 'total': '7702.50', 'balance': '92297.50'})
+
+        balances = self.balances()
+        self.assertEqual(balances[self.employer.account_no], Decimal('92297.50'))
+        self.assertEqual(balances[self.employees[0].account_no], Decimal('1710.50'))
+        self.assertEqual(balances[self.employees[4].account_no], Decimal('1510.50'))
+        debits = Transaction.objects.filter(account=self.employer, transaction_type=TRANSFER_TO_OTHER).order_by('pk')
+        self.assertEqual([txn.balance_after_transaction for txn in debits][-1], Decimal('92297.50'))
+        self.assertEqual(Transaction.objects.filter(transaction_type=TRANSFER_FROM_OTHER).count(), 6)
+        self.assertEqual(OutboxEmail.objects.count(), 7)
+
+        for account in (self.employer, self.employees[0]):
+            rollup = list(DailyBalance.objects.filter(account=account).values_list(*ROLLUP_FIELDS))
+            rebuild_account(account)
+            self.assertEqual(rollup, list(DailyBalance.objects.filter(account=account).values_list(*ROLLUP_FIELDS)))
+
+    def test_rejects_the_whole_batch_with_line_errors(self):
+        before = self.balances()
+        response = self.pay([
+            (self.employees[0].account_no, '500'),
+            (999999999, '500'),
+            (self.employer.account_no, '500'),
+            (self.employees[1].account_no, '20'),
+            (self.employees[2].account_no, '1.001'),
+        ])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual([error['line'] for error in response.json()['errors']], [4])
+        response = self.pay([
+            (self.employees[0].account_no, '500'),
+            (999999999, '500'),
+            (self.employer.account_no, '500'),
+            (self.employees[1].account_no, '20'),
+        ])
+        self.assertEqual([error['line'] for error in response.json()['errors']], [1, 2, 3])
+        self.assertEqual(self.pay([(self.employees[0].account_no, '100000.01')]).json()['errors'][0]['line'], None)
+        self.assertEqual(self.balances(), before)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_retries_with_the_same_key_pay_once(self):
+        lines = [(employee.account_no, '150') for employee in self.employees[:3]]
+        first = self.pay(lines, **{'Idempotency-Key': 'payroll-1'})
+        retry = self.pay(lines, **{'Idempotency-Key': 'payroll-1'})
+        self.assertEqual((retry.status_code, retry.json(), retry['Idempotent-Replayed']), (200, first.json(), 'true'))
+        self.assertEqual(self.balances()[self.employer.account_no], Decimal('99550.00'))
+        reused = self.pay(lines[:1], **{'Idempotency-Key': 'payroll-1'})
+        self.assertEqual(reused.status_code, 422)
+        self.assertEqual(Transaction.objects.filter(transaction_type=TRANSFER_FROM_OTHER).count(), 3)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.pay([(self.employees[0].account_no, '150')])
+        counts = []
+        for employees in (self.employees[:4], self.employees[4:]):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.pay([(employee.account_no, '150') for employee in employees]).status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        cls.account, cls.recipient = create_accounts(2, prefix='api', balance=Decimal('5000.00'))
+        seed_transactions(cls.account, 30)
+        Transaction.objects.create(account=cls.account, amount=700, balance_after_transaction=cls.account.balance,
+                                   transaction_type=LOAN)
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def post(self, name, data, **headers):
+        return self.client.post(reverse(name), data, content_type='application/json', headers=headers)
+
+    def test_requires_a_session(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_balance')).status_code, 401)
+
+    def test_balance_and_loans(self):
+        self.assertEqual(self.client.get(reverse('api_balance')).json(), {
+            'account_no': self.account.account_no, 'account_type': 'Current', 'balance': str(self.account.balance),
+        })
+        [loan] = self.client.get(reverse('api_loans')).json()['results']
+        self.assertEqual((loan['amount'], loan['approved']), ('700.00', False))
+
+    def test_sessions_from_model_backend_load_the_account(self):
+        self.client.force_login(self.account.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('api_balance')).json()['balance'], str(self.account.balance))
+        self.assertEqual(len(self.client.get(reverse('api_loans')).json()['results']), 1)
+        balance = self.account.balance
+        self.assertEqual(self.post('api_deposit', {'amount': '500'}).status_code, 201)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, balance + 500)
+
+    def test_retries_with_the_same_key_move_money_once(self):
+        data = {'amount': '150', 'recipient_account': self.recipient.account_no}
+        first = self.post('api_transfer', data, **{'Idempotency-Key': 'api-transfer-1'})
+        retry = self.post('api_transfer', data, **{'Idempotency-Key': 'api-transfer-1'})
+        self.assertEqual((retry.status_code, retry.json(), retry['Idempotent-Replayed']), (201, first.json(), 'true'))
+        self.recipient.refresh_from_db()
+        self.assertEqual(self.recipient.balance, Decimal('5150.00'))
+        self.assertEqual(self.post('api_deposit', {'amount': '500'}, **{'Idempotency-Key': 'api-transfer-1'}).status_code,
+                         422)
+
+    def test_malformed_recipient_is_a_validation_error(self):
+        response = self.post('api_transfer', {'amount': '150', 'recipient_account': 'not-a-number'})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('recipient_account', response.json()['errors'])
+
+    def test_balance_at_a_past_moment(self):
+        url = reverse('api_balance')
+        now = timezone.now().isoformat()
+        self.assertEqual(self.client.get(url, {'at': now}).json()['balance'], str(self.account.balance))
+        self.assertEqual(self.client.get(url, {'at': '2000-01-01T00:00:00Z'}).json()['balance'], '0.00')
+        self.assertEqual(self.client.get(url, {'at': 'yesterday'}).status_code, 400)
+
+    def test_transactions_are_paginated_by_cursor(self):
+        first = self.client.get(reverse('api_transactions'), {'page_size': 20}).json()
+        second = self.client.get(reverse('api_transactions'), {'page_size': 20, 'after': first['next']}).json()
+        self.assertEqual((len(first['results']), len(second['results'])), (20, 11))
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(reverse('api_transactions'), {'after': '!'}).status_code, 400)
+
+    def test_deposit_withdraw_and_transfer(self):
+        self.assertEqual(self.post('api_deposit', {'amount': '100'}).status_code, 201)
+        self.assertEqual(self.post('api_withdraw', {'amount': '600'}).json()['type'], 'withdrawal')
+        response = self.post('api_transfer', {'amount': '150', 'recipient_account': self.recipient.account_no})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UserBankAccount.objects.get(pk=self.recipient.pk).balance, Decimal('5150.00'))
+        self.assertEqual(UserBankAccount.objects.get(pk=self.account.pk).balance, self.account.balance - 650)
+
+    def test_invalid_requests_are_rejected(self):
+        response = self.post('api_withdraw', {'amount': '100'})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('amount', response.json()['errors'])
+        self.assertEqual(self.post('api_transfer', {'amount': '150', 'recipient_account': '1'}).status_code, 422)
+        self.assertEqual(self.client.post(reverse('api_deposit'), '[]', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_deposit')).status_code, 405)
+
+    async def test_concurrent_requests_on_one_event_loop(self):
+        await self.async_client.aforce_login(self.account.user)
+        responses = await asyncio.gather(*[self.async_client.get(reverse('api_balance')) for _ in range(20)])
+        self.assertEqual({response.status_code for response in responses}, {200})
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bank.objects.create(pk=1)
+        [cls.account] = create_accounts(1, prefix='etag', balance=Decimal('5000.00'))
+        seed_transactions(cls.account, 30)
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def refresh(self, name, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(reverse(name), HTTP_ACCEPT_ENCODING='gzip', headers=headers)
+
+    def test_unchanged_pages_answer_304_without_reading_transactions(self):
+        for name in ('transaction_report', 'loan_list'):
+            first = self.refresh(name)
+            self.assertEqual((first.status_code, first['Content-Encoding']), (200, 'gzip'))
+            self.assertIn('private', first['Cache-Control'])
+            with CaptureQueriesContext(connection) as queries:
+                second = self.refresh(name, first['ETag'])
+            self.assertEqual(second.status_code, 304)
+            self.assertFalse([q for q in queries if 'transactions_transaction' in q['sql']])
+
+    def test_postings_and_flash_messages_change_the_page(self):
+        etag = self.refresh('transaction_report')['ETag']
+        post_transaction(self.account, Decimal('100.00'), DEPOSIT)
+        response = self.refresh('transaction_report', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        self.client.post(reverse('deposit_money'), {'amount': '100'})
+        response = self.refresh('loan_list', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_admin_edits_change_the_page(self):
+        etag = self.refresh('transaction_report')['ETag']
+        txn = Transaction.objects.filter(account=self.account).first()
+        txn.amount += 1
+        TransactionAdmin(Transaction, admin.site).save_model(None, txn, None, True)
+        response = self.refresh('transaction_report', etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        account = UserBankAccount.objects.get(pk=self.account.pk)
+        account.account_type = 'Savings'
+        UserBankAccountAdmin(UserBankAccount, admin.site).save_model(None, account, None, True)
+        self.assertEqual(self.refresh('transaction_report', etag).status_code, 200)
+        self.assertEqual(account.version, UserBankAccount.objects.get(pk=account.pk).version)
+
+    def test_hit_ratio_of_a_replayed_refresh_workload(self):
+        """A customer refreshing both pages 50 times while 4 postings arrive in between."""
+        etags, hits = {}, 0
+        for i in range(50):
+            if i and i % 10 == 0:
+                post_transaction(self.account, Decimal('10.00'), DEPOSIT)
+            for name in ('transaction_report', 'loan_list'):
+                response = self.refresh(name, etags.get(name))
+                hits += response.status_code == 304
+                etags[name] = response['ETag']
+        self.assertEqual(hits / 100, 0.9)
+
+
+class PostingTests(TransactionTestCase):
+    def setUp(self):
+        Bank.objects.create(pk=1)
+        self.sender, self.recipient = create_accounts(2, prefix='posting', balance=Decimal('1000.00'))
+
+    def balances(self):
+        return [UserBankAccount.objects.get(pk=account.pk).balance for account in (self.sender, self.recipient)]
+
+    def test_transfer_debits_and_credits_once(self):
+        debit = transfer(self.sender, self.recipient, Decimal('150.00'))
+        self.assertEqual(self.balances(), [Decimal('850.00'), Decimal('1150.00')])
+        self.assertEqual(list(Transaction.objects.order_by('account_id').values_list(
+            'account_id', 'transaction_type', 'amount', 'balance_after_transaction',
+        )), [
+            (self.sender.pk, TRANSFER_TO_OTHER, Decimal('150.00'), Decimal('850.00')),
+            (self.recipient.pk, TRANSFER_FROM_OTHER, Decimal('150.00'), Decimal('1150.00')),
+        ])
+        self.assertEqual(debit.balance_after_transaction, Decimal('850.00'))
+
+    def test_withdrawal_over_the_balance_changes_nothing(self):
+        postings = JournalPosting.objects.count()
+        with self.assertRaises(InsufficientFunds):
+            post_transaction(self.sender, Decimal('1000.01'), WITHDRAWAL)
+        self.assertEqual(self.balances()[0], Decimal('1000.00'))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(JournalPosting.objects.count(), postings)
+
+    def test_concurrent_transfers_keep_balances_consistent(self):
+        """Opposite transfers from parallel threads, each retrying on database errors."""
+        directions = [(self.sender, self.recipient), (self.recipient, self.sender)] * 4
+        # Each side may pay out 4 × 5 × 100 before receiving anything back.
+        for account in (self.sender, self.recipient):
+            post_transaction(account, Decimal('1000.00'), DEPOSIT)
+        barrier = threading.Barrier(len(directions), timeout=30)
+        done = []
+
+        def run(sender, recipient):
+            sender, recipient = UserBankAccount.objects.get(pk=sender.pk), UserBankAccount.objects.get(pk=recipient.pk)
+            barrier.wait()
+            try:
+                for _ in range(5):
+                    for _ in range(50):
+                        try:
+                            transfer(sender, recipient, Decimal('100.00'))
+                            done.append(sender.pk)
+                            break
+                        except OperationalError:
+                            time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=pair) for pair in directions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(done), 40)
+        self.assertEqual(self.balances(), [Decimal('2000.00'), Decimal('2000.00')])
+        self.assertEqual(Transaction.objects.count(), 82)
+        for account in (self.sender, self.recipient):
+            self.assertEqual(journal.balance_at(account), Decimal('2000.00'))
+        out = StringIO()
+        call_command('reconcile_ledger', '--workers', '0', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['drift'], [])
+
+
+class IdempotencyTests(TransactionTestCase):
+    def setUp(self):
+        Bank.objects.create(pk=1)
+        self.account, self.recipient = create_accounts(2, prefix='retry', balance=Decimal('5000.00'))
+
+    def fire(self, url, data, key, clients=8):
+        """POST the same request from parallel clients, each retrying on database errors like a mobile client."""
+        barrier = threading.Barrier(clients, timeout=30)
+        responses = []
+
+        def run(client):
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        responses.append(client.post(url, data, HTTP_IDEMPOTENCY_KEY=key))
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = []
+        for _ in range(clients):
+            client = Client()
+            client.force_login(self.account.user)
+            threads.append(threading.Thread(target=run, args=(client,)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(responses), clients)
+        return responses
+
+    def balances(self):
+        return [UserBankAccount.objects.get(pk=account.pk).balance for account in (self.account, self.recipient)]
+
+    def test_parallel_duplicate_deposits_post_once(self):
+        responses = self.fire(reverse('deposit_money'), {'amount': '500', 'transaction_type': DEPOSIT}, 'deposit-1')
+        self.assertEqual({response.status_code for response in responses}, {302})
+        self.assertEqual(Transaction.objects.filter(account=self.account, transaction_type=DEPOSIT).count(), 1)
+        self.assertEqual(self.balances(), [Decimal('5500.00'), Decimal('5000.00')])
+        # The winner may itself have been retried after a lock error past its commit, and then replays too.
+        self.assertLessEqual(sum(response.get('Idempotent-Replayed') != 'true' for response in responses), 1)
+
+    def test_parallel_duplicate_transfers_post_once(self):
+        data = {'amount': '150', 'transaction_type': TRANSFER_TO_OTHER, 'recipient_account': self.recipient.account_no}
+        responses = self.fire(reverse('transfer_money'), data, 'transfer-1')
+        self.assertEqual({response.status_code for response in responses}, {302})
+        self.assertEqual(Transaction.objects.filter(transaction_type=TRANSFER_TO_OTHER).count(), 1)
+        self.assertEqual(self.balances(), [Decimal('4850.00'), Decimal('5150.00')])
+
+    def test_retry_after_balance_changed_replays_original_outcome(self):
+        self.client.force_login(self.account.user)
+        data = {'amount': '4000', 'transaction_type': WITHDRAWAL}
+        first = self.client.post(reverse('withdraw_money'), data, HTTP_IDEMPOTENCY_KEY='withdraw-1')
+        retry = self.client.post(reverse('withdraw_money'), data, HTTP_IDEMPOTENCY_KEY='withdraw-1')
+        self.assertEqual((retry.status_code, retry['Location']), (302, first['Location']))
+        self.assertEqual(self.balances()[0], Decimal('1000.00'))
+
+    def test_requests_that_moved_no_money_are_not_stored(self):
+        self.client.force_login(self.account.user)
+        bank = Bank.objects.get(pk=1)
+        bank.is_bankrupt = True
+        bank.save()
+        data = {'amount': '500', 'transaction_type': DEPOSIT}
+        self.assertEqual(self.client.post(reverse('deposit_money'), data, HTTP_IDEMPOTENCY_KEY='deposit-4').status_code,
+                         302)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        bank.is_bankrupt = False
+        bank.save()
+        retry = self.client.post(reverse('deposit_money'), data, HTTP_IDEMPOTENCY_KEY='deposit-4')
+        self.assertNotIn('Idempotent-Replayed', retry)
+        self.assertEqual(self.balances()[0], Decimal('5500.00'))
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.client.force_login(self.account.user)
+        self.client.post(reverse('deposit_money'), {'amount': '500', 'transaction_type': DEPOSIT},
+                         HTTP_IDEMPOTENCY_KEY='deposit-2')
+        response = self.client.post(reverse('deposit_money'), {'amount': '900', 'transaction_type': DEPOSIT},
+                                    HTTP_IDEMPOTENCY_KEY='deposit-2')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.balances()[0], Decimal('5500.00'))
+
+    def test_expired_key_runs_again_and_purge_deletes_expired(self):
+        self.client.force_login(self.account.user)
+        data = {'amount': '500', 'transaction_type': DEPOSIT}
+        self.client.post(reverse('deposit_money'), data, HTTP_IDEMPOTENCY_KEY='deposit-3')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.client.post(reverse('deposit_money'), data, HTTP_IDEMPOTENCY_KEY='deposit-3')
+        self.assertEqual(self.balances()[0], Decimal('6000.00'))
+
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('deleted 1 expired', out.getvalue())
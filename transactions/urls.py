@@ -1,12 +1,14 @@
 from django.urls import path
-from .views import DepositMoneyView, TransferMoneyView, WithdrawMoneyView, TransactionReportView,LoanRequestView,LoanListView,PayLoanView
+from .views import BatchTransferView, DepositMoneyView, TransferMoneyView, WithdrawMoneyView, TransactionReportView,TransactionExportView,LoanRequestView,LoanListView,PayLoanView
 
 urlpatterns = [
     path("deposit/", DepositMoneyView.as_view(), name="deposit_money"),
     path("report/", TransactionReportView.as_view(), name="transaction_report"),
+    path("report/export/", TransactionExportView.as_view(), name="transaction_export"),
     path("withdraw/", WithdrawMoneyView.as_view(), name="withdraw_money"),
     path("loan_request/", LoanRequestView.as_view(), name="loan_request"),
     path("loans/", LoanListView.as_view(), name="loan_list"),
     path("loans/<int:loan_id>/", PayLoanView.as_view(), name="pay"),
     path('transfer/', TransferMoneyView.as_view(), name='transfer_money'),
+    path('transfer/batch/', BatchTransferView.as_view(), name='batch_transfer'),
 ]
\ No newline at end of file
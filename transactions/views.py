@@ -1,49 +1,58 @@
+from django.conf import settings
 from django.contrib import messages
+from django.core.exceptions import BadRequest
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.shortcuts import get_object_or_404, redirect
 from django.views import View
-from django.http import HttpResponse, HttpResponseServerError
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.views.generic import CreateView, ListView
-from accounts.models import UserBankAccount
-from transactions.constants import DEPOSIT, TRANSFER_TO_OTHER, WITHDRAWAL,LOAN, LOAN_PAID
-from django.core.mail import EmailMessage, EmailMultiAlternatives
-
-from django.template.loader import render_to_string
-from datetime import datetime
-from django.db.models import Sum
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from transactions.constants import DEPOSIT, TRANSFER_TO_OTHER, WITHDRAWAL,LOAN
+from django.db import transaction
+
+from datetime import datetime, time, timedelta
+from functools import partial
+from decimal import Decimal, InvalidOperation
+import json
 from transactions.forms import (
     DepositForm,
     TransferForm,
     WithdrawForm,
     LoanRequestForm,
 )
+from transactions import archive
+from transactions.export import EXPORT_FORMATS
+from transactions.idempotency import HEADER, IdempotentPostMixin, KeyReused, json_fingerprint, posted, request_key, run_once
 from transactions.models import Transaction
-from accounts.models import Bank
+from transactions.pagination import keyset_page, merged_keyset_page
+from transactions.rollups import summarize
+from transactions.services import (
+    BatchRejected, InsufficientFunds, LoanNotPayable, batch_transfer, post_transaction, repay_loan, transfer,
+)
+from accounts.bank_status import is_bankrupt
+from core.outbox import queue_email, queue_emails
 
 
 def send_transaction_email(user, amount, subject, template):
-    message = render_to_string(template, {
+    queue_email(user.email, subject, template, {
         'user' : user,
         'amount' : amount,
     })
-    send_email = EmailMultiAlternatives(subject, '', to=[user.email])
-    send_email.attach_alternative(message, "text/html")
-    send_email.send()
 
 
 def send__money_transfer_email(user, recipient, amount, subject, template):
-    message = render_to_string(template, {
+    queue_email(user.email, subject, template, {
         'user' : user,
         'amount' : amount,
         'recipient':recipient,
     })
-    send_email = EmailMultiAlternatives(subject, '', to=[user.email])
-    send_email.attach_alternative(message, "text/html")
-    send_email.send()
 
-class TransactionCreateMixin(LoginRequiredMixin, CreateView):
+class TransactionCreateMixin(LoginRequiredMixin, IdempotentPostMixin, CreateView):
     template_name = 'transactions/transaction_form.html'
     model = Transaction
     title = ''
@@ -68,13 +77,14 @@ class TransactionCreateMixin(LoginRequiredMixin, CreateView):
 class DepositMoneyView(TransactionCreateMixin):
     form_class = DepositForm
     title = 'Deposit'
+    query_budget = 20
 
     def get_initial(self):
         initial = {'transaction_type': DEPOSIT}
         return initial
 
     def form_valid(self, form):
-        if Bank.objects.filter(is_bankrupt=True).exists():
+        if is_bankrupt(self.request.user.account.bank_id):
             messages.error(
                 self.request,
                 "The Bank is bankrupt. No transactions are allowed at the moment."
@@ -82,173 +92,264 @@ class DepositMoneyView(TransactionCreateMixin):
             return redirect('transaction_report')
         
         amount = form.cleaned_data.get('amount')
-        account = self.request.user.account
-      
-        account.balance += amount
-        account.save(
-            update_fields=[
-                'balance'
-            ]
-        )
-        
-
+        with transaction.atomic():
+            self.object = post_transaction(self.request.user.account, amount, DEPOSIT)
+            send_transaction_email(self.request.user, amount, "Deposite Message", "transactions/deposit_mail.html")
 
         messages.success(
             self.request,
             f'{"{:,.2f}".format(float(amount))}$ was deposited to your account successfully'
         )
 
-        send_transaction_email(self.request.user, amount, "Deposite Message", "transactions/deposit_mail.html")
-
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
 
 class WithdrawMoneyView(TransactionCreateMixin):
     form_class = WithdrawForm
     title = 'Withdraw Money'
+    query_budget = 20
 
     def get_initial(self):
         initial = {'transaction_type': WITHDRAWAL}
         return initial
 
     def form_valid(self, form):
-        if Bank.objects.filter(is_bankrupt=True).exists():
+        if is_bankrupt(self.request.user.account.bank_id):
             messages.error(
                 self.request,
                 "The Bank is bankrupt. No transactions are allowed at the moment."
             )
             return redirect('transaction_report')
         amount = form.cleaned_data.get('amount')
-        if amount > self.request.user.account.balance:
-            messages.error(
-                self.request,
-                "Bank is bankrupt! Unable to withdraw the requested amount."
-            )
-            return HttpResponseServerError("Bank is bankrupt! Unable to withdraw the requested amount.")
-
-        self.request.user.account.balance -= form.cleaned_data.get('amount')
-      
-        self.request.user.account.save(update_fields=['balance'])
+        try:
+            with transaction.atomic():
+                self.object = post_transaction(self.request.user.account, amount, WITHDRAWAL)
+                send_transaction_email(self.request.user, amount, "Withdrawal Message", "transactions/withdrawal_email.html")
+        except InsufficientFunds:
+            form.add_error('amount', 'You can not withdraw more than your account balance')
+            return self.form_invalid(form)
 
         messages.success(
             self.request,
             f'Successfully withdrawn {"{:,.2f}".format(float(amount))}$ from your account'
         )
-        send_transaction_email(self.request.user, amount, "Withdrawal Message", "transactions/withdrawal_email.html")
 
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
 
 
 class LoanRequestView(TransactionCreateMixin):
     form_class = LoanRequestForm
     title = 'Request For Loan'
+    query_budget = 13
 
     def get_initial(self):
         initial = {'transaction_type': LOAN}
         return initial
 
     def form_valid(self, form):
-        if Bank.objects.filter(is_bankrupt=True).exists():
+        if is_bankrupt(self.request.user.account.bank_id):
             messages.error(
                 self.request,
                 "The Bank is bankrupt. No transactions are allowed at the moment."
             )
             return redirect('transaction_report')
         amount = form.cleaned_data.get('amount')
-        current_loan_count = Transaction.objects.filter(
-            account=self.request.user.account,transaction_type=3,loan_approve=True).count()
-        if current_loan_count >= 3:
+        if self.request.user.account.active_loans >= 3:
             return HttpResponse("You have cross the loan limits")
+        self.object = post_transaction(self.request.user.account, amount, LOAN)
         messages.success(
             self.request,
             f'Loan request for {"{:,.2f}".format(float(amount))}$ submitted successfully'
         )
 
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
     
-class TransactionReportView(LoginRequiredMixin, ListView):
+class DateRangeMixin:
+    def get_date_range(self):
+        start_date_str = self.request.GET.get('start_date')
+        end_date_str = self.request.GET.get('end_date')
+        if start_date_str and end_date_str:
+            try:
+                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            except ValueError:
+                raise BadRequest('start_date and end_date must be dates as YYYY-MM-DD')
+            return start_date, end_date
+        return None, None
+
+    def get_bounds(self, start_date, end_date):
+        """The ``[start, end)`` datetimes of a date range, or ``(None, None)`` without one."""
+        if not (start_date and end_date):
+            return None, None
+        return (
+            timezone.make_aware(datetime.combine(start_date, time.min)),
+            timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)),
+        )
+
+    def filter_date_range(self, queryset, start_date, end_date):
+        start, end = self.get_bounds(start_date, end_date)
+        return queryset.filter(timestamp__gte=start, timestamp__lt=end)
+
+
+def account_etag(request, *args, **kwargs):
+    """ETag of the customer's own pages; None while a flash message waits to be shown on one."""
+    if len(messages.get_messages(request)):
+        return None
+    account = request.user.account
+    return f'W/"{account.pk}-{account.version}"'
+
+
+# Pages that only change with the account: unchanged ones answer 304 from the account row alone.
+account_page = [
+    cache_control(private=True, no_cache=True),
+    condition(etag_func=account_etag),
+]
+
+
+@method_decorator(gzip_page, name='dispatch')
+@method_decorator(account_page, name='get')
+class TransactionReportView(LoginRequiredMixin, DateRangeMixin, ListView):
     template_name = 'transactions/transaction_report.html'
+    query_budget = 6
+    use_replica = True
     model = Transaction
     balance = 0 
+    summary = None
     
     def get_queryset(self):
         queryset = super().get_queryset().filter(
             account=self.request.user.account
         )
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
+        account = self.request.user.account
+        start_date, end_date = self.get_date_range()
         
-        if start_date_str and end_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            
-            queryset = queryset.filter(timestamp__date__gte=start_date, timestamp__date__lte=end_date)
-            self.balance = Transaction.objects.filter(
-                timestamp__date__gte=start_date, timestamp__date__lte=end_date
-            ).aggregate(Sum('amount'))['amount__sum']
+        if start_date and end_date:
+            queryset = self.filter_date_range(queryset, start_date, end_date)
+            self.summary = summarize(account, start_date, end_date)
+            self.balance = self.summary['closing_balance']
         else:
-            self.balance = self.request.user.account.balance
-       
-        return queryset.distinct() 
+            self.balance = account.balance
+
+        page = keyset_page
+        start, end = self.get_bounds(start_date, end_date)
+        if archive.reaches(account, start):
+            page = partial(
+                merged_keyset_page,
+                older_rows=lambda after, before: archive.rows(account, start, end, after=after, before=before),
+            )
+        rows, self.previous_cursor, self.next_cursor = page(
+            queryset,
+            page_size=self.get_page_size(),
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        return rows
+
+    def get_page_size(self):
+        page_size = settings.TRANSACTION_REPORT_PAGE_SIZE
+        try:
+            page_size = int(self.request.GET.get('page_size', page_size))
+        except ValueError:
+            pass
+        return max(1, min(page_size, settings.TRANSACTION_REPORT_MAX_PAGE_SIZE))
+
+    def get_page_query(self, key, cursor):
+        if not cursor:
+            return None
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[key] = cursor
+        return query.urlencode()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update({
-            'account': self.request.user.account
+            'account': self.request.user.account,
+            'summary': self.summary,
+            'previous_page_query': self.get_page_query('before', self.previous_cursor),
+            'next_page_query': self.get_page_query('after', self.next_cursor),
         })
 
         return context
+
+
+class TransactionExportView(LoginRequiredMixin, DateRangeMixin, View):
+    use_replica = True
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('Unsupported export format')
+        content_type, extension, render_rows = EXPORT_FORMATS[export_format]
+
+        account = request.user.account
+        queryset = Transaction.objects.filter(account=account)
+        try:
+            start_date, end_date = self.get_date_range()
+        except BadRequest as exc:
+            return HttpResponseBadRequest(str(exc))
+        if start_date and end_date:
+            queryset = self.filter_date_range(queryset, start_date, end_date)
+        start, end = self.get_bounds(start_date, end_date)
+        archived = archive.rows(account, start, end) if archive.reaches(account, start) else ()
+
+        # Rows are read after the middleware has returned, so fix the database while routing applies.
+        response = StreamingHttpResponse(render_rows(queryset.using(queryset.db), archived), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="statement-{request.user.account.account_no}.{extension}"'
+        return response
     
         
 class PayLoanView(LoginRequiredMixin, View):
+    query_budget = 15
+
     def get(self, request, loan_id):
-        if Bank.objects.filter(is_bankrupt=True).exists():
+        if is_bankrupt(self.request.user.account.bank_id):
             messages.error(
                 self.request,
                 "The Bank is bankrupt. No transactions are allowed at the moment."
             )
             return redirect('transaction_report')
-        loan = get_object_or_404(Transaction, id=loan_id)
-        print(loan)
-        if loan.loan_approve:
-            user_account = loan.account
-              
-            if loan.amount < user_account.balance:
-                user_account.balance -= loan.amount
-                loan.balance_after_transaction = user_account.balance
-                user_account.save()
-                loan.loan_approved = True
-                loan.transaction_type = LOAN_PAID
-                loan.save()
-                return redirect('transactions:loan_list')
-            else:
-                messages.error(
+        loan = get_object_or_404(Transaction, id=loan_id, account=request.user.account)
+        try:
+            repay_loan(loan)
+        except InsufficientFunds:
+            messages.error(
             self.request,
             f'Loan amount is greater than available balance'
         )
+        except LoanNotPayable:
+            messages.error(
+            self.request,
+            f'This loan is not approved or has already been paid'
+        )
 
         return redirect('loan_list')
 
 
+@method_decorator(gzip_page, name='dispatch')
+@method_decorator(account_page, name='get')
 class LoanListView(LoginRequiredMixin,ListView):
     model = Transaction
     template_name = 'transactions/loan_request.html'
     context_object_name = 'loans' 
+    query_budget = 4
+    use_replica = True
     
     def get_queryset(self):
         user_account = self.request.user.account
-        queryset = Transaction.objects.filter(account=user_account,transaction_type=3)
-        print(queryset)
+        queryset = Transaction.objects.filter(account=user_account,transaction_type=LOAN)
         return queryset
     
 
 
-class TransferMoneyView(LoginRequiredMixin, CreateView):
+class TransferMoneyView(LoginRequiredMixin, IdempotentPostMixin, CreateView):
     template_name = 'transactions/transfer_form.html' 
     form_class = TransferForm
     model = Transaction
     title = 'Transfer Money'
+    query_budget = 26
     success_url = reverse_lazy('transaction_report')
 
     def get_initial(self):
@@ -263,36 +364,107 @@ class TransferMoneyView(LoginRequiredMixin, CreateView):
         return kwargs
 
     def form_valid(self, form):
-        if Bank.objects.filter(is_bankrupt=True).exists():
+        if is_bankrupt(self.request.user.account.bank_id):
             messages.error(
                 self.request,
                 "The Bank is bankrupt. No transactions are allowed at the moment."
             )
             return redirect('transaction_report')
         amount = form.cleaned_data.get('amount')
-        recipient_account_no =form.cleaned_data.get('recipient_account')
+        recipient_account = form.recipient
 
-        account = self.request.user.account
-        if amount > self.request.user.account.balance:
-            messages.error(
-                self.request,
-                f'Insufficiant Balance to Transfer, Please Deposite First'
-            )
-            reverse_lazy('deposit')
-        else:
-            account.balance -= amount
-            account.save(update_fields=['balance'])
-
-            recipient_account = UserBankAccount.objects.get(account_no=recipient_account_no)
-            recipient_account.balance += amount
-            recipient_account.save()
+        try:
+            with transaction.atomic():
+                self.object = transfer(self.request.user.account, recipient_account, amount)
+                send__money_transfer_email(self.request.user,recipient_account, amount, "Transfer Money Message", "transactions/sender_transfermoney_email.html")
+                send__money_transfer_email(recipient_account.user, self.request.user, amount, "Transfer Money Message", "transactions/receiver_transfermoney_email.html")
+        except InsufficientFunds:
+            form.add_error('amount', 'Insufficient funds for the transfer!')
+            return self.form_invalid(form)
 
-            messages.success(
-                self.request,
-                f'Successfully transferred {"{:,.2f}".format(float(amount))}$ to the account {recipient_account}'
-            )
-            send__money_transfer_email(self.request.user,recipient_account, amount, "Transfer Money Message", "transactions/sender_transfermoney_email.html")
-            send__money_transfer_email(recipient_account.user, self.request.user, amount, "Transfer Money Message", "transactions/receiver_transfermoney_email.html")
-            
+        messages.success(
+            self.request,
+            f'Successfully transferred {"{:,.2f}".format(float(amount))}$ to the account {recipient_account}'
+        )
 
-        return super().form_valid(form)
\ No newline at end of file
+        return redirect(self.get_success_url())
+
+
+def read_batch_lines(transfers):
+    """``[{"account_no": ..., "amount": ...}]`` as ``[(account_no, Decimal)]``; bad lines raise ``BatchRejected``."""
+    limit = getattr(settings, 'BATCH_TRANSFER_MAX_LINES', 10000)
+    if not isinstance(transfers, list):
+        raise BatchRejected([(None, '"transfers" must be a list.')])
+    if len(transfers) > limit:
+        raise BatchRejected([(None, f'A batch takes at most {limit} transfers.')])
+    lines, errors = [], []
+    for line, item in enumerate(transfers):
+        try:
+            account_no = int(item['account_no'])
+            amount = Decimal(str(item['amount']))
+        except (TypeError, KeyError, ValueError, InvalidOperation):
+            errors.append((line, 'Each transfer needs an account_no and an amount.'))
+            continue
+        if not amount.is_finite() or amount.as_tuple().exponent < -2 or amount >= 10 ** 10:
+            errors.append((line, 'The amount must be a number with at most two decimal places.'))
+            continue
+        lines.append((account_no, amount))
+    if errors:
+        raise BatchRejected(errors)
+    return lines
+
+
+class BatchTransferView(LoginRequiredMixin, View):
+    """Payroll: pay many accounts in one request.
+
+    The body is ``{"transfers": [{"account_no": 100002, "amount": "1500.00"}, ...]}``.
+    Either every line is paid or none is, and a rejected batch answers 422
+    with the errors of each line. Retries carrying the same Idempotency-Key
+    replay the first successful answer.
+    """
+    query_budget = 22
+
+    def post(self, request):
+        key = request_key(request)
+        if key is None:
+            return self.pay(request)
+        try:
+            return run_once(request, key, lambda: self.pay(request), fingerprint_of=json_fingerprint)
+        except KeyReused:
+            return JsonResponse({'errors': [
+                {'line': None, 'error': f'This {HEADER} was already used for a different request.'},
+            ]}, status=422)
+
+    def pay(self, request):
+        if is_bankrupt(request.user.account.bank_id):
+            return JsonResponse({'errors': [
+                {'line': None, 'error': 'The Bank is bankrupt. No transactions are allowed at the moment.'},
+            ]}, status=403)
+        try:
+            transfers = json.loads(request.body).get('transfers')
+        except (ValueError, AttributeError):
+            return JsonResponse({'errors': [{'line': None, 'error': 'Expected a JSON object.'}]}, status=400)
+
+        sender = request.user.account
+        try:
+            with transaction.atomic():
+                received = batch_transfer(sender, read_batch_lines(transfers))
+                total = sum(txn.amount for txn in received)
+                queue_emails([
+                    (request.user.email, 'Transfer Money Message', 'transactions/batch_transfer_email.html',
+                     {'user': request.user, 'total': total, 'count': len(received)}),
+                ] + [
+                    (txn.account.user.email, 'Transfer Money Message', 'transactions/receiver_transfermoney_email.html',
+                     {'user': txn.account.user, 'amount': txn.amount, 'recipient': request.user})
+                    for txn in received
+                ])
+        except BatchRejected as rejected:
+            return JsonResponse({'errors': [
+                {'line': line, 'error': message} for line, message in rejected.errors
+            ]}, status=422)
+
+        return posted(JsonResponse({
+            'transfers': len(received),
+            'total': str(total),
+            'balance': str(sender.balance),
+        }))